@@ -2,6 +2,7 @@ import os
 import pandas as pd
 from collections import Counter
 import re
+from urllib.parse import unquote
 
 #compareable files folder path
 COMPAREABLE_FILES_FOLDER = os.path.join(os.path.dirname(__file__), 'output')
@@ -15,8 +16,35 @@ try:
 except ImportError:
     STOPWORDS = set()
 
+def load_parquet_reviews(path, start_date=None, end_date=None):
+    # Parquet output (OUTPUT_FORMATS in config.yml) is partitioned by review month,
+    # the months outside of the date range are not read at all
+    filters = []
+    if start_date:
+        filters.append(('review_month', '>=', pd.to_datetime(start_date).strftime('%Y-%m')))
+    if end_date:
+        filters.append(('review_month', '<=', pd.to_datetime(end_date).strftime('%Y-%m')))
+    return pd.read_parquet(path, filters=filters or None)
+
+def load_sqlite_reviews(sqlite_path, hotel_name, start_date=None, end_date=None):
+    # SQLite output (OUTPUT_FORMATS in config.yml): the date range is an indexed query
+    from core.store import ReviewStore
+    # read-only, a wrong path is reported instead of creating an empty database
+    store = ReviewStore(sqlite_path, read_only=True)
+    try:
+        rows = store.query(hotel_name=hotel_name, start_date=start_date, end_date=end_date)
+    finally:
+        store.close()
+    df = pd.DataFrame(rows)
+    if not df.empty:
+        df['review_post_date'] = pd.to_datetime(df['review_post_date'])
+    return df
+
 def load_reviews(csv_path, date_col='review_post_date', start_date=None, end_date=None):
-    df = pd.read_csv(csv_path)
+    if os.path.isdir(csv_path) or csv_path.endswith('.parquet'):
+        df = load_parquet_reviews(csv_path, start_date, end_date)
+    else:
+        df = pd.read_csv(csv_path)
     if date_col in df.columns:
         df[date_col] = pd.to_datetime(df[date_col], errors='coerce')
         if start_date:
@@ -42,13 +70,21 @@ def extract_keywords(texts, top_n=10):
         words.extend(tokens)
     return [w for w, _ in Counter(words).most_common(top_n)]
 
-def compare_properties(csv_files, start_date, end_date):
+def compare_properties(csv_files, start_date, end_date, sqlite_path=None):
+    # with sqlite_path, csv_files are the names of the hotels in the sqlite database
     summary = []
     for csv_path in csv_files:
-        # If the user provides e.g. 'property1/reviews_most_relevant.csv', always prepend the output folder
-        full_csv_path = os.path.join('output', csv_path)
-        property_name = os.path.basename(os.path.dirname(full_csv_path))
-        df = load_reviews(full_csv_path, start_date=start_date, end_date=end_date)
+        if sqlite_path:
+            property_name = csv_path
+            df = load_sqlite_reviews(sqlite_path, csv_path, start_date, end_date)
+        else:
+            # If the user provides e.g. 'property1/reviews_most_relevant.csv', always prepend the output folder
+            full_csv_path = os.path.join('output', csv_path)
+            property_name = os.path.basename(os.path.dirname(full_csv_path))
+            if os.path.basename(full_csv_path).startswith('hotel_name='):
+                # a hotel partition of the parquet output e.g. 'reviews_parquet/hotel_name=property1'
+                property_name = unquote(os.path.basename(full_csv_path).split('=', 1)[1])
+            df = load_reviews(full_csv_path, start_date=start_date, end_date=end_date)
         if df.empty:
             print(f"No reviews for {property_name} in selected date range.")
             continue
@@ -74,13 +110,17 @@ def compare_properties(csv_files, start_date, end_date):
 def main():
     import argparse
     parser = argparse.ArgumentParser(description='Compare multiple properties based on scraped reviews.')
-    parser.add_argument('--csvs', nargs='+', required=True, help='Paths to review CSV files (one per property)')
+    parser.add_argument('--csvs', nargs='+', required=True, help='Paths to review CSV files or parquet hotel partitions e.g. reviews_parquet/hotel_name=<hotel> (one per property)')
     parser.add_argument('--start', type=str, required=True, help='Start date (YYYY-MM-DD)')
     parser.add_argument('--end', type=str, required=True, help='End date (YYYY-MM-DD)')
+    parser.add_argument('--sqlite', type=str, default=None, help='SQLite database written by the scraper. --csvs are then hotel names')
     parser.add_argument('--out', type=str, default='comparison_summary.csv', help='Output CSV file for summary')
     args = parser.parse_args()
 
-    df = compare_properties(args.csvs, args.start, args.end)
+    try:
+        df = compare_properties(args.csvs, args.start, args.end, args.sqlite)
+    except FileNotFoundError as e:
+        parser.exit(1, f"{e}\n")
     print(df.to_string(index=False))
     df.to_csv(args.out, index=False)
     print(f"\nSummary saved to {args.out}")
@@ -0,0 +1,214 @@
+import concurrent.futures
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Iterator, List, Tuple
+
+from core.parse import ParsedPage, parse_reviews_page, rows_to_reviews
+
+logger = logging.getLogger(__name__)
+
+# archive layout:
+#   MAGIC, metadata length (uint32), metadata json,
+#   then one frame per page: idx (int64), compressed length (uint32), zlib data
+MAGIC = b"BKRA\x01"
+_META_HEADER = struct.Struct(">I")
+_FRAME_HEADER = struct.Struct(">qI")
+
+
+class PageArchive:
+    """Append-only archive of the raw html of the reviews pages of a job.
+
+    Every page is compressed with zlib and appended as a frame, so a crash only loses
+    the frame being written. Appending to an existing archive keeps its metadata, a
+    frame torn by a crash is truncated first.
+
+    Args:
+        path: archive file
+        metadata: job details stored in the archive header e.g. hotel_name, sort_by
+        level: zlib compression level
+    """
+
+    def __init__(self, path: str, metadata: dict, level: int = 6) -> None:
+        self.path = path
+        self.level = level
+        self.pages = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+        self._lock = threading.Lock()
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not new_file:
+            # frames appended after a torn frame could not be read back
+            length = _complete_length(path)
+            if length < os.path.getsize(path):
+                logger.warning(f"Truncating the incomplete frame at the end of {path}")
+                os.truncate(path, length)
+                new_file = length == 0
+        self._file = open(path, "ab")
+        if new_file:
+            meta = json.dumps(metadata).encode("utf-8")
+            self._file.write(MAGIC + _META_HEADER.pack(len(meta)) + meta)
+            self._file.flush()
+
+    def append(self, idx: int, content: bytes):
+        """Adds the raw html of one reviews page
+
+        Args:
+            idx: orginal offset_param value / id of the reviews page
+            content: raw html of the page
+        """
+        data = zlib.compress(content, self.level)
+        with self._lock:
+            self._file.write(_FRAME_HEADER.pack(idx, len(data)) + data)
+            self._file.flush()
+            self.pages += 1
+            self.raw_bytes += len(content)
+            self.stored_bytes += len(data)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_metadata(path: str) -> dict:
+    """Returns the metadata stored in the header of an archive
+
+    Raises:
+        ValueError: the file is not a page archive
+    """
+    with open(path, "rb") as file:
+        return _read_header(file)
+
+
+def _read_header(file) -> dict:
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"Not a page archive: {file.name}")
+    (length,) = _META_HEADER.unpack(file.read(_META_HEADER.size))
+    return json.loads(file.read(length).decode("utf-8"))
+
+
+def _complete_length(path: str) -> int:
+    """Length of the archive up to the end of its last complete frame, 0 when the
+    header itself is incomplete
+
+    Raises:
+        ValueError: the file is not a page archive
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as file:
+        magic = file.read(len(MAGIC))
+        if magic != MAGIC:
+            if len(magic) < len(MAGIC) and MAGIC.startswith(magic):
+                return 0
+            raise ValueError(f"Not a page archive: {path}")
+        meta_header = file.read(_META_HEADER.size)
+        if len(meta_header) < _META_HEADER.size:
+            return 0
+        (meta_length,) = _META_HEADER.unpack(meta_header)
+
+        end = len(MAGIC) + _META_HEADER.size + meta_length
+        if end > size:
+            return 0
+        file.seek(end)
+        while end + _FRAME_HEADER.size <= size:
+            _, length = _FRAME_HEADER.unpack(file.read(_FRAME_HEADER.size))
+            if end + _FRAME_HEADER.size + length > size:
+                break
+            end += _FRAME_HEADER.size + length
+            file.seek(end)
+        return end
+
+
+def iter_frames(path: str) -> Iterator[Tuple[int, bytes]]:
+    """Yields (idx, compressed html) of every page in the archive, in append order.
+    A truncated last frame, left by a crash, is skipped.
+    """
+    with open(path, "rb") as file:
+        _read_header(file)
+        while True:
+            header = file.read(_FRAME_HEADER.size)
+            if not header:
+                return
+            if len(header) < _FRAME_HEADER.size:
+                logger.warning(f"Truncated frame at the end of {path}")
+                return
+
+            idx, length = _FRAME_HEADER.unpack(header)
+            data = file.read(length)
+            if len(data) < length:
+                logger.warning(f"Truncated frame at the end of {path}")
+                return
+
+            yield idx, data
+
+
+def iter_pages(path: str) -> Iterator[Tuple[int, bytes]]:
+    """Yields (idx, raw html) of every page in the archive, in append order"""
+    for idx, data in iter_frames(path):
+        yield idx, zlib.decompress(data)
+
+
+def _parse_frame(data: bytes, idx: int, hotel_name: str, backend: str) -> ParsedPage:
+    """Decompresses and parses one frame, runs in the parse worker processes"""
+    return parse_reviews_page(zlib.decompress(data), idx, hotel_name, backend)
+
+
+def reparse_archive(
+    path: str, backend: str = "html.parser", workers: int = None
+) -> List[dict]:
+    """Parses all the pages of an archive again, without any request.
+
+    The frames are decompressed and parsed by a pool of processes, at most a few
+    frames per worker are held in memory. When a page was archived more than once,
+    e.g. by a job which was run again, the last copy is used.
+
+    Args:
+        path: archive file
+        backend: name of the parser backend, see core.parser_backends
+        workers: number of parse processes, all the cores by default
+
+    Returns:
+        list of all the reviews, ordered by page
+    """
+    _start = time.time()
+    hotel_name = read_metadata(path).get("hotel_name", "")
+    workers = workers or os.cpu_count()
+
+    parsed_pages = {}  # idx -> (frame number, ParsedPage)
+
+    def collect(futures):
+        for future in futures:
+            frame, parsed = in_flight.pop(future), future.result()
+            if frame >= parsed_pages.get(parsed.idx, (-1, None))[0]:
+                parsed_pages[parsed.idx] = (frame, parsed)
+
+    n_frames = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = {}  # future -> frame number
+        for idx, data in iter_frames(path):
+            future = executor.submit(_parse_frame, data, idx, hotel_name, backend)
+            in_flight[future] = n_frames
+            n_frames += 1
+
+            if len(in_flight) >= 4 * workers:
+                done, _ = concurrent.futures.wait(
+                    in_flight, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                collect(done)
+
+        collect(list(in_flight))
+
+    reviews = []
+    for idx in sorted(parsed_pages):
+        reviews.extend(rows_to_reviews(parsed_pages[idx][1].rows))
+
+    logger.info(
+        f"Re-parsed {len(parsed_pages)} pages ({n_frames} frames), {len(reviews)} reviews "
+        f"with {workers} processes in {time.time() - _start:.1f} seconds"
+    )
+    return reviews
@@ -0,0 +1,261 @@
+import concurrent.futures
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from core.metrics import Metrics, open_exporter
+from core.rate_limiter import TokenBucket
+from core.retry import AimdController
+from core.scrape import (
+    PROCESS_POOL_SIZE,
+    Scrape,
+    build_rate_controller,
+    build_transport,
+    load_config,
+    setup_logger,
+)
+from core.url_parser import parse_booking_url
+
+
+def read_urls_file(path: str) -> List[str]:
+    """Reads the Booking.com urls of a batch file, one url per line. Blank lines and
+    lines starting with "#" are ignored
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        lines = [line.strip() for line in file]
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+class BatchScraper:
+    """Scrapes the reviews of many hotels through one shared fetch/parse pipeline.
+
+    Up to BATCH_CONCURRENCY hotels are scraped at the same time, so the pagination
+    probe and the last pages of a hotel overlap with the pages of the other hotels
+    instead of leaving the pipeline idle. All the hotels share one pooled keep-alive
+    transport, one pool of parse processes and one token bucket, which enforces
+    REQUESTS_PER_SECOND over the whole batch. With ADAPTIVE_RATE, the throttling of any
+    hotel lowers the rate of the whole batch.
+
+    The progress of every hotel is logged and written to <OUTPUT_DIR>/batch_<job_id>.json
+    The hotels record their metrics in one registry, self.metrics, exported with
+    METRICS_FILE and METRICS_PORT. Its summary is saved to batch_<job_id>_metrics.json
+
+    Args:
+        urls: Booking.com hotel urls, see core.url_parser.parse_booking_url
+        input: input parameters shared by all the hotels (sort_by, n_rows, ...), see
+            core.data_models.Input. hotel_name and country are taken from the urls
+        save_data_to_disk: save the reviews of every hotel in the output directory
+        logger: logger to use instead of the default one
+        is_gui: whether the scraper is run from the GUI
+        on_hotel_done: optional callback, called with the progress dict of every hotel
+            once it is done or failed
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        input: dict = None,
+        save_data_to_disk: bool = True,
+        logger: logging.Logger = None,
+        is_gui: bool = False,
+        on_hotel_done: Callable[[dict], None] = None,
+    ) -> None:
+        if "job_id" not in os.environ:
+            os.environ["job_id"] = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+
+        self.logger = logger or setup_logger()
+        self.input = dict(input or {})
+        self.save_data_to_disk = save_data_to_disk
+        self.is_gui = is_gui
+        self.on_hotel_done = on_hotel_done
+
+        self._config = load_config()
+        self._lock = threading.Lock()
+        self._scrapers = {}  # position in self.hotels -> Scrape of the running hotels
+        self._finished = threading.Event()
+        self.progress_path = os.path.join(
+            self._config.OUTPUT_DIR, f"batch_{os.getenv('job_id')}.json"
+        )
+        self.metrics = Metrics()
+
+        # progress of every hotel, in the order of the urls
+        self.hotels = []
+        for url in urls:
+            hotel = {
+                "url": url,
+                "hotel_name": None,
+                "country": None,
+                "status": "pending",
+                "pages": 0,
+                "pages_done": 0,
+                "reviews": 0,
+                "seconds": None,
+                "error": None,
+            }
+            try:
+                hotel["hotel_name"], hotel["country"] = parse_booking_url(url)
+            except ValueError as ex:
+                hotel["status"] = "failed"
+                hotel["error"] = str(ex)
+                self.logger.error(f"Skipping url {url}: {ex}")
+            self.hotels.append(hotel)
+
+    def _write_progress(self):
+        with self._lock:
+            data = json.dumps(
+                {"job_id": os.getenv("job_id"), "hotels": self.hotels}, indent=2
+            )
+
+        os.makedirs(os.path.dirname(self.progress_path) or ".", exist_ok=True)
+        tmp_path = f"{self.progress_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write(data)
+        os.replace(tmp_path, self.progress_path)
+
+    def _progress_thread_start(self):
+        """Logs the progress of the batch and of the running hotels every few seconds"""
+        while not self._finished.wait(5):
+            with self._lock:
+                for i, scraper in self._scrapers.items():
+                    self.hotels[i]["pages"] = scraper.n_pages
+                    self.hotels[i]["pages_done"] = scraper.pages_done
+                counts = {
+                    status: sum(hotel["status"] == status for hotel in self.hotels)
+                    for status in ("done", "running", "failed")
+                }
+                running = ", ".join(
+                    f"{self.hotels[i]['hotel_name']} {self.hotels[i]['pages_done']}/{self.hotels[i]['pages']}"
+                    for i in self._scrapers
+                )
+
+            self.logger.info(
+                f"Batch: {counts['done']}/{len(self.hotels)} hotels done, "
+                f"{counts['failed']} failed, running: {running or '-'}"
+            )
+            self._write_progress()
+
+    def _scrape_hotel(
+        self,
+        i: int,
+        transport,
+        parse_pool: concurrent.futures.ProcessPoolExecutor,
+        rate_limiter: TokenBucket,
+        rate_controller: Optional[AimdController],
+    ):
+        hotel = self.hotels[i]
+        _start = time.time()
+        with self._lock:
+            hotel["status"] = "running"
+
+        try:
+            scraper = Scrape(
+                {
+                    **self.input,
+                    "hotel_name": hotel["hotel_name"],
+                    "country": hotel["country"],
+                },
+                save_data_to_disk=self.save_data_to_disk,
+                logger=self.logger,
+                is_gui=self.is_gui,
+                keep_results=False,
+                transport=transport,
+                parse_pool=parse_pool,
+                rate_limiter=rate_limiter,
+                rate_controller=rate_controller,
+                metrics=self.metrics,
+            )
+            with self._lock:
+                self._scrapers[i] = scraper
+
+            scraper.run()
+            with self._lock:
+                hotel["status"] = "done"
+                hotel["pages"] = scraper.n_pages
+                hotel["pages_done"] = scraper.pages_done
+                hotel["reviews"] = scraper.n_reviews
+
+        except Exception as ex:
+            self.logger.error(f"Failed to scrape {hotel['url']}: {ex}")
+            with self._lock:
+                hotel["status"] = "failed"
+                hotel["error"] = str(ex)
+
+        finally:
+            with self._lock:
+                self._scrapers.pop(i, None)
+                hotel["seconds"] = round(time.time() - _start, 1)
+            self._write_progress()
+
+        if self.on_hotel_done is not None:
+            self.on_hotel_done(hotel)
+
+    def run(self) -> List[dict]:
+        """Scrapes all the hotels
+
+        Returns:
+            progress dict of every hotel: url, hotel_name, country, status ("done" or
+            "failed"), pages, pages_done, reviews, seconds and error
+        """
+        _start = time.time()
+        pending = [i for i, hotel in enumerate(self.hotels) if hotel["status"] == "pending"]
+        self.logger.info(
+            f"Batch of {len(self.hotels)} hotels: {len(pending)} to scrape, "
+            f"{self._config.BATCH_CONCURRENCY} at a time, "
+            f"{self._config.REQUESTS_PER_SECOND} req/s over the whole batch"
+        )
+
+        rate_limiter = TokenBucket(
+            self._config.REQUESTS_PER_SECOND, self._config.RATE_LIMIT_BURST
+        )
+        transport = build_transport(self._config, rate_limiter)
+        rate_controller = build_rate_controller(self._config, rate_limiter)
+        parse_pool = concurrent.futures.ProcessPoolExecutor(max_workers=PROCESS_POOL_SIZE)
+        exporter = open_exporter(self._config, self.metrics)
+        progress_thread = threading.Thread(target=self._progress_thread_start, daemon=True)
+        progress_thread.start()
+
+        try:
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self._config.BATCH_CONCURRENCY
+            ) as executor:
+                for i in pending:
+                    executor.submit(
+                        self._scrape_hotel,
+                        i,
+                        transport,
+                        parse_pool,
+                        rate_limiter,
+                        rate_controller,
+                    )
+
+        finally:
+            self._finished.set()
+            progress_thread.join()
+            transport.log_stats(self.logger)
+            if rate_controller is not None:
+                rate_controller.log_stats(self.logger)
+            if transport.cache is not None:
+                transport.cache.log_stats(self.logger)
+            transport.close()
+            parse_pool.shutdown()
+            self._write_progress()
+            self.metrics.log_summary(self.logger)
+            self.metrics.write_summary(
+                os.path.join(
+                    self._config.OUTPUT_DIR, f"batch_{os.getenv('job_id')}_metrics.json"
+                )
+            )
+            if exporter is not None:
+                exporter.close()
+
+        n_done = sum(hotel["status"] == "done" for hotel in self.hotels)
+        self.logger.info(
+            f"Batch complete: {n_done}/{len(self.hotels)} hotels, "
+            f"{sum(hotel['reviews'] for hotel in self.hotels)} reviews "
+            f"in {time.time() - _start:.1f} seconds. Progress saved to {self.progress_path}"
+        )
+        return self.hotels
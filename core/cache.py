@@ -0,0 +1,245 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Optional, Tuple
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# response headers kept with the cached body
+_KEPT_HEADERS = ("content-type", "etag", "last-modified")
+
+
+class ResponseCache:
+    """On-disk cache of successful GET responses, keyed on the prepared url.
+
+    Entries younger than `ttl` seconds are served without touching the network.
+    Older entries are revalidated with If-None-Match/If-Modified-Since when the
+    server sent an ETag or Last-Modified header, a 304 answer serves the cached body.
+    When the cache grows over `max_bytes` the least recently used entries are evicted.
+
+    Args:
+        cache_dir: directory of the cache, shared between runs
+        ttl: seconds during which an entry is served without revalidation
+        max_bytes: maximum total size of the cached bodies
+    """
+
+    def __init__(self, cache_dir: str, ttl: int = 3600, max_bytes: int = 2**30) -> None:
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+        self._lock = threading.Lock()
+        self._index = {}  # key -> [size, last access time]
+        self._total_bytes = 0
+        self._load_index()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        dir_path = os.path.join(self.cache_dir, key[:2])
+        return os.path.join(dir_path, f"{key}.json"), os.path.join(dir_path, f"{key}.body")
+
+    def _load_index(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+
+        for dir_path, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".body"):
+                    continue
+                path = os.path.join(dir_path, name)
+                stat = os.stat(path)
+                # the mtime of a body is its last access time, see serve()
+                self._index[name[: -len(".body")]] = [stat.st_size, stat.st_mtime]
+                self._total_bytes += stat.st_size
+
+        # max_bytes may have been lowered since the last run
+        self._remove(self._evict())
+
+    def lookup(self, url: str) -> Optional[dict]:
+        """Returns the cache entry of the url or None
+
+        Returns:
+            {"key", "url", "headers", "stored_at", "fresh"}
+        """
+        key = self.key(url)
+        meta_path, body_path = self._paths(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        if not os.path.exists(body_path):
+            return None
+
+        meta["key"] = key
+        meta["fresh"] = time.time() - meta["stored_at"] < self.ttl
+        return meta
+
+    @staticmethod
+    def conditional_headers(entry: dict) -> dict:
+        """Headers revalidating a stale entry, empty if the server sent no validators"""
+        headers = {}
+        if entry["headers"].get("etag"):
+            headers["If-None-Match"] = entry["headers"]["etag"]
+        if entry["headers"].get("last-modified"):
+            headers["If-Modified-Since"] = entry["headers"]["last-modified"]
+        return headers
+
+    def serve(self, entry: dict, revalidated: bool = False) -> requests.Response:
+        """Builds a response from a cache entry
+
+        Args:
+            entry: returned by lookup
+            revalidated: True when the server answered 304 to a conditional request
+        """
+        _, body_path = self._paths(entry["key"])
+        with open(body_path, "rb") as file:
+            body = file.read()
+        os.utime(body_path)
+
+        with self._lock:
+            if revalidated:
+                self.revalidated += 1
+            else:
+                self.hits += 1
+            self.bytes_saved += len(body)
+            if entry["key"] in self._index:
+                self._index[entry["key"]][1] = time.time()
+
+        if revalidated:
+            # a 304 confirms the entry, it is fresh again for another ttl
+            entry = {k: v for k, v in entry.items() if k not in ("key", "fresh")}
+            entry["stored_at"] = time.time()
+            self._write_meta(self.key(entry["url"]), entry)
+
+        response = requests.Response()
+        response.status_code = 200
+        response._content = body
+        response._content_consumed = True
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response.url = entry["url"]
+        response.encoding = "utf-8"
+        response.from_cache = True
+        return response
+
+    def _write_meta(self, key: str, meta: dict):
+        meta_path, _ = self._paths(key)
+        tmp_path = f"{meta_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(meta, file)
+        os.replace(tmp_path, meta_path)
+
+    def store(self, url: str, response):
+        """Stores a successful response, other status codes are not cached"""
+        if response.status_code != 200:
+            return
+
+        with self._lock:
+            self.misses += 1
+
+        body = response.content
+        if len(body) > self.max_bytes:
+            return
+
+        key = self.key(url)
+        meta_path, body_path = self._paths(key)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+
+        tmp_path = f"{body_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(body)
+        os.replace(tmp_path, body_path)
+
+        self._write_meta(
+            key,
+            {
+                "url": url,
+                "headers": {
+                    name: response.headers[name]
+                    for name in _KEPT_HEADERS
+                    if name in response.headers
+                },
+                "stored_at": time.time(),
+            },
+        )
+
+        with self._lock:
+            previous = self._index.get(key)
+            if previous:
+                self._total_bytes -= previous[0]
+            self._index[key] = [len(body), time.time()]
+            self._total_bytes += len(body)
+            evicted = self._evict()
+
+        self._remove(evicted)
+
+    def discard(self, url: str):
+        """Removes the entry of a url, e.g. a block page which was served with a 200"""
+        key = self.key(url)
+        with self._lock:
+            size, _ = self._index.pop(key, (0, None))
+            self._total_bytes -= size
+        self._remove([key])
+
+    def _remove(self, keys: list):
+        for key in keys:
+            for path in self._paths(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _evict(self) -> list:
+        """Drops the least recently used entries from the index until the cache fits.
+        Must be called with the lock held, returns the keys to delete from disk.
+        """
+        evicted = []
+        if self._total_bytes <= self.max_bytes:
+            return evicted
+
+        for key, (size, _) in sorted(self._index.items(), key=lambda kv: kv[1][1]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            evicted.append(key)
+            self._total_bytes -= size
+            del self._index[key]
+
+        return evicted
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "bytes_saved": self.bytes_saved,
+            "size_bytes": self._total_bytes,
+        }
+
+    def log_stats(self, logger):
+        """Logs the hit/miss counters"""
+        stats = self.stats()
+        logger.info(
+            f"Response cache: {stats['hits']} hits, {stats['revalidated']} revalidated, "
+            f"{stats['misses']} misses, {stats['bytes_saved'] / 2**20:.1f} MB saved"
+        )
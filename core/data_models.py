@@ -1,6 +1,6 @@
-from typing import Literal, Optional
+from typing import List, Literal, Optional
 
-from pydantic import BaseModel, Field, PositiveInt
+from pydantic import BaseModel, Field, PositiveFloat, PositiveInt
 
 
 class StopCritera(BaseModel):
@@ -275,6 +275,7 @@ class Input(BaseModel):
     n_rows: Optional[int] = -1
     stop_critera: Optional[StopCritera] = None
     download_photos: Optional[bool] = True
+    incremental: Optional[bool] = False
 
 
 sort_by_map = {
@@ -291,6 +292,53 @@ class Config(BaseModel):
     HOTEL_REVIEWS_PAGE: str
     MAX_RETIES: Optional[int] = 3
     OUTPUT_DIR: Optional[str] = None
+    FETCH_ENGINE: Optional[Literal["threads", "asyncio"]] = "threads"
+    MAX_CONCURRENCY: Optional[PositiveInt] = 10
+    RATE_LIMIT_BURST: Optional[PositiveInt] = 1
+    PIPELINE: Optional[bool] = False
+    PIPELINE_QUEUE_SIZE: Optional[PositiveInt] = 50
+    POOL_CONNECTIONS: Optional[PositiveInt] = 10
+    POOL_MAXSIZE: Optional[PositiveInt] = 20
+    HTTP2: Optional[bool] = False
+    STATE_DIR: Optional[str] = "state"
+    MAX_PAGE_SIZE: Optional[PositiveInt] = 10
+    CACHE_DIR: Optional[str] = None
+    CACHE_TTL: Optional[int] = Field(default=3600, ge=0)
+    CACHE_MAX_BYTES: Optional[PositiveInt] = 2**30
+    ARCHIVE_PAGES: Optional[bool] = False
+    CSV_BATCH_ROWS: Optional[PositiveInt] = 500
+    OUTPUT_FORMATS: Optional[List[Literal["csv", "parquet", "sqlite"]]] = Field(
+        default=["csv"], min_length=1
+    )
+    PARQUET_BATCH_ROWS: Optional[PositiveInt] = 10000
+    SQLITE_PATH: Optional[str] = None
+    SQLITE_BATCH_ROWS: Optional[PositiveInt] = 1000
+    PHOTO_REQUESTS_PER_SECOND: Optional[PositiveInt] = 10
+    PHOTO_CONCURRENCY: Optional[PositiveInt] = 8
+    PHOTO_BYTE_BUDGET: Optional[int] = Field(default=0, ge=0)
+    PHOTO_STORE_DIR: Optional[str] = None
+    BATCH_CONCURRENCY: Optional[PositiveInt] = 4
+    WORK_QUEUE_PATH: Optional[str] = None
+    QUEUE_LEASE_SECONDS: Optional[PositiveInt] = 300
+    QUEUE_MAX_ATTEMPTS: Optional[PositiveInt] = 3
+    QUEUE_SERVER_HOST: Optional[str] = "127.0.0.1"
+    QUEUE_SERVER_PORT: Optional[PositiveInt] = 8770
+    QUEUE_TOKEN: Optional[str] = None
+    RETRY_BASE_DELAY: Optional[PositiveFloat] = 1.0
+    RETRY_MAX_DELAY: Optional[PositiveFloat] = 60.0
+    ADAPTIVE_RATE: Optional[bool] = True
+    MIN_REQUESTS_PER_SECOND: Optional[PositiveFloat] = 0.5
+    CONNECT_TIMEOUT: Optional[PositiveFloat] = 10.0
+    READ_TIMEOUT: Optional[PositiveFloat] = 30.0
+    HEDGE_REQUESTS: Optional[bool] = False
+    HEDGE_BUDGET: Optional[float] = Field(default=0.05, ge=0, le=1)
+    METRICS_FILE: Optional[str] = None
+    METRICS_PORT: Optional[PositiveInt] = None
+    METRICS_HOST: Optional[str] = "127.0.0.1"
+    PREFETCH_WINDOW: Optional[int] = Field(default=0, ge=0)
+    PARSER_BACKEND: Optional[Literal["html.parser", "lxml", "selectolax"]] = (
+        "html.parser"
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,133 @@
+import re
+from collections import OrderedDict
+from datetime import datetime
+
+from dateutil import parser
+
+DATE_FORMAT = "%m-%d-%Y %H:%M:%S"
+
+_MONTHS = {
+    name: number
+    for number, names in enumerate(
+        [
+            ("january", "jan"),
+            ("february", "feb"),
+            ("march", "mar"),
+            ("april", "apr"),
+            ("may",),
+            ("june", "jun"),
+            ("july", "jul"),
+            ("august", "aug"),
+            ("september", "sep", "sept"),
+            ("october", "oct"),
+            ("november", "nov"),
+            ("december", "dec"),
+        ],
+        1,
+    )
+    for name in names
+}
+
+# "12 March 2024" / "12 Mar 2024"
+_DAY_MONTH_YEAR = re.compile(r"(\d{1,2})\s+([A-Za-z]+)\.?\s+(\d{4})")
+# "March 12, 2024" / "Mar 12 2024"
+_MONTH_DAY_YEAR = re.compile(r"([A-Za-z]+)\.?\s+(\d{1,2}),?\s+(\d{4})")
+# "2024-03-12"
+_ISO = re.compile(r"(\d{4})-(\d{2})-(\d{2})")
+
+
+class ReviewDateParser:
+    """Normalizes the review dates found on booking.com e.g. "12 March 2024".
+
+    The few formats used by booking.com are parsed with fixed patterns, anything
+    else falls back to dateutil. Dates repeat a lot within a hotel, so results are
+    memoized in a bounded LRU cache keyed on the raw string.
+
+    Args:
+        cache_size: maximum number of raw strings kept in the cache
+        output_format: strftime format of the returned dates
+    """
+
+    def __init__(self, cache_size: int = 4096, output_format: str = DATE_FORMAT):
+        self.cache_size = cache_size
+        self.output_format = output_format
+        self._cache = OrderedDict()
+
+        self.hits = 0  # served from the cache
+        self.fast = 0  # parsed by the fixed patterns
+        self.fallbacks = 0  # parsed by dateutil
+
+    def _parse_fast(self, text: str):
+        match = _DAY_MONTH_YEAR.fullmatch(text)
+        if match:
+            day, month, year = match.groups()
+        else:
+            match = _MONTH_DAY_YEAR.fullmatch(text)
+            if match:
+                month, day, year = match.groups()
+            else:
+                match = _ISO.fullmatch(text)
+                if match is None:
+                    return None
+                year, month, day = match.groups()
+                return self._to_date(year, int(month), day)
+
+        month = _MONTHS.get(month.lower())
+        if month is None:
+            return None
+        return self._to_date(year, month, day)
+
+    @staticmethod
+    def _to_date(year: str, month: int, day: str):
+        try:
+            return datetime(int(year), month, int(day))
+        except ValueError:
+            return None
+
+    def parse(self, text: str) -> str:
+        """Returns the date formatted with output_format
+
+        Args:
+            text: date as found in the review e.g. "12 March 2024"
+
+        Raises:
+            dateutil.parser.ParserError: the date could not be parsed by any means
+        """
+        cached = self._cache.get(text)
+        if cached is not None:
+            self._cache.move_to_end(text)
+            self.hits += 1
+            return cached
+
+        date = self._parse_fast(text.strip())
+        if date is not None:
+            self.fast += 1
+        else:
+            date = parser.parse(text)
+            self.fallbacks += 1
+
+        result = date.strftime(self.output_format)
+        self._cache[text] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+        return result
+
+    def counters(self) -> tuple:
+        """(hits, fast, fallbacks)"""
+        return self.hits, self.fast, self.fallbacks
+
+    def stats(self) -> dict:
+        return counters_to_stats(*self.counters())
+
+
+def counters_to_stats(hits: int, fast: int, fallbacks: int) -> dict:
+    """Summary of the counters of one or more ReviewDateParser"""
+    calls = hits + fast + fallbacks
+    return {
+        "dates": calls,
+        "cache_hits": hits,
+        "fast_parsed": fast,
+        "fallbacks": fallbacks,
+        "hit_rate": hits / calls if calls else 0.0,
+    }
@@ -0,0 +1,67 @@
+import asyncio
+import concurrent.futures
+from typing import Any, Callable, Coroutine, List
+
+from core.rate_limiter import TokenBucket
+
+
+def run_coroutine(coro: Coroutine) -> Any:
+    """Runs a coroutine to completion from synchronous code.
+
+    asyncio.run() refuses to start when the current thread already has a running loop
+    (e.g. inside a jupyter notebook), in that case the coroutine is run on a helper thread.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
+async def _fetch_all(
+    fetch_fn: Callable[[dict], Any],
+    ls_urls: List[dict],
+    rate_limiter: TokenBucket,
+    max_concurrency: int,
+) -> List[Any]:
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+
+        async def fetch_one(url_dict: dict):
+            # the semaphore caps the requests in flight, the bucket caps the rate
+            # at which new ones are started
+            async with semaphore:
+                await rate_limiter.acquire_async()
+                return await loop.run_in_executor(executor, fetch_fn, url_dict)
+
+        return await asyncio.gather(*(fetch_one(url_dict) for url_dict in ls_urls))
+
+
+def fetch_async(
+    fetch_fn: Callable[[dict], Any],
+    ls_urls: List[dict],
+    rate_limiter: TokenBucket,
+    max_concurrency: int,
+) -> List[Any]:
+    """Calls `fetch_fn` on every url dict, scheduled from an asyncio event loop.
+
+    Requests are started at the smooth rate enforced by `rate_limiter` and never more
+    than `max_concurrency` of them are in flight, so slow pages no longer pile up.
+    The engine is thread-backed: only the scheduling is asynchronous, `fetch_fn` is
+    blocking (the transport, retries and cache are synchronous) and runs on a thread
+    pool of `max_concurrency` workers, one thread per request in flight.
+
+    Args:
+        fetch_fn: function which takes a url dict and returns the fetched page
+        ls_urls: list containing url and idx/offset_param of each reviews page
+        rate_limiter: token bucket shared by all the requests
+        max_concurrency: maximum number of requests in flight
+
+    Returns:
+        results of `fetch_fn` in the same order as `ls_urls`
+    """
+    return run_coroutine(_fetch_all(fetch_fn, ls_urls, rate_limiter, max_concurrency))
@@ -0,0 +1,120 @@
+import hashlib
+import re
+from array import array
+from typing import Iterable
+
+# fields identifying a review. They do not change when new reviews are posted,
+# unlike the position of the review in the pages. Usernames are first names and the
+# dates are days, the guest details and score tell apart the reviews with no text
+FINGERPRINT_FIELDS = (
+    "hotel_name",
+    "username",
+    "user_country",
+    "review_post_date",
+    "review_title",
+    "rating",
+    "room_view",
+    "stay_duration",
+)
+
+_FINGERPRINT = re.compile(r"[0-9a-f]{16}")
+
+
+def review_fingerprint(review: dict) -> str:
+    """Returns a stable id of a review, derived from its content
+
+    Args:
+        review: review dict as produced by core.parse
+
+    Returns:
+        16 hex characters: hash of FINGERPRINT_FIELDS and a hash of the body
+    """
+    body = "\x1f".join(
+        str(review.get(field) or "")
+        for field in ("review_text_liked", "review_text_disliked")
+    )
+    body_hash = hashlib.sha1(body.encode("utf-8")).hexdigest()
+
+    key = "\x1f".join(str(review.get(field) or "") for field in FINGERPRINT_FIELDS)
+    return hashlib.sha1(f"{key}\x1f{body_hash}".encode("utf-8")).hexdigest()[:16]
+
+
+def is_fingerprint(review_id: str) -> bool:
+    """Whether a saved review_id is a fingerprint, and not a legacy
+    `review_<page offset>_<position>` id
+    """
+    return bool(review_id) and _FINGERPRINT.fullmatch(review_id) is not None
+
+
+def saved_review_fingerprint(review: dict) -> str:
+    """Fingerprint of a review read back from an output file. The review_id of the
+    files written before review ids were fingerprints is recomputed from the content.
+    """
+    review_id = review.get("review_id")
+    if is_fingerprint(review_id):
+        return review_id
+    return review_fingerprint(review)
+
+
+class FingerprintIndex:
+    """Compact set of review fingerprints, to skip the reviews which are already saved.
+
+    The 16 hex characters of a fingerprint are a 64 bit integer, they are stored in a
+    flat open addressing hash table (8 bytes per slot, at most 2/3 full) instead of a
+    set of strings, so the index of a multi-million row file takes tens of megabytes.
+    Lookups and inserts are O(1).
+
+    Args:
+        fingerprints: fingerprints to add
+    """
+
+    def __init__(self, fingerprints: Iterable[str] = ()) -> None:
+        self._slots = array("Q", bytes(8 * 1024))
+        self._mask = len(self._slots) - 1
+        self._size = 0
+
+        for fingerprint in fingerprints:
+            self.add(fingerprint)
+
+    def __len__(self) -> int:
+        return self._size
+
+    @staticmethod
+    def _key(fingerprint: str) -> int:
+        # 0 marks the empty slots
+        return int(fingerprint, 16) or 1
+
+    def _find(self, key: int) -> int:
+        """Returns the slot holding the key, or the empty slot where it belongs"""
+        # the fingerprints are uniformly distributed already, no need to hash them again
+        i = key & self._mask
+        while self._slots[i] and self._slots[i] != key:
+            i = (i + 1) & self._mask
+        return i
+
+    def __contains__(self, fingerprint: str) -> bool:
+        return self._slots[self._find(self._key(fingerprint))] != 0
+
+    def add(self, fingerprint: str) -> bool:
+        """Adds a fingerprint
+
+        Returns:
+            False if the fingerprint was already in the index
+        """
+        key = self._key(fingerprint)
+        i = self._find(key)
+        if self._slots[i]:
+            return False
+
+        self._slots[i] = key
+        self._size += 1
+        if 3 * self._size > 2 * len(self._slots):
+            self._grow()
+        return True
+
+    def _grow(self):
+        keys = [key for key in self._slots if key]
+        self._slots = array("Q", bytes(16 * len(self._slots)))
+        self._mask = len(self._slots) - 1
+        for key in keys:
+            self._slots[self._find(key)] = key
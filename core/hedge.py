@@ -0,0 +1,187 @@
+import collections
+import concurrent.futures
+import threading
+import time
+from typing import Optional
+
+from core.rate_limiter import TokenBucket
+from core.transport import HttpTransport
+
+
+class LatencyTracker:
+    """Running percentile of the latest request latencies
+
+    Args:
+        window: number of latest latencies kept
+        min_samples: latencies needed before percentile() returns a value
+    """
+
+    def __init__(self, window: int = 500, min_samples: int = 20) -> None:
+        self.min_samples = min_samples
+        self._latencies = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Returns the q-th percentile of the latest latencies, None when there are
+        fewer than min_samples of them
+        """
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[min(int(len(latencies) * q / 100), len(latencies) - 1)]
+
+
+class HedgedTransport:
+    """HttpTransport wrapper which hedges the slow requests: when a page has not
+    responded after the running p95 latency of the pages, a second identical request
+    is sent and the response which arrives first is kept. The other one is closed when
+    it completes.
+
+    Hedges are extra load on the server, at most `budget` hedges per request are sent,
+    and only when a token of the rate limiter of the page requests is available right
+    away, so hedging never goes over the configured (or adapted) request rate.
+    Streamed requests (photos) and responses served from the cache are not hedged.
+
+    Args:
+        transport: transport sending the requests
+        budget: maximum ratio of hedged requests to requests, e.g. 0.05 for 5%
+        percentile: latency percentile after which a request is hedged
+        max_workers: threads running the requests, should be at least twice the
+            number of requests in flight. The hedge delay runs from the start of a
+            request, not from its wait for a thread
+        rate_limiter: token bucket of the page requests, every hedge takes a token
+    """
+
+    def __init__(
+        self,
+        transport: HttpTransport,
+        budget: float = 0.05,
+        percentile: float = 95,
+        max_workers: int = 20,
+        rate_limiter: TokenBucket = None,
+    ) -> None:
+        self.transport = transport
+        self.rate_limiter = rate_limiter
+        self.budget = budget
+        self.percentile = percentile
+        self.latencies = LatencyTracker()
+
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0  # hedges which responded before the first request
+        self.rate_limited = 0  # hedges not sent, no token was available
+
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+    @property
+    def cache(self):
+        return self.transport.cache
+
+    def _timed_get(self, url: str, started: threading.Event = None):
+        if started is not None:
+            started.set()
+        _start = time.time()
+        response = self.transport.get(url)
+        if not getattr(response, "from_cache", False):
+            self.latencies.add(time.time() - _start)
+        return response
+
+    def _take_hedge(self) -> bool:
+        """Counts a hedge if the budget allows one more and the rate limiter has a token"""
+        with self._lock:
+            if self.hedges + 1 > self.budget * self.requests:
+                return False
+            if self.rate_limiter is not None and not self.rate_limiter.try_acquire():
+                self.rate_limited += 1
+                return False
+            self.hedges += 1
+            return True
+
+    @staticmethod
+    def _close_response(future: concurrent.futures.Future):
+        if not future.cancelled() and future.exception() is None:
+            future.result().close()
+
+    def get(self, url: str, params: dict = None, **kwargs):
+        """Sends a GET request, hedged when it is slower than the running p95
+
+        Args:
+            url: url to request
+            params: query parameters
+            kwargs: passed on to HttpTransport.get, requests with kwargs are not hedged
+
+        Returns:
+            the first response, see HttpTransport.get
+        """
+        if params or kwargs:
+            return self.transport.get(url, params, **kwargs)
+
+        with self._lock:
+            self.requests += 1
+        delay = self.latencies.percentile(self.percentile)
+        if delay is None or self.budget <= 0:
+            return self._timed_get(url)
+
+        started = threading.Event()
+        first = self._executor.submit(self._timed_get, url, started)
+        first.add_done_callback(lambda _: started.set())  # e.g. cancelled by close()
+        # the delay runs from the start of the request, a request waiting for a thread
+        # of the pool is not slow and is not hedged
+        started.wait()
+        try:
+            return first.result(timeout=delay)
+        except concurrent.futures.TimeoutError:
+            pass
+
+        if not self._take_hedge():
+            return first.result()
+
+        hedge = self._executor.submit(self._timed_get, url)
+        pending = {first, hedge}
+        while True:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            succeeded = [future for future in done if future.exception() is None]
+            # when the first one failed, the other request may still succeed
+            if succeeded or not pending:
+                break
+
+        winner = succeeded[0] if succeeded else first
+        for other in {first, hedge} - {winner}:
+            other.add_done_callback(self._close_response)
+        if winner is hedge:
+            with self._lock:
+                self.hedge_wins += 1
+        return winner.result()
+
+    def stats(self) -> dict:
+        p95 = self.latencies.percentile(95)
+        return {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "rate_limited": self.rate_limited,
+            "p95_seconds": p95,
+        }
+
+    def log_stats(self, logger):
+        """Logs the connection counters of the transport and the hedging counters"""
+        self.transport.log_stats(logger)
+        stats = self.stats()
+        p95 = "-" if stats["p95_seconds"] is None else f"{stats['p95_seconds']:.2f}s"
+        logger.info(
+            f"Hedged requests: {stats['hedges']} of {stats['requests']} requests hedged, "
+            f"{stats['hedge_wins']} answered first, {stats['rate_limited']} skipped by "
+            f"the rate limit, p95 latency {p95}"
+        )
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.transport.close()
@@ -0,0 +1,145 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+from typing import List
+
+# journal records, one json object per line:
+#   {"event": "plan", "input": {...}, "page_size": 25, "pages": [{"idx", "url"}, ...]}
+#   {"event": "resume", "pages": number of pages left}
+#   {"event": "done", "pages": [idx, ...]}  pages saved by all the outputs
+#   {"event": "failed", "idx": idx, "error": "..."}
+#   {"event": "finished"}
+
+
+class JobJournal:
+    """Append-only journal of the reviews pages of a job, in the job output directory.
+
+    The journal records the page plan of the job, then every page once its reviews are
+    saved by all the outputs. A job which was interrupted, by a crash or Ctrl-C, can
+    be resumed from it: only the pages which are not recorded as done are scraped again.
+    Every record is flushed and synced to disk, after the outputs synced the reviews of
+    its pages. A torn line left by a crash is ignored by load().
+
+    Args:
+        path: journal file
+        n_outputs: number of outputs which report the pages they saved, a page is done
+            once all of them reported it
+    """
+
+    def __init__(self, path: str, n_outputs: int = 1) -> None:
+        self.path = path
+        self.n_outputs = n_outputs
+
+        self._lock = threading.Lock()
+        self._saved = Counter()  # idx -> number of outputs which saved the page
+        self._failed = set()  # idx of the pages which failed during this run
+
+        torn = False
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, "rb") as file:
+                file.seek(-1, os.SEEK_END)
+                torn = file.read(1) != b"\n"
+        self._file = open(path, "a", encoding="utf-8")
+        if torn:
+            # a crash left a torn last line, the records of this run start on a new line
+            self._file.write("\n")
+
+    def _append(self, record: dict):
+        record["time"] = round(time.time(), 3)
+        with self._lock:
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def plan(self, input_params: dict, page_size: int, ls_urls: List[dict]):
+        """Records the pages planned by a new run of the job"""
+        self._append(
+            {
+                "event": "plan",
+                "input": input_params,
+                "page_size": page_size,
+                "pages": [{"idx": u["idx"], "url": u["url"]} for u in ls_urls],
+            }
+        )
+
+    def resume(self, n_pages: int):
+        """Records the start of a resumed run, with the number of pages left"""
+        self._append({"event": "resume", "pages": n_pages})
+
+    def pages_saved(self, idxs: List[int]):
+        """Called by every output with the pages it saved, see OrderedSink.on_saved"""
+        done = []
+        with self._lock:
+            for idx in idxs:
+                self._saved[idx] += 1
+                if self._saved[idx] == self.n_outputs and idx not in self._failed:
+                    done.append(idx)
+
+        if done:
+            self._append({"event": "done", "pages": done})
+
+    def page_failed(self, idx: int, error: str):
+        with self._lock:
+            self._failed.add(idx)
+        self._append({"event": "failed", "idx": idx, "error": error})
+
+    def close(self, finished: bool = True):
+        if finished:
+            self._append({"event": "finished"})
+        with self._lock:
+            self._file.close()
+
+    @staticmethod
+    def load(path: str) -> dict:
+        """Reads the state of a job from its journal
+
+        Returns:
+            {"input", "page_size", "pages": planned [{"idx", "url"}], "done": set of idx,
+            "failed": {idx: error}, "runs": number of runs, "finished": bool}
+
+        Raises:
+            FileNotFoundError: the job has no journal
+            ValueError: the journal has no page plan
+        """
+        state = None
+        runs = 0
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn line of an interrupted run
+
+                event = record["event"]
+                if event == "plan":
+                    # a new run of the same job id starts from scratch
+                    state = {
+                        "input": record["input"],
+                        "page_size": record["page_size"],
+                        "pages": record["pages"],
+                        "done": set(),
+                        "failed": {},
+                        "finished": False,
+                    }
+                    runs = 1
+                elif state is None:
+                    continue
+                elif event == "resume":
+                    runs += 1
+                    state["finished"] = False
+                elif event == "done":
+                    state["done"].update(record["pages"])
+                elif event == "failed":
+                    state["failed"][record["idx"]] = record["error"]
+                elif event == "finished":
+                    state["finished"] = True
+
+        if state is None:
+            raise ValueError(f"No page plan in the journal {path}")
+
+        state["runs"] = runs
+        for idx in state["done"]:
+            state["failed"].pop(idx, None)
+        return state
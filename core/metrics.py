@@ -0,0 +1,347 @@
+import http.server
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Optional, Tuple
+
+from core.data_models import Config
+
+# upper bounds of the histogram buckets, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PARSE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+PER_REVIEW_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05)
+
+# help text of the metrics, in the Prometheus export
+METRICS_HELP = {
+    "requests_total": "Review page requests sent, by status code",
+    "retries_total": "Review page requests retried, by reason",
+    "response_bytes_total": "Bytes of the review pages downloaded",
+    "fetch_seconds": "Latency of the review page requests",
+    "parse_seconds": "Parse time of a reviews page",
+    "parse_seconds_per_review": "Parse time of a reviews page per review",
+    "pages_parsed_total": "Reviews pages parsed",
+    "pages_skipped_total": "Reviews pages skipped after failing",
+    "task_failures_total": "Queue pages a worker failed to fetch or parse, given back to the queue",
+    "reviews_parsed_total": "Reviews parsed",
+    "reviews_written_total": "Reviews written, by output",
+    "photos_total": "Review photos, by result",
+    "photo_bytes_total": "Bytes of the review photos downloaded",
+    "pages_planned": "Reviews pages planned for the hotel",
+    "pages_done": "Reviews pages parsed for the hotel",
+    "parse_queue_pages": "Pages waiting for the parse processes",
+    "reorder_buffer_pages": "Parsed pages held until an earlier page is written",
+    "photo_queue": "Photos waiting to be downloaded",
+    "request_rate": "Current rate of the review page requests, per second",
+}
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th quantile, None above the last bucket"""
+        if not self.count:
+            return None
+        target = q * self.count
+        cumulative = 0
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            if cumulative >= target:
+                return bound
+        return None
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels_text(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    items = [f'{name}="{_escape(value)}"' for name, value in labels]
+    if extra:
+        items.append(extra)
+    return "{" + ",".join(items) + "}" if items else ""
+
+
+class Metrics:
+    """Registry of the runtime metrics of the scraper: counters, gauges and histograms,
+    with optional labels. Thread safe, one registry is shared by all the components of
+    a run, or of a batch.
+
+    The metrics are exported in the Prometheus text format by to_prometheus(), and as a
+    JSON summary by summary().
+
+    Args:
+        prefix: prefix of the metric names in the Prometheus export
+    """
+
+    def __init__(self, prefix: str = "booking_scraper") -> None:
+        self.prefix = prefix
+        self.started = time.time()
+
+        self._lock = threading.Lock()
+        self._counters: Dict[_Key, float] = {}
+        self._gauges: Dict[_Key, float] = {}
+        self._histograms: Dict[_Key, _Histogram] = {}
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> _Key:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Adds value to a counter"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        """Sets a gauge"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(
+        self,
+        name: str,
+        value: float,
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+        **labels,
+    ):
+        """Adds a value to a histogram, the buckets are fixed by the first observation"""
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def to_prometheus(self) -> str:
+        """Returns the metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for metric_type, series in (
+                ("counter", self._counters),
+                ("gauge", self._gauges),
+                ("histogram", self._histograms),
+            ):
+                for name in sorted({name for name, _ in series}):
+                    full_name = f"{self.prefix}_{name}"
+                    if name in METRICS_HELP:
+                        lines.append(f"# HELP {full_name} {METRICS_HELP[name]}")
+                    lines.append(f"# TYPE {full_name} {metric_type}")
+
+                    for (series_name, labels), value in sorted(series.items()):
+                        if series_name != name:
+                            continue
+                        if metric_type != "histogram":
+                            lines.append(f"{full_name}{_labels_text(labels)} {value:g}")
+                            continue
+
+                        cumulative = 0
+                        for bound, n in zip(value.buckets + ("+Inf",), value.counts):
+                            cumulative += n
+                            le = f'le="{bound if bound == "+Inf" else f"{bound:g}"}"'
+                            lines.append(
+                                f"{full_name}_bucket{_labels_text(labels, le)} {cumulative}"
+                            )
+                        lines.append(f"{full_name}_sum{_labels_text(labels)} {value.sum:g}")
+                        lines.append(f"{full_name}_count{_labels_text(labels)} {value.count}")
+
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> dict:
+        """Returns the metrics as a dict which can be saved as JSON.
+
+        Series with labels are nested by their labels, e.g.
+        {"requests_total": {"status=200": 120, "status=429": 3}}. Histograms are
+        summarized by count, mean and the p50/p95/p99 bucket bounds. reviews_per_second
+        is the rate of the reviews written since the registry was created.
+        """
+        elapsed = time.time() - self.started
+
+        def add(summary: dict, key: _Key, value):
+            name, labels = key
+            if not labels:
+                summary[name] = value
+            else:
+                label = ",".join(f"{k}={v}" for k, v in labels)
+                summary.setdefault(name, {})[label] = value
+
+        counters, gauges, histograms = {}, {}, {}
+        with self._lock:
+            for key, value in sorted(self._counters.items()):
+                add(counters, key, value)
+            for key, value in sorted(self._gauges.items()):
+                add(gauges, key, value)
+            for key, histogram in sorted(self._histograms.items()):
+                add(
+                    histograms,
+                    key,
+                    {
+                        "count": histogram.count,
+                        "mean": round(histogram.sum / histogram.count, 6),
+                        "p50": histogram.quantile(0.5),
+                        "p95": histogram.quantile(0.95),
+                        "p99": histogram.quantile(0.99),
+                    },
+                )
+            # every output writes the same reviews
+            written = max(
+                (
+                    value
+                    for (name, _), value in self._counters.items()
+                    if name == "reviews_written_total"
+                ),
+                default=0,
+            )
+
+        return {
+            "elapsed_seconds": round(elapsed, 3),
+            "reviews_per_second": round(written / elapsed, 3) if elapsed else 0.0,
+            "counters": counters,
+            "gauges": gauges,
+            "histograms": histograms,
+        }
+
+    def log_summary(self, logger):
+        """Logs the main figures of the summary"""
+        summary = self.summary()
+        counters = summary["counters"]
+        fetch = summary["histograms"].get("fetch_seconds", {})
+        parse = summary["histograms"].get("parse_seconds", {})
+
+        requests_by_status = counters.get("requests_total", {})
+        n_requests = sum(requests_by_status.values())
+        by_status = ", ".join(f"{k.split('=')[1]}: {v:g}" for k, v in requests_by_status.items())
+        n_retries = sum(counters.get("retries_total", {}).values())
+        logger.info(
+            f"Metrics: {n_requests:g} requests ({by_status or '-'}), {n_retries:g} retries, "
+            f"{counters.get('response_bytes_total', 0) / 2**20:.1f} MB, "
+            f"fetch p95 {fetch.get('p95') or '-'}s, parse p95 {parse.get('p95') or '-'}s per page, "
+            f"{summary['reviews_per_second']:.1f} reviews/s"
+        )
+
+    def write_prometheus(self, path: str):
+        """Writes the Prometheus export to a file, e.g. for the textfile collector of the
+        node exporter. The file is replaced atomically
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+    def write_summary(self, path: str):
+        """Writes the JSON summary to a file"""
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.summary(), file, indent=2)
+
+
+class MetricsExporter:
+    """Exposes a Metrics registry while the scraper runs: the Prometheus file is
+    rewritten every `interval` seconds and/or served over HTTP at
+    http://<host>:<port>/metrics
+
+    Args:
+        metrics: registry to export
+        path: Prometheus text file, None to not write one
+        port: port of the HTTP endpoint, None to not serve one
+        interval: seconds between two writes of the file
+        host: address the HTTP endpoint listens on, local clients only by default
+    """
+
+    def __init__(
+        self,
+        metrics: Metrics,
+        path: str = None,
+        port: int = None,
+        interval: float = 5,
+        host: str = "127.0.0.1",
+    ) -> None:
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+
+        self._stop = threading.Event()
+        self._threads = []
+        self._server = None
+
+        if port is not None:
+            self._server = http.server.ThreadingHTTPServer((host, port), self._handler())
+            self._server.daemon_threads = True
+            self._threads.append(
+                threading.Thread(target=self._server.serve_forever, daemon=True)
+            )
+        if path is not None:
+            self._threads.append(threading.Thread(target=self._write_loop, daemon=True))
+
+        for thread in self._threads:
+            thread.start()
+
+    def _handler(self):
+        metrics = self.metrics
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def _write_loop(self):
+        while not self._stop.wait(self.interval):
+            self.metrics.write_prometheus(self.path)
+
+    def close(self):
+        """Writes the file one last time and stops the HTTP endpoint"""
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for thread in self._threads:
+            thread.join()
+        if self.path is not None:
+            self.metrics.write_prometheus(self.path)
+
+
+def open_exporter(config: Config, metrics: Metrics) -> Optional[MetricsExporter]:
+    """Starts the exporter of METRICS_FILE and METRICS_PORT (listening on METRICS_HOST),
+    None when both are off
+
+    Args:
+        config: loaded config.yml
+        metrics: registry to export
+    """
+    if not config.METRICS_FILE and config.METRICS_PORT is None:
+        return None
+    return MetricsExporter(
+        metrics,
+        path=config.METRICS_FILE,
+        port=config.METRICS_PORT,
+        host=config.METRICS_HOST or "127.0.0.1",
+    )
@@ -0,0 +1,336 @@
+import logging
+import re
+import string
+import time
+from typing import Dict, List, NamedTuple, Tuple
+
+from core.dates import ReviewDateParser
+from core.fingerprint import review_fingerprint
+from core.parser_backends import available_backends, get_backend
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+# one per process, the memoized dates are reused by all the pages parsed by a worker
+_date_parser = ReviewDateParser()
+
+# order of the fields of a review, parse workers return rows as tuples in this order
+REVIEW_FIELDS = (
+    "hotel_name",
+    "review_id",
+    "username",
+    "user_country",
+    "room_view",
+    "stay_duration",
+    "stay_type",
+    "review_post_date",
+    "review_title",
+    "rating",
+    "original_lang",
+    "review_text_liked",
+    "review_text_disliked",
+    "full_review",
+    "en_full_review",
+    "found_helpful",
+    "found_unhelpful",
+    "owner_resp_text",
+    "review_photos",
+    "local_photo_paths",
+)
+
+
+class ParsedPage(NamedTuple):
+    """Compact result of parsing one reviews page, cheap to send between processes"""
+
+    idx: int  # orginal offset_param value / id of reviews page
+    rows: List[Tuple]  # one tuple per review, values ordered as REVIEW_FIELDS
+    parse_time: float  # seconds spent parsing the page
+    date_counters: Tuple[int, int, int] = (0, 0, 0)  # ReviewDateParser counters delta
+
+
+def rows_to_reviews(rows: List[Tuple]) -> List[dict]:
+    """Converts the tuples of a ParsedPage back into review dicts"""
+    return [dict(zip(REVIEW_FIELDS, row)) for row in rows]
+
+
+def validate(element):
+    """
+    Removes multitples spaces and strips \n
+
+    Args:
+        element: Beautiful Soap element
+
+    Returns:
+        string text extracted from element
+    """
+    if element is not None:
+        if isinstance(element, str):
+            text = _WHITESPACE.sub(" ", element).strip(" \n")
+        else:
+            text = _WHITESPACE.sub(" ", element.text).strip(" \n")
+        if len(text):
+            return text
+
+    return None
+
+
+def _to_count(text: str) -> int:
+    """'3 people found this review helpful' -> 3"""
+    if text is None:
+        return 0
+    return int(
+        text.split("people")[0].strip()
+        if "people" in text
+        else text.split("person")[0].strip()
+    )
+
+
+def _end_with_period(text: str) -> str:
+    """Add '.' period sign to the end of a part of the review. If its not already there"""
+    return f"{text}." if text and text[-1] not in string.punctuation else text
+
+
+def build_row(raw: dict, hotel_name: str) -> Tuple:
+    """Cleans the raw element texts of a review found by a parser backend
+
+    Args:
+        raw: dict yielded by ParserBackend.iter_reviews
+        hotel_name: name of the hotel on booking.com
+
+    Returns:
+        review values ordered as REVIEW_FIELDS
+    """
+    username = validate(raw["username"])
+    user_country = validate(raw["user_country"])
+    room_view = validate(raw["room_view"])
+
+    stay_duration = validate(raw["stay_duration"])
+    stay_duration = stay_duration.split(" ·")[0] if stay_duration is not None else None
+
+    stay_type = validate(raw["stay_type"])
+    review_title = validate(raw["review_title"])
+
+    date = validate(raw["date"])
+    if date:
+        date = date.split(":")[-1].strip()
+        date = _date_parser.parse(date)
+
+    rating = validate(raw["rating"])
+    rating = float(rating) if rating is not None else rating
+
+    review_text = raw["bodies"]
+    review_text_liked = None
+    review_text_disliked = None
+    original_lang = None
+    full_review, en_full_review = None, None
+    if review_text:
+        review_text_liked = validate(review_text[0][0])
+        if (
+            review_text_liked
+            and "There are no comments available for this review".lower()
+            in review_text_liked.lower()
+        ):
+            review_text_liked = None
+        original_lang = review_text[0][1]
+
+        if len(review_text) > 1:
+            review_text_disliked = validate(review_text[1][0])
+            if review_text_disliked is None:
+                if len(review_text) > 2:
+                    review_text_disliked = validate(review_text[2][0])
+
+    t_title = _end_with_period(f"title: {review_title}" if review_title else "")
+    t_liked = _end_with_period(f"liked: {review_text_liked}" if review_text_liked else "")
+    t_disliked = _end_with_period(
+        f"disliked: {review_text_disliked}" if review_text_disliked else ""
+    )
+
+    full_review = validate(f"{t_title} {t_liked} {t_disliked}")
+
+    if original_lang and "en" in original_lang:
+        en_full_review = full_review
+
+    found_helpful = _to_count(validate(raw["found_helpful"]))
+    found_unhelpful = _to_count(validate(raw["found_unhelpful"]))
+    owner_response = validate(raw["owner_response"])
+
+    photos_urls = []
+    for photo_url in raw["photos"]:
+        if photo_url and "max1280x900" in photo_url:
+            photos_urls.append(photo_url)
+        else:
+            logger.debug(f"Skipped photo URL: {photo_url}")
+
+    # derived from the content, so the id does not change when the review moves
+    # to another page as new reviews are posted
+    review_id = review_fingerprint(
+        {
+            "hotel_name": hotel_name,
+            "username": username,
+            "user_country": user_country,
+            "review_post_date": date,
+            "review_title": review_title,
+            "rating": rating,
+            "room_view": room_view,
+            "stay_duration": stay_duration,
+            "review_text_liked": review_text_liked,
+            "review_text_disliked": review_text_disliked,
+        }
+    )
+
+    return (
+        hotel_name,
+        review_id,
+        username,
+        user_country,
+        room_view,
+        stay_duration,
+        stay_type,
+        date,
+        review_title,
+        rating,
+        original_lang,
+        review_text_liked,
+        review_text_disliked,
+        full_review,
+        en_full_review,
+        found_helpful,
+        found_unhelpful,
+        owner_response,
+        photos_urls,
+        [],
+    )
+
+
+def parse_reviews_page(
+    content: bytes, idx: int, hotel_name: str, backend: str = "html.parser"
+) -> ParsedPage:
+    """Parses the html content of a single reviews page.
+
+    This is a module level function so that it can be sent to the parse worker
+    processes without pickling the Scrape object.
+
+    Args:
+        content: raw html of the reviews page
+        idx: orginal offset_param value / id of the reviews page
+        hotel_name: name of the hotel on booking.com
+        backend: name of the parser backend, see core.parser_backends
+
+    Returns:
+        ParsedPage with one row per review. local_photo_paths is always empty,
+        photos are downloaded by the caller
+    """
+    _start = time.perf_counter()
+    counters = _date_parser.counters()
+
+    page_rows = [
+        build_row(raw, hotel_name)
+        for raw in get_backend(backend).iter_reviews(content.decode())
+    ]
+
+    return ParsedPage(
+        idx,
+        page_rows,
+        time.perf_counter() - _start,
+        tuple(b - a for a, b in zip(counters, _date_parser.counters())),
+    )
+
+
+def compare_backends(paths: List[str], backends: List[str] = None) -> Dict[str, List[str]]:
+    """Parses saved reviews pages with every backend and logs the pages where a
+    backend does not produce the same reviews as "html.parser".
+
+    Args:
+        paths: html files of saved reviews pages
+        backends: backends to compare, all the installed ones by default
+
+    Returns:
+        {backend name: paths of the mismatching pages}
+    """
+    backends = backends or available_backends()
+    mismatches = {name: [] for name in backends}
+
+    for path in paths:
+        with open(path, "rb") as file:
+            content = file.read()
+
+        expected = parse_reviews_page(content, 0, "", "html.parser").rows
+        for name in backends:
+            rows = parse_reviews_page(content, 0, "", name).rows
+            if rows == expected:
+                continue
+            mismatches[name].append(path)
+            logger.warning(f"Backend {name} does not give the same reviews: {path}")
+            for exp, got in zip(expected, rows):
+                for field, a, b in zip(REVIEW_FIELDS, exp, got):
+                    if a != b:
+                        logger.warning(f"  {field}: {a!r} != {b!r}")
+            if len(rows) != len(expected):
+                logger.warning(f"  reviews: {len(expected)} != {len(rows)}")
+
+    n_mismatches = sum(len(pages) for pages in mismatches.values())
+    logger.info(
+        f"Compared {len(paths)} pages with {', '.join(backends)}: {n_mismatches} mismatches"
+    )
+    return mismatches
+
+
+def benchmark_backends(
+    paths: List[str], backends: List[str] = None, repeat: int = 3
+) -> Dict[str, float]:
+    """Measures the parse time per review of every backend on saved reviews pages
+
+    Args:
+        paths: html files of saved reviews pages
+        backends: backends to measure, all the installed ones by default
+        repeat: number of times every page is parsed, the fastest run is kept
+
+    Returns:
+        {backend name: milliseconds per review}
+    """
+    backends = backends or available_backends()
+    pages = []
+    for path in paths:
+        with open(path, "rb") as file:
+            pages.append(file.read())
+
+    results = {}
+    for name in backends:
+        n_reviews, total = 0, 0.0
+        for content in pages:
+            times = [parse_reviews_page(content, 0, "", name) for _ in range(repeat)]
+            n_reviews += len(times[0].rows)
+            total += min(page.parse_time for page in times)
+
+        results[name] = 1000 * total / n_reviews if n_reviews else 0.0
+        logger.info(
+            f"{name}: {n_reviews} reviews in {total:.3f} seconds, "
+            f"{results[name]:.3f} ms/review"
+        )
+
+    return results
+
+
+if __name__ == "__main__":
+    # python -m core.parse compare page1.html page2.html ...
+    # python -m core.parse bench page1.html page2.html ...
+    import argparse
+    import sys
+
+    arg_parser = argparse.ArgumentParser(
+        description="Check or benchmark the parser backends on saved reviews pages"
+    )
+    arg_parser.add_argument("command", choices=["compare", "bench"])
+    arg_parser.add_argument("pages", nargs="+", help="html files of reviews pages")
+    arg_parser.add_argument("--backends", nargs="+", help="backends to use")
+    arg_parser.add_argument(
+        "--repeat", type=int, default=3, help="runs per page (bench only)"
+    )
+    args = arg_parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.command == "compare":
+        mismatches = compare_backends(args.pages, args.backends)
+        sys.exit(1 if any(mismatches.values()) else 0)
+    benchmark_backends(args.pages, args.backends, args.repeat)
@@ -0,0 +1,294 @@
+from typing import Iterator, List, Optional
+
+from bs4 import BeautifulSoup, CData, FeatureNotFound, NavigableString, Tag
+
+# selectolax is optional, it is only needed by the "selectolax" backend
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+
+class ParserBackend:
+    """Finds the review elements in a reviews page. Subclasses only locate elements
+    and return their raw text, all the cleaning is shared in core.parse so every
+    backend produces the same reviews.
+    """
+
+    name = None
+
+    def iter_reviews(self, html: str) -> Iterator[dict]:
+        """Yields the raw text of the elements of every review in the page. Values are
+        not normalized, elements which are not present are None.
+
+        Keys:
+            username, user_country, room_view, stay_duration, stay_type, review_title,
+            date, rating, found_helpful, found_unhelpful, owner_response: element text
+            bodies: list of (text, lang) of the review body spans
+            photos: list of the data-photos-src attributes of the photo buttons
+        """
+        raise NotImplementedError
+
+
+# flags of the containers that the review fields are looked up in
+_GUEST = 1
+_ROOM = 2
+_STAY = 4
+_TRAVELLER = 8
+_REVIEW = 16
+_HELPFUL = 32
+_RESPONSE = 64
+_PHOTOS = 128
+
+# (tag name, class) -> flag set on all the descendants of the tag
+_CONTAINERS = {
+    ("div", "c-review-block__guest"): _GUEST,
+    ("div", "c-review-block__room-info-row"): _ROOM,
+    ("ul", "c-review-block__stay-date"): _STAY,
+    ("ul", "review-panel-wide__traveller_type"): _TRAVELLER,
+    ("div", "c-review"): _REVIEW,
+    ("div", "c-review-block__row--helpful-vote"): _HELPFUL,
+    ("div", "c-review-block__response"): _RESPONSE,
+}
+
+# (tag name, class) -> [(flag the tag must be inside of, field)]. Same as the css
+# selectors "div.c-review-block__guest span.bui-avatar-block__title" etc.
+_FIELDS = {
+    ("span", "bui-avatar-block__title"): [(_GUEST, "username")],
+    ("span", "bui-avatar-block__subtitle"): [(_GUEST, "user_country")],
+    ("div", "bui-list__body"): [
+        (_ROOM, "room_view"),
+        (_STAY, "stay_duration"),
+        (_TRAVELLER, "stay_type"),
+    ],
+    ("h3", "c-review-block__title"): [(0, "review_title")],
+    ("div", "bui-review-score__badge"): [(0, "rating")],
+    ("span", "c-review__body"): [(_REVIEW, "bodies")],
+    ("p", "review-helpful__vote-others-helpful"): [(_HELPFUL, "found_helpful")],
+    ("p", "--unhelpful"): [(_HELPFUL, "found_unhelpful")],
+    ("span", "c-review-block__response__body"): [(_RESPONSE, "owner_response")],
+    ("button", "c-review-block__photos__button"): [(_PHOTOS, "photos")],
+}
+
+
+class SoupBackend(ParserBackend):
+    """BeautifulSoup with the given tree builder ("html.parser" or "lxml").
+
+    Every review subtree is walked once. The fields are picked up by dispatching
+    on the class names of the tags, instead of running one css query per field.
+    """
+
+    def __init__(self, features: str = "html.parser") -> None:
+        self.name = features
+        self.features = features
+
+    def _walk(self, node: Tag, flags: int, spans: List[Tag], raw: dict):
+        """Visits the descendants of node in document order
+
+        Args:
+            node: current tag
+            flags: containers the node is inside of
+            spans: open span tags above the node, outermost first
+            raw: fields found so far
+        """
+        for child in node.contents:
+            child_type = type(child)
+
+            if child_type is Tag:
+                name = child.name
+                child_flags = flags
+
+                for cls in child.get("class") or ():
+                    key = (name, cls)
+                    for flag, field in _FIELDS.get(key, ()):
+                        if flags & flag != flag:
+                            continue
+                        if field == "bodies":
+                            raw["bodies"].append(
+                                (child.get_text(), child.get("lang", default=None))
+                            )
+                        elif field == "photos":
+                            raw["photos"].append(child.get("data-photos-src", ""))
+                        elif field == "owner_response":
+                            # the last response is kept
+                            raw["owner_response"] = child.get_text()
+                        elif raw[field] is None:
+                            raw[field] = child.get_text()
+
+                    child_flags |= _CONTAINERS.get(key, 0)
+
+                    # only the buttons of the first photos list are used
+                    if key == ("ul", "c-review-block__photos") and not raw["_photos_ul"]:
+                        raw["_photos_ul"] = True
+                        child_flags |= _PHOTOS
+
+                if name == "span":
+                    self._walk(child, child_flags, spans + [child], raw)
+                else:
+                    self._walk(child, child_flags, spans, raw)
+
+            elif (
+                raw["date"] is None
+                and spans
+                and child_type in (NavigableString, CData)
+                and "Reviewed:" in child
+            ):
+                # the first span in document order containing the text is the
+                # outermost open span around its first occurrence
+                raw["date"] = spans[0].get_text()
+
+    def iter_reviews(self, html: str) -> Iterator[dict]:
+        soup = BeautifulSoup(html, self.features)
+
+        for review in soup.select("ul.review_list > li"):
+            raw = dict(
+                username=None,
+                user_country=None,
+                room_view=None,
+                stay_duration=None,
+                stay_type=None,
+                review_title=None,
+                date=None,
+                rating=None,
+                bodies=[],
+                found_helpful=None,
+                found_unhelpful=None,
+                owner_response=None,
+                photos=[],
+                _photos_ul=False,
+            )
+            self._walk(review, 0, [], raw)
+            del raw["_photos_ul"]
+
+            yield raw
+
+
+class SelectolaxBackend(ParserBackend):
+    """selectolax (lexbor), an html parser and css engine written in C"""
+
+    name = "selectolax"
+
+    def __init__(self) -> None:
+        if LexborHTMLParser is None:
+            raise ImportError(
+                "The selectolax parser backend requires: pip install selectolax"
+            )
+
+    @staticmethod
+    def _text(node) -> Optional[str]:
+        return node.text(deep=True) if node is not None else None
+
+    def iter_reviews(self, html: str) -> Iterator[dict]:
+        tree = LexborHTMLParser(html)
+
+        for review in tree.css("ul.review_list > li"):
+            bodies = [
+                (body.text(deep=True), body.attributes.get("lang"))
+                for body in review.css("div.c-review span.c-review__body")
+            ]
+            responses = review.css(
+                "div.c-review-block__response span.c-review-block__response__body"
+            )
+
+            date = None
+            for span in review.css("span"):
+                text = span.text(deep=True)
+                if "Reviewed:" in text:
+                    date = text
+                    break
+
+            photos = []
+            photos_ul = review.css_first("ul.c-review-block__photos")
+            if photos_ul is not None:
+                photos = [
+                    button.attributes.get("data-photos-src") or ""
+                    for button in photos_ul.css("button.c-review-block__photos__button")
+                ]
+
+            yield dict(
+                username=self._text(
+                    review.css_first(
+                        "div.c-review-block__guest span.bui-avatar-block__title"
+                    )
+                ),
+                user_country=self._text(
+                    review.css_first(
+                        "div.c-review-block__guest span.bui-avatar-block__subtitle"
+                    )
+                ),
+                room_view=self._text(
+                    review.css_first(
+                        "div.c-review-block__room-info-row div.bui-list__body"
+                    )
+                ),
+                stay_duration=self._text(
+                    review.css_first("ul.c-review-block__stay-date div.bui-list__body")
+                ),
+                stay_type=self._text(
+                    review.css_first(
+                        "ul.review-panel-wide__traveller_type div.bui-list__body"
+                    )
+                ),
+                review_title=self._text(review.css_first("h3.c-review-block__title")),
+                date=date,
+                rating=self._text(review.css_first("div.bui-review-score__badge")),
+                bodies=bodies,
+                found_helpful=self._text(
+                    review.css_first(
+                        "div.c-review-block__row--helpful-vote p.review-helpful__vote-others-helpful"
+                    )
+                ),
+                found_unhelpful=self._text(
+                    review.css_first(
+                        "div.c-review-block__row--helpful-vote p.--unhelpful"
+                    )
+                ),
+                owner_response=self._text(responses[-1]) if responses else None,
+                photos=photos,
+            )
+
+
+PARSER_BACKENDS = ("html.parser", "lxml", "selectolax")
+
+_backends = {}
+
+
+def get_backend(name: str = "html.parser") -> ParserBackend:
+    """Returns the parser backend with the given name, one instance per process
+
+    Args:
+        name: one of PARSER_BACKENDS
+
+    Raises:
+        ValueError: unknown backend name
+        ImportError: the library needed by the backend is not installed
+    """
+    if name not in _backends:
+        if name == "selectolax":
+            _backends[name] = SelectolaxBackend()
+        elif name in ("html.parser", "lxml"):
+            try:
+                BeautifulSoup("", name)
+            except FeatureNotFound:
+                raise ImportError(
+                    f"The {name} parser backend requires: pip install {name}"
+                )
+            _backends[name] = SoupBackend(name)
+        else:
+            raise ValueError(
+                f"Unknown parser backend: {name}. Choose one of {PARSER_BACKENDS}"
+            )
+
+    return _backends[name]
+
+
+def available_backends() -> List[str]:
+    """Names of the backends whose libraries are installed"""
+    names = []
+    for name in PARSER_BACKENDS:
+        try:
+            get_backend(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
@@ -0,0 +1,112 @@
+import contextlib
+import hashlib
+import os
+import shutil
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def photo_extension(photo_url: str) -> str:
+    """File extension of a photo url, ".jpg" when the url has none"""
+    ext = os.path.splitext(photo_url)[1]
+    if not ext or len(ext) > 5:  # If no extension or suspicious length
+        ext = ".jpg"
+    return ext
+
+
+class PhotoStore:
+    """Content store of the review photos shared by all the jobs, keyed on the photo url.
+
+    The photo urls are stable, a photo is downloaded once and every job links it into
+    its own output directory. Partial downloads are kept as "<hash>.part" files so the
+    next attempt can resume them with a Range request. The processes sharing the store
+    take the lock() of a photo before downloading it.
+
+    Args:
+        store_dir: directory of the store, shared between runs
+    """
+
+    def __init__(self, store_dir: str) -> None:
+        self.store_dir = store_dir
+        self.linked = 0
+        self.copied = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def path(self, url: str) -> str:
+        """Path of the photo in the store"""
+        key = self.key(url)
+        return os.path.join(self.store_dir, key[:2], f"{key}{photo_extension(url)}")
+
+    @contextlib.contextmanager
+    def lock(self, url: str):
+        """Exclusive lock of a photo of the store, held across the threads and the
+        processes sharing the store. The lock file "<hash>.lock" is left in place, a
+        lock file removed while another process waits for it would let a third one in
+        """
+        lock_path = f"{os.path.splitext(self.path(url))[0]}.lock"
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        with open(lock_path, "a+b") as file:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            else:
+                file.seek(0)  # msvcrt locks the bytes from the current position
+                while True:
+                    try:
+                        # LK_LOCK gives up after 10 seconds
+                        msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        pass
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+                else:
+                    file.seek(0)
+                    msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def has(self, url: str) -> bool:
+        return os.path.exists(self.path(url))
+
+    def link(self, url: str, dest: str):
+        """Makes a stored photo available at dest, as a hardlink when the store and the
+        output are on the same filesystem, as a copy otherwise
+
+        Args:
+            url: url of the stored photo
+            dest: path of the photo in the output of a job
+        """
+        src = self.path(url)
+        if os.path.exists(dest):
+            if os.path.samefile(src, dest):
+                return
+            os.remove(dest)
+
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        try:
+            os.link(src, dest)
+            with self._lock:
+                self.linked += 1
+        except OSError:
+            shutil.copyfile(src, dest)
+            with self._lock:
+                self.copied += 1
@@ -0,0 +1,305 @@
+import concurrent.futures
+import contextlib
+import logging
+import os
+import threading
+import time
+from typing import List
+from urllib.parse import urlparse
+
+from core.metrics import Metrics
+from core.photo_store import PhotoStore, photo_extension
+from core.rate_limiter import TokenBucket
+from core.transport import HttpTransport
+
+
+class PhotoDownloader:
+    """Downloads the review photos in the background, while the pages are still being
+    scraped and parsed.
+
+    Photos are queued with submit(), which returns a future of the local paths of the
+    photos which were saved, and are downloaded by a pool of threads over their own
+    keep-alive connections. The
+    requests to every photo host are spaced by a separate token bucket. Bodies are
+    streamed to disk in chunks, into a ".part" file renamed once complete. A ".part"
+    file left by an interrupted download is resumed with a Range request.
+
+    With a PhotoStore, photos are downloaded into the store and linked into the job
+    directory, the photos which are already in the store are not requested again.
+
+    Args:
+        output_dir: directory of the job, photos are saved in its "photos" subdirectory
+        transport: HttpTransport used for the photos only, without a response cache
+        store: PhotoStore shared by the jobs, photos are saved in the job directory only
+            when None
+        requests_per_second: maximum rate of requests per photo host
+        max_workers: number of photos downloaded at the same time
+        byte_budget: maximum number of bytes downloaded, 0 means no limit. Once
+            reached, the remaining photos are skipped
+        chunk_size: bytes written to disk at a time
+        logger: logger of the scraper
+        metrics: registry counting the photos by result and the bytes downloaded
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        transport: HttpTransport,
+        store: PhotoStore = None,
+        requests_per_second: float = 10,
+        max_workers: int = 8,
+        byte_budget: int = 0,
+        chunk_size: int = 64 * 1024,
+        logger: logging.Logger = None,
+        metrics: Metrics = None,
+    ) -> None:
+        self.output_dir = output_dir
+        self.store = store
+        self.requests_per_second = requests_per_second
+        self.byte_budget = byte_budget
+        self.chunk_size = chunk_size
+        self.logger = logger or logging.getLogger(__name__)
+        self.metrics = metrics
+
+        self.queued = 0
+        self.downloaded = 0
+        self.failed = 0
+        self.skipped = 0
+        self.reused = 0
+        self.resumed = 0
+        self.bytes_downloaded = 0
+
+        self._transport = transport
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self._buckets = {}  # photo host -> TokenBucket
+        # photo url -> [lock, number of threads using it], a photo is downloaded by one
+        # thread. The lock is dropped once no thread uses it
+        self._url_locks = {}
+        self._lock = threading.Lock()
+        self._finished = 0  # queued photos which are done
+        self._start = time.time()
+
+    @property
+    def pending(self) -> int:
+        """Number of queued photos which are not done yet"""
+        return self.queued - self._finished
+
+    def _count(self, result: str):
+        """Counts a photo, result is the counter: downloaded, reused, failed or skipped"""
+        with self._lock:
+            setattr(self, result, getattr(self, result) + 1)
+        if self.metrics is not None:
+            self.metrics.inc("photos_total", result=result)
+
+    def _bucket(self, url: str) -> TokenBucket:
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.requests_per_second)
+            return self._buckets[host]
+
+    def _over_budget(self, n_bytes: int = 0) -> bool:
+        return bool(self.byte_budget) and self.bytes_downloaded + n_bytes > self.byte_budget
+
+    def _reserve(self, n_bytes: int) -> bool:
+        """Counts n_bytes as downloaded, False when they do not fit in the byte budget"""
+        with self._lock:
+            if self._over_budget(n_bytes):
+                return False
+            self.bytes_downloaded += n_bytes
+            return True
+
+    def photo_paths(self, review_id: str, photos_urls: List[str]) -> List[str]:
+        """Local paths of the photos of a review, the same on every run
+
+        Args:
+            review_id: The reviewer's review_id (used for directory name)
+            photos_urls: List of photo URLs to download
+        """
+        review_file = "".join(
+            id for id in review_id if id.isalnum() or id in (" ", "-", "_")
+        ).strip()
+        reviewer_dir = os.path.join(self.output_dir, "photos", review_file)
+
+        return [
+            os.path.join(reviewer_dir, f"photo_{idx}{photo_extension(photo_url)}")
+            for idx, photo_url in enumerate(photos_urls, 1)
+        ]
+
+    def submit(self, review_id: str, photos_urls: List[str]) -> concurrent.futures.Future:
+        """Queues the photos of a review for download
+
+        Args:
+            review_id: The reviewer's review_id (used for directory name)
+            photos_urls: List of photo URLs to download
+
+        Returns:
+            Future of the list of the local paths of the photos which were saved, in
+            the order of photos_urls. Failed and skipped photos are left out
+        """
+        paths = self.photo_paths(review_id, photos_urls)
+        with self._lock:
+            self.queued += len(paths)
+        futures = [
+            self._executor.submit(self._download, photo_url, path)
+            for photo_url, path in zip(photos_urls, paths)
+        ]
+
+        saved = concurrent.futures.Future()
+        remaining = [len(futures)]
+
+        def on_done(_):
+            with self._lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            saved.set_result(
+                [
+                    path
+                    for path, future in zip(paths, futures)
+                    if not future.cancelled()
+                    and future.exception() is None
+                    and future.result()
+                ]
+            )
+
+        if not futures:
+            saved.set_result([])
+        for future in futures:
+            future.add_done_callback(on_done)
+        return saved
+
+    def _download(self, photo_url: str, path: str) -> bool:
+        try:
+            return self._download_photo(photo_url, path)
+        finally:
+            with self._lock:
+                self._finished += 1
+
+    def _download_photo(self, photo_url: str, path: str) -> bool:
+        with self._lock:
+            url_lock = self._url_locks.setdefault(photo_url, [threading.Lock(), 0])
+            url_lock[1] += 1
+
+        try:
+            with url_lock[0]:
+                return self._save_photo(photo_url, path)
+        finally:
+            with self._lock:
+                url_lock[1] -= 1
+                if not url_lock[1]:
+                    del self._url_locks[photo_url]
+
+    def _save_photo(self, photo_url: str, path: str) -> bool:
+        """Downloads a photo to path, through the store if there is one
+
+        Returns:
+            True when the photo is saved at path
+        """
+        if self.store is None:
+            return self._fetch(photo_url, path)
+
+        # the url locks are per downloader, other downloaders and processes sharing
+        # the store wait on the lock of the store
+        with self.store.lock(photo_url):
+            if self.store.has(photo_url):
+                self._count("reused")
+            elif not self._fetch(photo_url, self.store.path(photo_url)):
+                return False
+
+        try:
+            self.store.link(photo_url, path)
+        except OSError as ex:
+            self.logger.error(f"Error linking photo {path}: {str(ex)}")
+            self._count("failed")
+            return False
+        return True
+
+    def _fetch(self, photo_url: str, path: str) -> bool:
+        """Downloads a photo to path, resuming the ".part" file of an earlier attempt
+
+        Returns:
+            True when the photo was saved
+        """
+        if self._over_budget():
+            self._count("skipped")
+            return False
+
+        part_path = f"{path}.part"
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+        self._bucket(photo_url).acquire()
+        try:
+            kwargs = {}
+            if offset:
+                kwargs["headers"] = {"Range": f"bytes={offset}-"}
+            # streamed requests do not go through the response cache, the photos
+            # would fill it up and evict the review pages
+            response = self._transport.get(photo_url, stream=True, **kwargs)
+
+            resumed = response.status_code == 206 and response.headers.get(
+                "Content-Range", ""
+            ).startswith(f"bytes {offset}-")
+            if response.status_code != 200 and not resumed:
+                response.close()
+                if response.status_code in (206, 416):
+                    # the partial file does not match the photo, start again next time
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(part_path)
+                self.logger.error(
+                    f"Failed to download photo {path}: Status {response.status_code}"
+                )
+                self._count("failed")
+                return False
+
+            length = int(response.headers.get("Content-Length") or 0)
+            if self._over_budget(length):
+                response.close()
+                self._count("skipped")
+                return False
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # a 200 answer to a Range request is the whole photo, the part is rewritten
+            over_budget = False
+            with open(part_path, "ab" if resumed else "wb") as f:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    # Content-Length may be missing, and concurrent downloads all
+                    # passed the checks above, the budget is enforced chunk by chunk
+                    if not self._reserve(len(chunk)):
+                        over_budget = True
+                        break
+                    f.write(chunk)
+                    if self.metrics is not None:
+                        self.metrics.inc("photo_bytes_total", len(chunk))
+
+            if over_budget:
+                # the ".part" file is kept, a run with a larger budget resumes it
+                response.close()
+                self._count("skipped")
+                return False
+            os.replace(part_path, path)
+
+            with self._lock:
+                self.resumed += resumed
+            self._count("downloaded")
+            return True
+
+        except Exception as ex:
+            # the ".part" file is kept, the next attempt resumes it
+            self.logger.error(f"Error downloading photo {path}: {str(ex)}")
+            self._count("failed")
+            return False
+
+    def close(self):
+        """Waits for the queued photos and logs the download counters"""
+        self._executor.shutdown(wait=True)
+        self._transport.log_stats(self.logger)
+        self._transport.close()
+
+        elapsed = time.time() - self._start
+        self.logger.info(
+            f"Photos: {self.downloaded} downloaded ({self.bytes_downloaded / 2**20:.1f} MB), "
+            f"{self.resumed} resumed, {self.reused} already stored, "
+            f"{self.failed} failed, {self.skipped} skipped over the byte budget, "
+            f"{elapsed:.1f} seconds"
+        )
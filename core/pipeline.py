@@ -0,0 +1,46 @@
+import threading
+import time
+
+
+class StageStats:
+    """Throughput counters of one stage of the fetch -> parse pipeline
+
+    Args:
+        name: name of the stage used in the summary e.g. "Fetch"
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.items = 0
+        self.blocked = 0.0  # seconds spent waiting on the queue between the stages
+        self._start = None
+        self._end = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._start = time.time()
+
+    def stop(self):
+        self._end = time.time()
+
+    def add(self, n: int = 1, blocked: float = 0.0):
+        with self._lock:
+            self.items += n
+            self.blocked += blocked
+
+    @property
+    def elapsed(self) -> float:
+        if self._start is None:
+            return 0.0
+        return (self._end or time.time()) - self._start
+
+    @property
+    def throughput(self) -> float:
+        """items per second"""
+        return self.items / self.elapsed if self.elapsed else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.name} stage: {self.items} pages in {self.elapsed:.1f} seconds "
+            f"({self.throughput:.1f} pages/s), blocked on queue {self.blocked:.1f} seconds"
+        )
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket which spaces requests evenly at `rate` per second.
+
+    Tokens are reserved instead of polled: a caller that finds the bucket empty is
+    told exactly how long it has to wait for its token. Concurrent callers therefore
+    queue up one behind the other instead of waking up together in bursts.
+
+    Args:
+        rate: tokens added per second (i.e. requests per second)
+        capacity: maximum number of tokens that can be saved up for a burst
+    """
+
+    def __init__(self, rate: float, capacity: float = 1) -> None:
+        if rate <= 0:
+            raise ValueError(f"rate must be positive: {rate}")
+
+        self._rate = float(rate)
+        self._capacity = float(max(capacity, 1))
+        self._tokens = self._capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    def set_rate(self, rate: float):
+        """Changes the refill rate. Tokens accumulated so far are kept"""
+        if rate <= 0:
+            raise ValueError(f"rate must be positive: {rate}")
+
+        with self._lock:
+            self._refill(time.monotonic())
+            self._rate = float(rate)
+
+    def _refill(self, now: float):
+        self._tokens = min(
+            self._capacity, self._tokens + (now - self._last) * self._rate
+        )
+        self._last = now
+
+    def _reserve(self, tokens: float = 1) -> float:
+        """Takes `tokens` from the bucket, going into debt if needed
+
+        Returns:
+            seconds the caller has to wait before its tokens are actually available
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self._rate
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Takes `tokens` only if they are available right now, without waiting
+
+        Returns:
+            True when the tokens were taken
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens < tokens:
+                return False
+            self._tokens -= tokens
+            return True
+
+    def acquire(self, tokens: float = 1) -> float:
+        """Blocks the calling thread until `tokens` are available
+
+        Returns:
+            seconds spent waiting
+        """
+        delay = self._reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def acquire_async(self, tokens: float = 1) -> float:
+        """Same as `acquire` but yields to the event loop while waiting"""
+        delay = self._reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
@@ -0,0 +1,248 @@
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional, Tuple
+
+from core.metrics import Metrics
+from core.rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# response outcomes, see classify_response
+OK = "ok"
+THROTTLED = "throttled"  # the server asks us to slow down: 429/503
+BLOCKED = "blocked"  # 403, or a captcha/challenge page instead of the reviews
+RETRY = "retry"  # transient server or network error
+FATAL = "fatal"  # retrying will not help, e.g. 404
+
+_RETRY_STATUS = (408, 500, 502, 504)
+
+# found in the captcha/bot challenge pages served instead of the reviews
+BLOCK_MARKERS = (
+    b"captcha",
+    b"challenge-platform",
+    b"awswaf",
+    b"are you a robot",
+    b"unusual traffic",
+    b"access denied",
+)
+# found in every reviews page, also the ones without reviews
+_REVIEWS_PAGE_MARKER = b"review_list"
+
+
+def classify_response(response) -> str:
+    """Returns OK, THROTTLED, BLOCKED, RETRY or FATAL for a reviews page response"""
+    status = response.status_code
+    if status == 200:
+        content = response.content
+        if _REVIEWS_PAGE_MARKER not in content:
+            lowered = content.lower()
+            if any(marker in lowered for marker in BLOCK_MARKERS):
+                return BLOCKED
+        return OK
+    if status in (429, 503):
+        return THROTTLED
+    if status == 403:
+        return BLOCKED
+    if status in _RETRY_STATUS:
+        return RETRY
+    return FATAL
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header, given in seconds or as an http date"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter: the n-th retry waits a random time between
+    0 and min(max_delay, base_delay * 2 ** n). A Retry-After sent by the server is a
+    minimum, when it is longer than max_delay the request is given up instead.
+
+    Args:
+        max_attempts: attempts of a request, including the first one
+        base_delay: seconds of the first backoff
+        max_delay: longest backoff in seconds
+    """
+
+    def __init__(
+        self, max_attempts: int = 3, base_delay: float = 1.0, max_delay: float = 60.0
+    ) -> None:
+        self.max_attempts = max(max_attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, retry: int, retry_after: float = None) -> Optional[float]:
+        """Seconds to wait before a retry, None when the request should be given up
+
+        Args:
+            retry: number of the retry, starting at 0
+            retry_after: seconds asked by the server in a Retry-After header
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**retry))
+        if retry_after is not None:
+            if retry_after > self.max_delay:
+                return None
+            delay = max(delay, retry_after)
+        return delay
+
+
+class AimdController:
+    """Adapts the rate of a token bucket to the server: the rate is halved when the
+    server throttles or blocks us (multiplicative decrease) and raised by a small step
+    after every `window` seconds of healthy responses (additive increase).
+
+    A burst of throttled responses, sent before the lower rate took effect, only
+    lowers the rate once per `window`.
+
+    Args:
+        bucket: token bucket spacing the requests
+        min_rate: lowest rate in requests per second
+        max_rate: highest rate in requests per second, the configured rate
+        increase: requests per second added after a healthy window
+        decrease: factor applied to the rate when throttled
+        window: seconds between two rate changes
+    """
+
+    def __init__(
+        self,
+        bucket: TokenBucket,
+        min_rate: float,
+        max_rate: float,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        window: float = 10.0,
+    ) -> None:
+        self.bucket = bucket
+        self.min_rate = min(min_rate, max_rate)
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.window = window
+
+        self.increases = 0
+        self.decreases = 0
+        self.lowest_rate = bucket.rate
+
+        self._lock = threading.Lock()
+        self._last_change = time.monotonic()
+
+    def on_success(self):
+        with self._lock:
+            now = time.monotonic()
+            if self.bucket.rate >= self.max_rate or now - self._last_change < self.window:
+                return
+            self.bucket.set_rate(min(self.max_rate, self.bucket.rate + self.increase))
+            self.increases += 1
+            self._last_change = now
+
+    def on_throttle(self):
+        with self._lock:
+            now = time.monotonic()
+            if self.decreases and now - self._last_change < self.window:
+                return
+            rate = max(self.min_rate, self.bucket.rate * self.decrease)
+            self.bucket.set_rate(rate)
+            self.decreases += 1
+            self.lowest_rate = min(self.lowest_rate, rate)
+            self._last_change = now
+        logger.warning(f"Throttled by the server, rate lowered to {rate:.2f} req/s")
+
+    def log_stats(self, logger: logging.Logger):
+        logger.info(
+            f"Adaptive rate: {self.decreases} decreases, {self.increases} increases, "
+            f"lowest {self.lowest_rate:.2f} req/s, final {self.bucket.rate:.2f} req/s"
+        )
+
+
+def _record_response(metrics: Metrics, response, seconds: float):
+    if getattr(response, "from_cache", False):
+        metrics.inc("requests_total", status="cache")
+        return
+    metrics.inc("requests_total", status=response.status_code)
+    metrics.inc("response_bytes_total", len(response.content))
+    metrics.observe("fetch_seconds", seconds)
+
+
+def fetch_with_retry(
+    transport,
+    url: str,
+    policy: RetryPolicy,
+    rate_limiter: TokenBucket = None,
+    controller: AimdController = None,
+    metrics: Metrics = None,
+) -> Tuple[Optional[object], Optional[str]]:
+    """Requests a reviews page, retrying throttled, blocked and failed requests with the
+    backoff of the policy. Connection errors and timeouts are retried too.
+
+    Args:
+        transport: HttpTransport sending the requests
+        url: url of the page
+        policy: RetryPolicy
+        rate_limiter: token bucket acquired before every retry, the caller acquires
+            the first request
+        controller: AimdController told about every healthy or throttled response
+        metrics: registry of the requests by status, retries, bytes and latencies.
+            Responses served by the cache are counted with the status "cache"
+
+    Returns:
+        (response, None) when the page was fetched, (None, error) otherwise
+    """
+    error = None
+    for attempt in range(policy.max_attempts):
+        if attempt and rate_limiter is not None:
+            rate_limiter.acquire()
+
+        retry_after = None
+        _start = time.time()
+        try:
+            response = transport.get(url)
+        except Exception as ex:
+            outcome = RETRY
+            error = f"{type(ex).__name__}: {ex}"
+            if metrics is not None:
+                metrics.inc("requests_total", status="error")
+        else:
+            outcome = classify_response(response)
+            if metrics is not None:
+                _record_response(metrics, response, time.time() - _start)
+            if outcome == OK:
+                if controller is not None:
+                    controller.on_success()
+                return response, None
+
+            error = f"{outcome} (status {response.status_code})"
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            response.close()
+            if outcome == BLOCKED and transport.cache is not None:
+                # a block page served with a 200 must not be served again by the cache
+                transport.cache.discard(url)
+            if outcome == FATAL:
+                return None, error
+
+        if controller is not None and outcome in (THROTTLED, BLOCKED):
+            controller.on_throttle()
+
+        if attempt + 1 == policy.max_attempts:
+            break
+
+        delay = policy.backoff(attempt, retry_after)
+        if delay is None:
+            error += f", Retry-After of {retry_after:.0f} seconds"
+            break
+        logger.warning(f"Retrying {attempt + 1} in {delay:.1f} seconds: {error} {url}")
+        if metrics is not None:
+            metrics.inc("retries_total", reason=outcome)
+        time.sleep(delay)
+
+    return None, error
@@ -1,34 +1,185 @@
+import collections
 import concurrent.futures
-import csv
+import itertools
 import logging
-import multiprocessing as mp
 import os
-import re
-import string
+import queue
 import sys
 import threading
 import time
 from datetime import datetime
-from typing import List, Union
+from typing import Callable, Iterator, List, Optional, Tuple, Union
 from urllib.parse import parse_qs, urlparse
 
-import numpy as np
 import requests
 import yaml
 from bs4 import BeautifulSoup
-from dateutil import parser
 
+from core.archive import PageArchive
+from core.cache import ResponseCache
 from core.data_models import Config, Input, sort_by_map
+from core.dates import counters_to_stats
+from core.fetch_engine import fetch_async
+from core.hedge import HedgedTransport
+from core.journal import JobJournal
+from core.metrics import PARSE_BUCKETS, PER_REVIEW_BUCKETS, Metrics, open_exporter
+from core.photo_store import PhotoStore
+from core.photos import PhotoDownloader
+from core.parse import ParsedPage, parse_reviews_page, rows_to_reviews
+from core.parser_backends import get_backend
+from core.pipeline import StageStats
+from core.rate_limiter import TokenBucket
+from core.retry import AimdController, RetryPolicy, fetch_with_retry
+from core.sinks import OrderedCsvSink, OrderedSink, ParquetSink, SqliteSink
+from core.transport import HttpTransport
+from core.watermarks import WatermarkStore, parse_review_date
+from core.work_queue import WorkQueue
 
 PROCESS_POOL_SIZE = 5
 safari_user_agent = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Safari/605.1.15"
 headers = {"User-Agent": safari_user_agent}
 
 
+def setup_logger() -> logging.Logger:
+    """Logs to the console and to logs/<job_id>.log"""
+    if not os.path.isdir("logs"):
+        os.mkdir("logs")
+
+    # Create a file handler
+    file_path = f"logs/{os.getenv('job_id')}.log"
+    frmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
+
+    # Log to console
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setLevel(logging.INFO)
+    console_formatter = logging.Formatter(frmt)
+    console_handler.setFormatter(console_formatter)
+
+    # Log to file
+    file_handler = logging.FileHandler(file_path)
+    file_handler.setLevel(logging.INFO)
+    file_formatter = logging.Formatter(frmt)
+    file_handler.setFormatter(file_formatter)
+
+    logger.addHandler(console_handler)
+    logger.addHandler(file_handler)
+
+    return logger
+
+
+def load_config() -> Config:
+    """Loads config.yml"""
+    config = None
+    with open("config.yml", "r") as file:
+        config: dict = yaml.safe_load(file)
+
+    config = Config(**config)
+    return config
+
+
+def build_transport(
+    config: Config, rate_limiter: TokenBucket = None
+) -> Union[HttpTransport, HedgedTransport]:
+    """Pooled keep-alive client for the review pages, with the response cache of
+    CACHE_DIR if one is set, and hedging the slow requests with HEDGE_REQUESTS
+
+    Args:
+        config: loaded config.yml
+        rate_limiter: token bucket of the page requests, the hedges take their tokens
+            from it
+    """
+    cache = None
+    if config.CACHE_DIR:
+        cache = ResponseCache(
+            config.CACHE_DIR, ttl=config.CACHE_TTL, max_bytes=config.CACHE_MAX_BYTES
+        )
+
+    transport = HttpTransport(
+        pool_connections=config.POOL_CONNECTIONS,
+        pool_maxsize=config.POOL_MAXSIZE,
+        http2=config.HTTP2,
+        headers=headers,
+        cache=cache,
+        timeout=(config.CONNECT_TIMEOUT, config.READ_TIMEOUT),
+    )
+    if config.HEDGE_REQUESTS:
+        # the first requests and their hedges both run on the pool of the hedger
+        return HedgedTransport(
+            transport,
+            budget=config.HEDGE_BUDGET,
+            max_workers=2 * config.POOL_MAXSIZE,
+            rate_limiter=rate_limiter,
+        )
+    return transport
+
+
+def build_retry_policy(config: Config) -> RetryPolicy:
+    """Backoff of the review page requests, MAX_RETIES attempts per page"""
+    return RetryPolicy(
+        config.MAX_RETIES, config.RETRY_BASE_DELAY, config.RETRY_MAX_DELAY
+    )
+
+
+def build_rate_controller(config: Config, bucket: TokenBucket) -> Optional[AimdController]:
+    """Controller adapting the rate of bucket between MIN_REQUESTS_PER_SECOND and
+    REQUESTS_PER_SECOND, None when ADAPTIVE_RATE is off
+
+    Args:
+        config: loaded config.yml
+        bucket: token bucket of the review page requests
+    """
+    if not config.ADAPTIVE_RATE:
+        return None
+    return AimdController(
+        bucket, config.MIN_REQUESTS_PER_SECOND, config.REQUESTS_PER_SECOND
+    )
+
+
 class Scrape:
     def __init__(
-        self, input: dict, save_data_to_disk=True, logger=None, is_gui=False
+        self,
+        input: dict,
+        save_data_to_disk=True,
+        logger=None,
+        is_gui=False,
+        keep_results=True,
+        transport: Union[HttpTransport, HedgedTransport] = None,
+        parse_pool: concurrent.futures.ProcessPoolExecutor = None,
+        rate_limiter: TokenBucket = None,
+        resume: bool = False,
+        rate_controller: AimdController = None,
+        metrics: Metrics = None,
     ) -> None:
+        """
+        Args:
+            input: input parameters, see core.data_models.Input
+            save_data_to_disk: stream the reviews to a csv file in the output directory
+            logger: logger to use instead of the default one
+            is_gui: whether the scraper is run from the GUI
+            keep_results: when False, and the reviews are saved to disk, run() returns an
+                empty list and the reviews are only kept in the csv file, so memory use
+                does not grow with the number of reviews. The number of reviews is in
+                self.n_reviews
+            transport: HttpTransport shared with other scrapers, e.g. by a batch. A new
+                one is created by build_transport when None
+            parse_pool: pool of parse processes shared with other scrapers
+            rate_limiter: token bucket shared with other scrapers, it spaces the page
+                requests of all of them. Each fetch uses its own bucket when None
+            resume: resume the interrupted job with the id of the job_id environment
+                variable: only the pages missing from its journal are scraped and the
+                reviews are appended to its outputs. See core.journal
+            rate_controller: AimdController of the shared rate_limiter. With
+                ADAPTIVE_RATE and no controller, the scraper adapts the rate of its
+                own bucket
+            metrics: registry shared with other scrapers, see core.metrics. When None,
+                the scraper records its own metrics, exports them with METRICS_FILE and
+                METRICS_PORT, and saves their JSON summary to metrics_<sort_by>.json
+
+        The shared transport, parse pool and rate limiter are not closed by run().
+        """
         self.is_gui = is_gui  # Store GUI mode flag
 
         if "job_id" not in os.environ:
@@ -42,11 +193,88 @@ class Scrape:
         self._config = self._load_config()
         self.input_params = Input(**input)
 
-        # Use a normal list instead of mp.Manager().list() for GUI mode
-        self._parsed_pages_reviews = [] if is_gui else mp.Manager().list()
+        # incremental runs scrape the newest reviews until the ones seen by the last run
+        self._watermark = None
+        if self.input_params.incremental:
+            if self.input_params.sort_by != "newest_first":
+                self.logger.info("Incremental mode: sorting reviews by newest_first")
+                self.input_params.sort_by = "newest_first"
+
+            self._watermarks = WatermarkStore(
+                os.path.join(self._config.STATE_DIR, "watermarks.json")
+            )
+            self._watermark_key = WatermarkStore.key(
+                self.input_params.country,
+                self.input_params.hotel_name,
+                self.input_params.sort_by,
+            )
+            self._watermark = self._watermarks.get(self._watermark_key)
+            if self._watermark:
+                self._seen_fingerprints = set(self._watermark["fingerprints"])
+                self._watermark_date = parse_review_date(
+                    self._watermark["newest_date"]
+                )
+                self.logger.info(
+                    f"Incremental mode: newest review of the last run {self._watermark['newest_date']}"
+                )
+            else:
+                self.logger.info("Incremental mode: no previous run, scraping all reviews")
 
-        # Use threading.Event instead of mp.Event for GUI mode
-        self._execution_finished = threading.Event() if is_gui else mp.Event()
+        self._resume = resume
+        if resume and not self._is_full_scrape():
+            raise ValueError(
+                "Only the jobs scraping all the reviews can be resumed: n_rows, stop "
+                "criteria and incremental mode are not supported"
+            )
+        if resume and not save_data_to_disk:
+            raise ValueError("Resuming a job needs save_data_to_disk")
+
+        # fail early when the library of the parser backend is not installed
+        get_backend(self._config.PARSER_BACKEND)
+        if "parquet" in self._config.OUTPUT_FORMATS:
+            ParquetSink.check_installed()
+
+        # parsed pages are returned to this process by the parse pool
+        self._parsed_pages_reviews = []
+        self._pages_done = 0  # parsed pages, for the progress thread
+        self._reviews_parsed = 0
+        self._first_page_reviews = []  # newest reviews for the watermark, if not kept
+        self._sinks = []  # OrderedSink per output format, when saving to disk
+        self._photos = None  # PhotoDownloader, when saving to disk with download_photos
+        self.n_reviews = 0  # reviews found by run()
+        self.n_pages = 0  # reviews pages planned by run()
+        self._execution_finished = threading.Event()
+        self._parse_pool = parse_pool
+        self._owns_parse_pool = parse_pool is None
+        self._rate_limiter = rate_limiter
+        self._retry_policy = build_retry_policy(self._config)
+        self._owns_rate_controller = rate_controller is None
+        if rate_controller is None and self._config.ADAPTIVE_RATE:
+            # the rate can only adapt if all the page requests take from one bucket
+            if self._rate_limiter is None:
+                self._rate_limiter = TokenBucket(
+                    self._config.REQUESTS_PER_SECOND, self._config.RATE_LIMIT_BURST
+                )
+            rate_controller = build_rate_controller(self._config, self._rate_limiter)
+        self._rate_controller = rate_controller
+        if self._rate_limiter is None and transport is None and self._config.HEDGE_REQUESTS:
+            # the hedges are only sent when this bucket has a spare token
+            self._rate_limiter = TokenBucket(
+                self._config.REQUESTS_PER_SECOND, self._config.RATE_LIMIT_BURST
+            )
+        self._owns_metrics = metrics is None
+        self.metrics = metrics or Metrics()
+        self.metrics_summary = None  # JSON summary of the metrics, set by run()
+        self._exporter = None  # MetricsExporter, when the metrics are owned
+        self._lock = threading.Lock()
+        self._parse_queue = 0  # pages submitted to the parse pool, not parsed yet
+        self._date_counters = [0, 0, 0]  # summed ReviewDateParser counters
+        self._prefetch_stats = None  # set by conditional scraping with PREFETCH_WINDOW
+        self._probe_page = None  # first reviews page, fetched by the pagination probe
+        self._page_size = self._config.MAX_PAGE_SIZE  # reviews per page, see _get_max_offset_parameter
+        self._archive = None  # PageArchive of the raw pages, when ARCHIVE_PAGES is on
+        self._journal = None  # JobJournal of the full scraping modes, when saving to disk
+        self._resume_run = 0  # runs of the job before this one, when resuming
 
         st_ = ""
         for key, value in self.input_params.model_dump().items():
@@ -60,32 +288,19 @@ class Scrape:
             os.getenv("job_id")
         )
         self._save_data_to_disk = save_data_to_disk
+        self._keep_results = keep_results or not save_data_to_disk
 
-    def _get_logger(self):
-        if not os.path.isdir("logs"):
-            os.mkdir("logs")
-
-        # Create a file handler
-        file_path = f"logs/{os.getenv('job_id')}.log"
-        frmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-
-        logger = logging.getLogger()
-        logger.setLevel(logging.INFO)
-
-        # Log to console
-        console_handler = logging.StreamHandler(sys.stdout)
-        console_handler.setLevel(logging.INFO)
-        console_formatter = logging.Formatter(frmt)
-        console_handler.setFormatter(console_formatter)
+        # one pooled keep-alive client for the review pages
+        self._owns_transport = transport is None
+        self._transport = transport or build_transport(self._config, self._rate_limiter)
 
-        # Log to file
-        file_handler = logging.FileHandler(file_path)
-        file_handler.setLevel(logging.INFO)
-        file_formatter = logging.Formatter(frmt)
-        file_handler.setFormatter(file_formatter)
+    def _get_logger(self):
+        self.logger = setup_logger()
 
-        logger.addHandler(console_handler)
-        logger.addHandler(file_handler)
+    @property
+    def pages_done(self) -> int:
+        """Number of reviews pages parsed so far"""
+        return self._pages_done
 
     def _progress_thread_start(self, ls_urls: List[dict]):
         """It will keep printing the overall progress
@@ -95,86 +310,200 @@ class Scrape:
         """
         self.logger.info("Progress Monitoring Thread Started")
         prev = 0
-        while not self._execution_finished.is_set():
-            time.sleep(2)
-            if len(self._parsed_pages_reviews):
-                ln = len(self._parsed_pages_reviews)
+        while not self._execution_finished.wait(2):
+            self._update_gauges()
+            if self._pages_done:
+                ln = self._pages_done
                 if ln > prev:
                     self.logger.info(f"Processed {ln}/{len(ls_urls)}")
                     prev = ln
 
-    def _save_local_files(
-        self,
-        ls_reviews: List[dict] = None,
-    ):
-        """save local csv files. It creates a directory based on "entity_name" and stores
-        two csv files in it.
-
-        - reviews.csv: contains reviews
+    def _update_gauges(self):
+        """Sets the gauges of the hotel: pages, queue depths and request rate"""
+        hotel = self.input_params.hotel_name
+        self.metrics.set("pages_planned", self.n_pages, hotel=hotel)
+        self.metrics.set("pages_done", self._pages_done, hotel=hotel)
+        self.metrics.set("parse_queue_pages", self._parse_queue, hotel=hotel)
+        self.metrics.set(
+            "reorder_buffer_pages",
+            max((sink.pending_pages for sink in self._sinks), default=0),
+            hotel=hotel,
+        )
+        photos = self._photos
+        self.metrics.set("photo_queue", photos.pending if photos else 0, hotel=hotel)
+        if self._rate_limiter is not None:
+            self.metrics.set("request_rate", self._rate_limiter.rate, hotel=hotel)
+
+    def _open_sinks(self, ls_urls: List[dict]) -> List[OrderedSink]:
+        """Opens the outputs selected by OUTPUT_FORMATS. The reviews are written in page
+        order, as soon as the pages are parsed.
+
+        - csv: creates a directory based on "entity_name" and appends the reviews to
+          reviews_<sort_by>.csv in it
+        - parquet: writes the reviews to the reviews_parquet dataset of OUTPUT_DIR,
+          partitioned by hotel and review month
+        - sqlite: upserts the reviews into the SQLITE_PATH database, reviews.sqlite in
+          OUTPUT_DIR by default
 
         Args:
-            ls_reviews: list of review objects
-
+            ls_urls: list containing url and idx/offset_param of each reviews page
         """
+        order = [url_dict["idx"] for url_dict in ls_urls]
+        sinks = []
+
+        if "csv" in self._config.OUTPUT_FORMATS:
+            dir_path = self._LOCAL_OUTPUT_PATH.format(
+                output_dir=self._config.OUTPUT_DIR,
+                entity_name=self.input_params.hotel_name,
+            )
+            sinks.append(
+                OrderedCsvSink(
+                    f"{dir_path}/reviews_{self.input_params.sort_by}.csv",
+                    order,
+                    batch_rows=self._config.CSV_BATCH_ROWS,
+                )
+            )
+
+        if "parquet" in self._config.OUTPUT_FORMATS:
+            file_name = f"{os.getenv('job_id')}_{self.input_params.sort_by}"
+            sinks.append(
+                ParquetSink(
+                    f"{self._config.OUTPUT_DIR}/reviews_parquet",
+                    self.input_params.hotel_name,
+                    # a resumed run never overwrites the files of the earlier runs
+                    f"{file_name}_resume{self._resume_run}" if self._resume else file_name,
+                    order,
+                    batch_rows=self._config.PARQUET_BATCH_ROWS,
+                    stale_prefix=file_name if self._resume else None,
+                )
+            )
+
+        if "sqlite" in self._config.OUTPUT_FORMATS:
+            sinks.append(
+                SqliteSink(
+                    self._config.SQLITE_PATH
+                    or f"{self._config.OUTPUT_DIR}/reviews.sqlite",
+                    os.getenv("job_id"),
+                    order,
+                    batch_rows=self._config.SQLITE_BATCH_ROWS,
+                )
+            )
+
+        for sink in sinks:
+            sink.metrics = self.metrics
+        return sinks
+
+    def _is_full_scrape(self) -> bool:
+        """True when all the reviews are scraped, without any condition to stop early"""
+        return (
+            self.input_params.n_rows == -1
+            and self.input_params.stop_critera is None
+            and not self.input_params.incremental
+        )
+
+    def _journal_path(self) -> str:
         dir_path = self._LOCAL_OUTPUT_PATH.format(
             output_dir=self._config.OUTPUT_DIR, entity_name=self.input_params.hotel_name
         )
+        return f"{dir_path}/journal_{self.input_params.sort_by}.jsonl"
 
-        if not os.path.exists(dir_path) and (ls_reviews):
-            os.makedirs(dir_path)
+    def _open_journal(self, ls_urls: List[dict]) -> JobJournal:
+        """Opens the journal of the job, the sinks report the pages they saved to it"""
+        path = self._journal_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
 
-        fname = f"{dir_path}/reviews_{self.input_params.sort_by}.csv"
+        journal = JobJournal(path, len(self._sinks))
+        if self._resume:
+            journal.resume(len(ls_urls))
+        else:
+            journal.plan(self.input_params.model_dump(), self._page_size, ls_urls)
 
-        if ls_reviews:
-            write_header = True
-            if os.path.exists(fname):
-                write_header = False
+        for sink in self._sinks:
+            sink.on_saved = journal.pages_saved
+        return journal
 
-            with open(fname, "a", newline="", encoding="utf-8") as file:
-                try:
-                    writer = csv.writer(file)
-                    if write_header:
-                        writer.writerow(ls_reviews[0].keys())
-                    for row in ls_reviews:
-                        writer.writerow(row.values())
+    def _resume_urls(self) -> List[dict]:
+        """Returns the pages of the interrupted job which are not saved yet, from the
+        page plan of its journal. The plan is reused, no pagination probe is sent
+        """
+        job_id = os.getenv("job_id")
+        path = self._journal_path()
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No journal for job {job_id}: {path}")
+
+        state = JobJournal.load(path)
+        for key in ("hotel_name", "country", "sort_by"):
+            if state["input"][key] != getattr(self.input_params, key):
+                raise ValueError(
+                    f"Job {job_id} scraped {key}={state['input'][key]}, not {getattr(self.input_params, key)}"
+                )
 
-                except Exception as ex:
-                    self.logger.error(ex)
+        self._page_size = state["page_size"]
+        self._resume_run = state["runs"]
+        ls_urls = [page for page in state["pages"] if page["idx"] not in state["done"]]
+        self.logger.info(
+            f"Resuming job {job_id}: {len(state['done'])}/{len(state['pages'])} pages already "
+            f"saved, {len(state['failed'])} failed pages retried, {len(ls_urls)} pages left"
+        )
+        return ls_urls
 
     def _load_config(self) -> Config:
         """Loads config.yml"""
-        config = None
-        with open("config.yml", "r") as file:
-            config: dict = yaml.safe_load(file)
+        return load_config()
 
-        config = Config(**config)
-        return config
+    def _get_rate_limiter(self) -> TokenBucket:
+        """Token bucket of the page requests: the shared one, or a new one per fetch"""
+        if self._rate_limiter is not None:
+            return self._rate_limiter
+        return TokenBucket(self._config.REQUESTS_PER_SECOND, self._config.RATE_LIMIT_BURST)
 
     ##########################################################
     # ******** Scraping Logic Methods ********
     ##########################################################
 
+    @staticmethod
+    def _offset_from_href(href: str) -> Optional[int]:
+        """Returns the value of the offset parameter of a pagination link"""
+        offset = parse_qs(urlparse(href).query).get("offset")
+        if not offset:
+            return None
+        offset = offset[0].split(";")[0]
+        return int(offset) if offset.isdigit() else None
+
     def _get_max_offset_parameter(self) -> int:
         """Returns the maximum value of offset parameter based on the total number of pages in the html.
-        Offset parameter controls the page number. Page 1 has offset = 0 or no value. Page 2 will have offset=10
-        then Page 3 will have offset=20 and so on.
+        Offset parameter controls the page number. Page 1 has offset = 0 or no value. With a page size
+        of 10, Page 2 will have offset=10 then Page 3 will have offset=20 and so on.
+
+        The probe asks for MAX_PAGE_SIZE reviews per page. If the server honors fewer rows, or the
+        page looks truncated, the page size falls back to the number of rows the server returned
+        (or 10 when that is less than 10). The page size is stored in self._page_size.
 
         Returns:
             value of offset parameter. 0 when there is only one review page
         """
         self.logger.info("Checking max offset parameter value")
 
-        r = requests.get(
-            self._config.HOTEL_REVIEWS_PAGE,
-            params={
-                "cc1": self.input_params.country,
-                "pagename": self.input_params.hotel_name,
-                "rows": 10,
-            },
-            headers=headers,
+        # the probe requests exactly the first page of the target sort order,
+        # so its response is reused as page 0 instead of fetching it again
+        requested_size = self._page_size = self._config.MAX_PAGE_SIZE
+        url = self._page_url(0)
+        if self._rate_limiter is not None:
+            self._rate_limiter.acquire()
+        r, error = fetch_with_retry(
+            self._transport,
+            url,
+            self._retry_policy,
+            self._rate_limiter,
+            self._rate_controller,
+            self.metrics,
         )
+        if r is None:
+            raise RuntimeError(f"Failed to fetch the first reviews page: {error}")
+        self._probe_page = {"idx": 0, "url": url, "response": r}
 
         soup = BeautifulSoup(r.content.decode(), "html.parser")
+        n_reviews = len(soup.select("ul.review_list > li"))
         a_elements_with_span = [
             a
             for a in soup.select(
@@ -186,26 +515,43 @@ class Scrape:
         # If there are more than one pages. It means we should have the offset parameter
         if a_elements_with_span:
             if a_elements_with_span[-1].has_attr("href"):
-                # get the href from the a element
-
-                # Parse the URL
-                parsed_url = urlparse(a_elements_with_span[-1]["href"])
-
-                # Extract the query parameters as a dictionary
-                query_parameters = parse_qs(parsed_url.query)
-
-                offset: str = query_parameters["offset"]
-                if isinstance(offset, list):
-                    offset = offset[0]
-                if ";" in offset:
-                    offset = offset.split(";")[0]
+                # get the href from the a element and extract the offset parameter
+                offset = self._offset_from_href(a_elements_with_span[-1]["href"])
+                if offset is None:
+                    self.logger.error(
+                        f"Offset paramter is missing or non-digit: {a_elements_with_span[-1]['href']}"
+                    )
+                    return 0
+
+                # the smallest non-zero offset of the page links is the page size used by the server
+                page_offsets = [
+                    self._offset_from_href(a["href"])
+                    for a in a_elements_with_span
+                    if a.has_attr("href")
+                ]
+                server_size = min([o for o in page_offsets if o], default=n_reviews)
+
+                if n_reviews < min(server_size, requested_size) or server_size < 10:
+                    self.logger.warning(
+                        f"Reviews page looks truncated ({n_reviews} reviews), using a page size of 10"
+                    )
+                    self._page_size = 10
+                elif server_size < requested_size:
+                    self.logger.info(
+                        f"Server honors at most {server_size} reviews per page"
+                    )
+                    self._page_size = server_size
 
-                if not offset.isdigit():
-                    self.logger.error(f"Offset paramter is non-digit: {offset}")
+                if self._page_size != server_size:
+                    # re-align the last offset on the new page size
+                    offset = ((offset + server_size - 1) // self._page_size) * self._page_size
 
+                self.logger.info(
+                    f"Page size: {self._page_size} reviews (requested {requested_size})"
+                )
                 self.logger.info(f"Offset parameter max value: {offset}")
 
-                return int(offset)
+                return offset
             else:
                 self.logger.error(
                     f"Page number link <a> does not have href attribute: {a_elements_with_span[-1]}"
@@ -217,6 +563,28 @@ class Scrape:
 
         return 0
 
+    def _page_url(self, offset: int) -> str:
+        """Returns the url of the reviews page starting at the given offset
+
+        Args:
+            offset: value of the offset parameter, 0 for the first page
+        """
+        params = {
+            "cc1": self.input_params.country,
+            "pagename": self.input_params.hotel_name,
+            "rows": self._page_size,
+            "sort": sort_by_map[self.input_params.sort_by],
+        }
+        # when offset=0 we really don't need its value
+        if offset:
+            params["offset"] = offset
+
+        return (
+            requests.Request("GET", self._config.HOTEL_REVIEWS_PAGE, params=params)
+            .prepare()
+            .url
+        )
+
     def _create_urls(self):
         """It creates list of urls of review pages based on the total reivews
         number of reviews.
@@ -230,393 +598,324 @@ class Scrape:
 
         # ********** BASED ON TOTAL REVIEW PAGES: CREATE LIST OF URLS TO SCRAPE **********
 
-        sort_by = sort_by_map[self.input_params.sort_by]
-
         offset_counter = 0
-        params = {
-            "cc1": self.input_params.country,
-            "pagename": self.input_params.hotel_name,
-            "rows": 10,
-            "sort": sort_by,
-        }
-
         while offset_counter <= param_offset_max:
-            # when offset_counter=0 we really don't need its value
-            if offset_counter:
-                params["offset"] = offset_counter
-
-            url = (
-                requests.Request("GET", self._config.HOTEL_REVIEWS_PAGE, params=params)
-                .prepare()
-                .url
-            )
-            ls_urls.append({"idx": offset_counter, "url": url})
-            offset_counter += 10
+            ls_urls.append({"idx": offset_counter, "url": self._page_url(offset_counter)})
+            offset_counter += self._page_size
 
         self.logger.info(f"Created URLs: {len(ls_urls)}")
         return ls_urls
 
+    def _split_probe_page(self, ls_urls: List[dict]) -> Tuple[Optional[dict], List[dict]]:
+        """Takes out the page that was already fetched by the pagination probe
+
+        Args:
+            ls_urls: list containing url and idx/offset_param of each reviews page
+
+        Returns:
+            ({"idx", "response"} of the probe or None, urls which still have to be fetched)
+        """
+        probe = self._probe_page
+        if probe is None:
+            return None, ls_urls
+
+        for i, url_dict in enumerate(ls_urls):
+            if url_dict["url"] == probe["url"]:
+                self._probe_page = None  # used once
+                self.logger.info("Reusing the pagination probe response as page 0")
+                return (
+                    {"idx": url_dict["idx"], "response": probe["response"], "error": None},
+                    ls_urls[:i] + ls_urls[i + 1 :],
+                )
+
+        return None, ls_urls
+
     def _scrape(self, url_dict: dict) -> dict:
-        """Returns the response of the the passed url
+        """Returns the response of the the passed url. Throttled, blocked and failed
+        requests are retried with backoff, see core.retry
 
         Args:
             url_dict: dict containing the urls and idx/offset_param of the current url/page
 
         Returns:
-            response object
+            {"idx", "response", "error"} dict. response is None when the page could not
+            be fetched, error says why
         """
-        response = None
         url = url_dict["url"]  # url of the reviews page
         idx = url_dict["idx"]  # orginal offset_param value / id of reviews page
 
-        retry_count = 1
-        while retry_count <= self._config.MAX_RETIES:
-            response = requests.get(url, headers=headers)
+        response, error = fetch_with_retry(
+            self._transport,
+            url,
+            self._retry_policy,
+            self._rate_limiter,
+            self._rate_controller,
+            self.metrics,
+        )
+        return {"idx": idx, "response": response, "error": error}
 
-            if response.status_code == 200:
-                break
+    def _get_parse_pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        """Returns the persistent pool of parse processes, starting it on first use"""
+        if self._parse_pool is None:
+            self._parse_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=PROCESS_POOL_SIZE
+            )
+            self.logger.info(f"Parse processes launched: {PROCESS_POOL_SIZE}")
+        return self._parse_pool
 
-            else:
-                self.logger.warning(f"Retrying {retry_count} ... {url}")
-                retry_count += 1
-                continue
+    def _open_archive(self) -> PageArchive:
+        """Opens the archive of the raw reviews pages of the job, in the job output directory"""
+        dir_path = self._LOCAL_OUTPUT_PATH.format(
+            output_dir=self._config.OUTPUT_DIR, entity_name=self.input_params.hotel_name
+        )
+        os.makedirs(dir_path, exist_ok=True)
+
+        path = f"{dir_path}/pages_{self.input_params.sort_by}.archive"
+        self.logger.info(f"Archiving the raw reviews pages to {path}")
+        return PageArchive(
+            path,
+            {
+                "hotel_name": self.input_params.hotel_name,
+                "country": self.input_params.country,
+                "sort_by": self.input_params.sort_by,
+                "page_size": self._page_size,
+                "job_id": os.getenv("job_id"),
+                "created": datetime.now().isoformat(timespec="seconds"),
+            },
+        )
 
-        return {"idx": idx, "response": response}
+    def _archive_page(self, response_dict: dict):
+        """Appends the raw html of a fetched page to the archive, if archiving is on"""
+        if self._archive is not None and response_dict["response"] is not None:
+            self._archive.append(
+                response_dict["idx"], response_dict["response"].content
+            )
 
-    def _validate(self, element):
-        """
-        Removes multitples spaces and strips \n
+    def _submit_parse(self, response_dict: dict) -> concurrent.futures.Future:
+        """Sends the raw html of a page to the parse pool. Every page is a separate
+        task, so idle processes pick up the next page as soon as they are done.
 
         Args:
-            element: Beautiful Soap element
+            response_dict: {"idx", "response"} dict returned by _scrape
 
         Returns:
-            string text extracted from element
+            future of a ParsedPage, failed when the page could not be fetched
         """
-        if element is not None:
-            if isinstance(element, str):
-                text = re.sub(r"\s+", " ", element).strip(" \n")
-            else:
-                text = re.sub(r"\s+", " ", element.text).strip(" \n")
-            if len(text):
-                return text
+        if response_dict["response"] is None:
+            future = concurrent.futures.Future()
+            future.set_exception(RuntimeError(response_dict["error"]))
+            return future
+
+        self._archive_page(response_dict)
+        with self._lock:
+            self._parse_queue += 1
+        future = self._get_parse_pool().submit(
+            parse_reviews_page,
+            response_dict["response"].content,
+            response_dict["idx"],
+            self.input_params.hotel_name,
+            self._config.PARSER_BACKEND,
+        )
+        future.add_done_callback(self._parse_done)
+        return future
 
-        return None
+    def _parse_done(self, future: concurrent.futures.Future):
+        with self._lock:
+            self._parse_queue -= 1
 
-    def _parse_scraped_results(
-        self, ls_response: List[dict]
-    ) -> Union[List[dict], None]:
-        """Takes response objects containing html content of a single reviews pages, and parses the data
+    def _collect_parsed(self, parsed: ParsedPage) -> dict:
+        """Turns a parsed page back into review dicts and downloads the photos
 
         Args:
-            ls_response: list of dicts with page-idx and response objects with html { idx and requests.Response object}
-            shared_ls_results: process safe list for appending resutlts
+            parsed: result of parse_reviews_page
 
         Returns:
-            None when shared list is passed, otherwise [ {idx of the review page, list of reviews in that page}, ... ]
+            {"idx": idx of the review page, "reviews": list of reviews in that page}
         """
+        page_reviews = rows_to_reviews(parsed.rows)
+        self._date_counters = [
+            a + b for a, b in zip(self._date_counters, parsed.date_counters)
+        ]
 
-        pages_reviews = []
-
-        for (
-            response_dict
-        ) in ls_response:  # iterate on the response objects of review pages
-            page_reviews = []
-            idx = response_dict["idx"]
-            response: requests.Response = response_dict[
-                "response"
-            ]  # current response object
-
-            soup = BeautifulSoup(response.content.decode(), "html.parser")
-            reviews = soup.select("ul.review_list > li")
-
-            # Debug: Check raw HTML for photos in the first review
-            # if len(reviews) > 0:
-            #     self.logger.info("Debugging reviews HTML:")
-            #     self.logger.info(reviews[0])
-
-            for i in range(
-                len(reviews)
-            ):  # iterate on the review items of the current page
-                review = reviews[i]
-                username = self._validate(
-                    review.select_one(
-                        "div.c-review-block__guest span.bui-avatar-block__title"
-                    )
-                )  # .text.strip(' \n')
-                user_country = self._validate(
-                    review.select_one(
-                        "div.c-review-block__guest span.bui-avatar-block__subtitle"
-                    )
-                )  # .text.strip(' \n')
-                room_view = self._validate(
-                    review.select_one(
-                        "div.c-review-block__room-info-row div.bui-list__body"
-                    )
-                )  # .text.strip(' \n')
-
-                stay_duration = self._validate(
-                    review.select_one("ul.c-review-block__stay-date div.bui-list__body")
-                )
-                stay_duration = (
-                    stay_duration.split(" ·")[0] if stay_duration is not None else None
-                )
-
-                stay_type = self._validate(
-                    review.select_one(
-                        "ul.review-panel-wide__traveller_type div.bui-list__body"
-                    )
-                )  # .text.strip(' \n')
-                review_title = self._validate(
-                    review.select_one("h3.c-review-block__title")
-                )  # .text.strip(' \n')
-
-                # Use a lambda function to find the element with inner text containing "Received"
-                date = self._validate(
-                    review.find(
-                        lambda tag: tag.name == "span" and "Reviewed:" in tag.get_text()
+        # Queue the photos for download if any were found and photo downloading is enabled
+        photos = {}  # review_id -> future of the local paths of the saved photos
+        if self._photos is not None:
+            for review in page_reviews:
+                if review["review_photos"]:
+                    future = self._photos.submit(review["review_id"], review["review_photos"])
+                    future.add_done_callback(
+                        lambda f, review=review: review.__setitem__(
+                            "local_photo_paths", f.result()
+                        )
                     )
-                )
-
-                if date:
-                    date = date.split(":")[-1].strip()
-                    date = parser.parse(date).strftime("%m-%d-%Y %H:%M:%S")
-
-                rating = self._validate(
-                    review.select_one("div.bui-review-score__badge")
-                )  # .text.strip(' \n')
-                rating = float(rating) if rating is not None else rating
-                review_text = review.select("div.c-review span.c-review__body")
-
-                review_text_liked = None
-                review_text_disliked = None
-                original_lang = None
-                full_review, en_full_review = None, None
-                if review_text:
-                    review_text_liked = self._validate(review_text[0])
-                    if (
-                        "There are no comments available for this review".lower()
-                        in review_text_liked.lower()
-                    ):
-                        review_text_liked = None
-                    original_lang = review_text[0].get("lang", default=None)
-
-                    if len(review_text) > 1:
-                        review_text_disliked = self._validate(review_text[1])
-                        if review_text_disliked is None:
-                            if len(review_text) > 2:
-                                review_text_disliked = self._validate(review_text[2])
-
-                # Add '.' period sign to the end of each part of the review. If its not already there
-                t_title = f"title: {review_title}" if review_title else ""
-                t_title = (
-                    f"{t_title}."
-                    if t_title and t_title[-1] not in string.punctuation
-                    else t_title
-                )
-
-                t_liked = f"liked: {review_text_liked}" if review_text_liked else ""
-                t_liked = (
-                    f"{t_liked}."
-                    if t_liked and t_liked[-1] not in string.punctuation
-                    else t_liked
-                )
-
-                t_disliked = (
-                    f"disliked: {review_text_disliked}" if review_text_disliked else ""
-                )
-                t_disliked = (
-                    f"{t_disliked}."
-                    if t_disliked and t_disliked[-1] not in string.punctuation
-                    else t_disliked
-                )
+                    photos[review["review_id"]] = future
+
+        self._pages_done += 1
+        self._reviews_parsed += len(page_reviews)
+        self.metrics.inc("pages_parsed_total")
+        self.metrics.inc("reviews_parsed_total", len(page_reviews))
+        self.metrics.observe("parse_seconds", parsed.parse_time, PARSE_BUCKETS)
+        if page_reviews:
+            self.metrics.observe(
+                "parse_seconds_per_review",
+                parsed.parse_time / len(page_reviews),
+                PER_REVIEW_BUCKETS,
+            )
 
-                full_review = f"{t_title} {t_liked} {t_disliked}"
-                full_review = self._validate(full_review)
-                # ------------------------------------------------
+        # idx: orginal offset_param value / id of reviews page
+        # reviews: list of reviews found on the page
+        # photos: futures of the photos of the reviews, see _add_to_sinks
+        page = {"idx": parsed.idx, "reviews": page_reviews, "photos": photos}
+        return page
 
-                if "en" in original_lang:
-                    en_full_review = full_review
+    def _add_to_sinks(self, idx: int, reviews: List[dict], photos: dict):
+        """Hands the reviews of a page over to the sinks once their photos are
+        downloaded, so local_photo_paths only lists the photos which were saved. The
+        sinks put the pages back in order
 
-                found_helpful = self._validate(
-                    review.select_one(
-                        "div.c-review-block__row--helpful-vote p.review-helpful__vote-others-helpful"
-                    )
-                )
+        Args:
+            idx: orginal offset_param value / id of reviews page
+            reviews: reviews of the page to save
+            photos: review_id -> future of the saved photos, see _collect_parsed
+        """
+        futures = [photos[r["review_id"]] for r in reviews if r["review_id"] in photos]
+        remaining = [len(futures)]
+
+        def on_done(_):
+            with self._lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            for sink in self._sinks:
+                sink.add(idx, reviews)
+
+        if not futures:
+            for sink in self._sinks:
+                sink.add(idx, reviews)
+        for future in futures:
+            future.add_done_callback(on_done)
+
+    def _keep_page(self, page: dict):
+        """Hands a page of the full scraping modes over to the csv sink, and keeps it
+        for the results of run() unless keep_results is False
+        """
+        self._add_to_sinks(page["idx"], page["reviews"], page["photos"])
 
-                found_helpful = (
-                    0
-                    if found_helpful is None
-                    else int(
-                        found_helpful.split("people")[0].strip()
-                        if "people" in found_helpful
-                        else found_helpful.split("person")[0].strip()
-                    )
-                )
-                found_unhelpful = self._validate(
-                    review.select_one(
-                        "div.c-review-block__row--helpful-vote p.--unhelpful"
-                    )
-                )
-                found_unhelpful = (
-                    0
-                    if found_unhelpful is None
-                    else int(
-                        found_unhelpful.split("people")[0].strip()
-                        if "people" in found_unhelpful
-                        else found_unhelpful.split("person")[0].strip()
-                    )
-                )
+        if self._keep_results:
+            self._parsed_pages_reviews.append(page)
+        elif page["idx"] == 0:
+            self._first_page_reviews = page["reviews"]
 
-                owner_response = review.select(
-                    "div.c-review-block__response span.c-review-block__response__body"
-                )
-                if owner_response:
-                    owner_response = self._validate(owner_response[-1])
-                else:
-                    owner_response = None
-
-                # Extract review photos URLs and download them
-                photos_urls = []
-                photos_ul = review.find("ul", class_="c-review-block__photos")
-                # self.logger.info(f"Review photos UL found: {photos_ul is not None}")
-                if photos_ul:
-                    photo_buttons = photos_ul.find_all(
-                        "button", class_="c-review-block__photos__button"
-                    )
-                    self.logger.info(f"Found {len(photo_buttons)} photo buttons")
-                    for button in photo_buttons:
-                        photo_url = button.get("data-photos-src", "")
-                        if photo_url and "max1280x900" in photo_url:
-                            photos_urls.append(photo_url)
-                            self.logger.info(f"Added photo URL: {photo_url}")
-                        else:
-                            self.logger.info(f"Skipped photo URL: {photo_url}")
-
-                review_id = f"review_{idx}_{i}"
-                # Download photos if any were found and photo downloading is enabled
-                local_photo_paths = []
-                if (
-                    photos_urls
-                    and self._save_data_to_disk
-                    and self.input_params.download_photos
-                ):
-                    local_photo_paths = self._download_photos(
-                        review_id, photos_urls, date
-                    )
+    def _skip_page(self, idx: int, ex: Exception):
+        self.logger.error(f"Skipping page {idx}: {ex}")
+        self.metrics.inc("pages_skipped_total")
+        if self._journal is not None:
+            self._journal.page_failed(idx, str(ex))
+        for sink in self._sinks:
+            sink.skip(idx)
 
-                res = {
-                    "hotel_name": self.input_params.hotel_name,
-                    "review_id": review_id,
-                    "username": username,
-                    "user_country": user_country,
-                    "room_view": room_view,
-                    "stay_duration": stay_duration,
-                    "stay_type": stay_type,
-                    "review_post_date": date,
-                    "review_title": review_title,
-                    "rating": rating,
-                    "original_lang": original_lang,
-                    "review_text_liked": review_text_liked,
-                    "review_text_disliked": review_text_disliked,
-                    "full_review": full_review,
-                    "en_full_review": en_full_review,
-                    "found_helpful": found_helpful,
-                    "found_unhelpful": found_unhelpful,
-                    "owner_resp_text": owner_response,
-                    "review_photos": photos_urls,
-                    "local_photo_paths": local_photo_paths,
-                }
-                page_reviews.append(res)
-
-            # idx: orginal offset_param value / id of reviews page
-            # reviews: list of reviews found on the page
-            self._parsed_pages_reviews.append({"idx": idx, "reviews": page_reviews})
-            pages_reviews.append({"idx": idx, "reviews": page_reviews})
-
-        return pages_reviews
-
-    def _download_photos(
-        self, review_id: str, photos_urls: List[str], review_date: str
-    ) -> List[str]:
-        """Downloads photos for a review and saves them in a reviewer-specific directory.
+    def _parse_scraped_results(
+        self, ls_response: List[dict]
+    ) -> Union[List[dict], None]:
+        """Takes response objects containing html content of a single reviews pages, and
+        parses the data in the current process
 
         Args:
-            review_id: The reviewer's review_id (used for directory name)
-            photos_urls: List of photo URLs to download
-            review_date: Review date to use in filename
+            ls_response: list of dicts with page-idx and response objects with html { idx and requests.Response object}
 
         Returns:
-            List of local paths where the photos were saved
+            [ {idx of the review page, list of reviews in that page}, ... ]
         """
-        if not photos_urls:
-            return []
+        for response_dict in ls_response:
+            self._archive_page(response_dict)
+
+        return [
+            self._collect_parsed(
+                parse_reviews_page(
+                    response_dict["response"].content,
+                    response_dict["idx"],
+                    self.input_params.hotel_name,
+                    self._config.PARSER_BACKEND,
+                )
+            )
+            for response_dict in ls_response
+        ]
 
-        # Create base photos directory
-        photos_base_dir = self._LOCAL_OUTPUT_PATH.format(
+    def _open_photo_downloader(self) -> PhotoDownloader:
+        """Starts the background downloader of the review photos, with its own
+        connection pool and rate limit
+        """
+        dir_path = self._LOCAL_OUTPUT_PATH.format(
             output_dir=self._config.OUTPUT_DIR, entity_name=self.input_params.hotel_name
         )
-        photos_base_dir = os.path.join(photos_base_dir, "photos")
-
-        # Create reviewer directory - use review date to make it unique
-        review_file = "".join(
-            id for id in review_id if id.isalnum() or id in (" ", "-", "_")
-        ).strip()
-        reviewer_dir = os.path.join(photos_base_dir, f"{review_file}")
-
-        if not os.path.exists(reviewer_dir):
-            os.makedirs(reviewer_dir, exist_ok=True)
-
-        local_paths = []
-        for idx, photo_url in enumerate(photos_urls, 1):
-            try:
-                response = requests.get(photo_url, headers=headers)
-                if response.status_code == 200:
-                    # Extract file extension from URL or default to .jpg
-                    ext = os.path.splitext(photo_url)[1]
-                    if not ext or len(ext) > 5:  # If no extension or suspicious length
-                        ext = ".jpg"
-
-                    filename = f"photo_{idx}{ext}"
-                    file_path = os.path.join(reviewer_dir, filename)
-
-                    with open(file_path, "wb") as f:
-                        f.write(response.content)
-
-                    local_paths.append(file_path)
-                    self.logger.info(
-                        f"Successfully downloaded photo {idx} for reviewer {review_id}"
-                    )
-                else:
-                    self.logger.error(
-                        f"Failed to download photo {idx} for reviewer {review_id}: Status {response.status_code}"
-                    )
-            except Exception as ex:
-                self.logger.error(
-                    f"Error downloading photo {idx} for reviewer {review_id}: {str(ex)}"
-                )
-
-        return local_paths
+        return PhotoDownloader(
+            dir_path,
+            HttpTransport(
+                pool_connections=self._config.POOL_CONNECTIONS,
+                pool_maxsize=self._config.PHOTO_CONCURRENCY,
+                headers=headers,
+                timeout=(self._config.CONNECT_TIMEOUT, self._config.READ_TIMEOUT),
+            ),
+            store=PhotoStore(self._config.PHOTO_STORE_DIR)
+            if self._config.PHOTO_STORE_DIR
+            else None,
+            requests_per_second=self._config.PHOTO_REQUESTS_PER_SECOND,
+            max_workers=self._config.PHOTO_CONCURRENCY,
+            byte_budget=self._config.PHOTO_BYTE_BUDGET,
+            logger=self.logger,
+            metrics=self.metrics,
+        )
 
     ##########################################################
     # ******** Scraping Modes full/partial ********
     ##########################################################
 
-    def _get_all_reviews(self, ls_urls: List[dict]) -> List[dict]:
-        """Gets all the review till the last page
+    def _fetch_pages(
+        self, ls_urls: List[dict], on_result: Callable[[dict], None] = None
+    ) -> List[dict]:
+        """Sends get requests to all the urls with the fetch engine selected in config.yml
 
         Args:
             ls_urls: list containing url and idx/offset_param of each reviews page
+            on_result: optional callback, called from the fetching thread with every
+                {"idx", "response"} dict as soon as it is fetched. When passed, the
+                results are handed over to the callback and not kept in memory
 
         Returns:
-            list of all the reviews
+            list of {"idx", "response"} dicts, in the same order as ls_urls.
+            Empty list when on_result is passed
         """
-        _start = time.time()
-        self.logger.info(f"Starting Get Requests on {len(ls_urls)} urls")
+        probe, ls_urls = self._split_probe_page(ls_urls)
+        ready = [probe] if probe is not None else []
+
+        fetch_fn = self._scrape
+        if on_result is not None:
+            for response_dict in ready:
+                on_result(response_dict)
+
+            def fetch_fn(url_dict: dict):
+                on_result(self._scrape(url_dict))
+
+        if self._config.FETCH_ENGINE == "asyncio":
+            rate_limiter = self._get_rate_limiter()
+            self.logger.info(
+                f"Fetch engine: asyncio, thread-backed ({self._config.REQUESTS_PER_SECOND} "
+                f"req/s, max concurrency {self._config.MAX_CONCURRENCY})"
+            )
+            results = fetch_async(
+                fetch_fn, ls_urls, rate_limiter, self._config.MAX_CONCURRENCY
+            )
+            return ready + results if on_result is None else []
 
-        # *************START: Send get request to all urls and save the response objects*************
+        self.logger.info("Fetch engine: threads")
+        if self._rate_limiter is not None:
+            # the shared bucket spaces the requests, instead of the batches below
+            limited_fn = fetch_fn
+
+            def fetch_fn(url_dict: dict):
+                self._rate_limiter.acquire()
+                return limited_fn(url_dict)
 
-        responses = []
         # Use ThreadPoolExecutor to parallelize GET requests
         with concurrent.futures.ThreadPoolExecutor(
             max_workers=self._config.REQUESTS_PER_SECOND
@@ -625,21 +924,117 @@ class Scrape:
             futures = []
             cnt = 0
             for url_dict in ls_urls:
-                f = executor.submit(self._scrape, url_dict)
+                f = executor.submit(fetch_fn, url_dict)
                 futures.append(f)
                 cnt += 1
 
                 if (
-                    cnt >= self._config.REQUESTS_PER_SECOND
+                    self._rate_limiter is None
+                    and cnt >= self._config.REQUESTS_PER_SECOND
                 ):  # submit no more than x requests/per sec
                     time.sleep(1)
                     cnt = 0
 
-            # futures = [executor.submit(self._scrape, url_dict) for url_dict in ls_urls]
             # Wait for all tasks to complete
             concurrent.futures.wait(futures)
-            # Use map to get results in the order of submission
-            responses = list(executor.map(lambda f: f.result(), futures))
+            # results in the order of submission
+            results = [f.result() for f in futures]
+            return ready + results if on_result is None else []
+
+    def _get_all_reviews_pipelined(self, ls_urls: List[dict]) -> List[dict]:
+        """Gets all the review till the last page, parsing pages while the later
+        pages are still being downloaded.
+
+        Fetchers hand every response to the parse pool as soon as it arrives. When the
+        parsers fall behind and PIPELINE_QUEUE_SIZE pages are waiting to be parsed, the
+        fetchers wait, so the number of pages held in memory stays bounded.
+
+        Args:
+            ls_urls: list containing url and idx/offset_param of each reviews page
+
+        Returns:
+            list of all the reviews
+        """
+        _start = time.time()
+        self.logger.info(f"Starting Pipelined Scraping on {len(ls_urls)} urls")
+
+        slots = threading.BoundedSemaphore(self._config.PIPELINE_QUEUE_SIZE)
+        parsed_queue = queue.Queue()
+        fetch_stats = StageStats("Fetch")
+        parse_stats = StageStats("Parse")
+
+        def enqueue(response_dict: dict):
+            _put_start = time.time()
+            slots.acquire()
+            fetch_stats.add(blocked=time.time() - _put_start)
+
+            future = self._submit_parse(response_dict)
+            future.add_done_callback(lambda _: slots.release())
+            parsed_queue.put((response_dict["idx"], future))
+
+        def collect():
+            busy = 0.0
+            while True:
+                item = parsed_queue.get()
+                if item is None:
+                    break
+                idx, future = item
+                try:
+                    parsed = future.result()
+                except Exception as ex:
+                    self._skip_page(idx, ex)
+                    continue
+                busy += parsed.parse_time
+                self._keep_page(self._collect_parsed(parsed))
+
+            parse_stats.stop()
+            # time the parse processes spent waiting for pages
+            idle = PROCESS_POOL_SIZE * parse_stats.elapsed - busy
+            parse_stats.add(self._pages_done, blocked=max(idle, 0.0))
+
+        collector = threading.Thread(target=collect)
+        self._get_parse_pool()
+        fetch_stats.start()
+        parse_stats.start()
+        collector.start()
+
+        try:
+            self._fetch_pages(ls_urls, on_result=enqueue)
+        finally:
+            parsed_queue.put(None)
+            fetch_stats.stop()
+            collector.join()
+
+        self.logger.info(fetch_stats.summary())
+        self.logger.info(parse_stats.summary())
+
+        # Sort the list based on the 'idx' key in each dictionary
+        # so that the reviews of the first page, come first
+        ls_reviews = sorted(self._parsed_pages_reviews, key=lambda x: x["idx"])
+        result_list = []
+        _ = [result_list.extend(d["reviews"]) for d in ls_reviews]
+
+        self.logger.info(
+            f"Finished Pipelined Scraping: {self._reviews_parsed} in {time.time() - _start:.1f} seconds"
+        )
+
+        return result_list
+
+    def _get_all_reviews(self, ls_urls: List[dict]) -> List[dict]:
+        """Gets all the review till the last page
+
+        Args:
+            ls_urls: list containing url and idx/offset_param of each reviews page
+
+        Returns:
+            list of all the reviews
+        """
+        _start = time.time()
+        self.logger.info(f"Starting Get Requests on {len(ls_urls)} urls")
+
+        # *************START: Send get request to all urls and save the response objects*************
+
+        responses = self._fetch_pages(ls_urls)
 
         self.logger.info(f"Finished Get Requests in {time.time() - _start:.1f} seconds")
 
@@ -649,17 +1044,18 @@ class Scrape:
 
         # *************START: Parse the html content from all response objects*************
 
-        # split the list of response object into multiple splits
-        # and send one list to each process
-        ls_p = []
-        for split in np.array_split(responses, PROCESS_POOL_SIZE):
-            if len(split):
-                p = mp.Process(target=self._parse_scraped_results, args=(split,))
-                p.start()
-                ls_p.append(p)
+        # one task per page, idle processes keep picking up the next page
+        futures = {
+            self._submit_parse(response_dict): response_dict["idx"]
+            for response_dict in responses
+        }
+        del responses
 
-        self.logger.info(f"Processes launched: {len(ls_p)}")
-        _ = [p.join() for p in ls_p]
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                self._keep_page(self._collect_parsed(future.result()))
+            except Exception as ex:
+                self._skip_page(futures[future], ex)
 
         # Sort the list based on the 'idx' key in each dictionary
         # so that the reviews of the first page, come first
@@ -668,12 +1064,115 @@ class Scrape:
         _ = [result_list.extend(d["reviews"]) for d in ls_reviews]
 
         self.logger.info(
-            f"Finished Parsing Responses: {len(result_list)} in {time.time() - _start:.1f} seconds"
+            f"Finished Parsing Responses: {self._reviews_parsed} in {time.time() - _start:.1f} seconds"
         )
         # ************* --------END-------- *************
 
         return result_list
 
+    def _iter_pages(self, ls_urls: List[dict]) -> Iterator[dict]:
+        """Yields the fetched pages in page order.
+
+        With PREFETCH_WINDOW > 0 the next pages are requested speculatively while the
+        current one is being processed. When the caller stops iterating, or closes the
+        generator, the pages that were not requested yet are cancelled and the ones in
+        flight are waited for and discarded, no request outlives the iteration.
+
+        Args:
+            ls_urls: list containing url and idx/offset_param of each reviews page
+
+        Yields:
+            {"idx", "response"} dicts
+        """
+        probe, ls_urls = self._split_probe_page(ls_urls)
+        if probe is not None:
+            yield probe
+
+        window = self._config.PREFETCH_WINDOW
+        if not window:
+            for url_dict in ls_urls:
+                if self._rate_limiter is not None:
+                    self._rate_limiter.acquire()
+                yield self._scrape(url_dict)
+            return
+
+        rate_limiter = self._get_rate_limiter()
+        stopped = threading.Event()
+        requested = []
+
+        def fetch(url_dict: dict):
+            rate_limiter.acquire()
+            if stopped.is_set():
+                return None
+            requested.append(url_dict["idx"])
+            return self._scrape(url_dict)
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=window)
+        ls_urls = iter(ls_urls)
+        futures = collections.deque(
+            executor.submit(fetch, url_dict)
+            for url_dict in itertools.islice(ls_urls, window)
+        )
+        used = 0
+
+        try:
+            while futures:
+                res_dict = futures.popleft().result()
+                url_dict = next(ls_urls, None)
+                if url_dict is not None:
+                    futures.append(executor.submit(fetch, url_dict))
+
+                used += 1
+                yield res_dict
+
+        finally:
+            stopped.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+            wasted = len(requested) - used
+            self._prefetch_stats = {
+                "requested": len(requested),
+                "used": used,
+                "wasted": wasted,
+            }
+            self.logger.info(
+                f"Prefetch: {len(requested)} pages requested, {used} used, {wasted} wasted "
+                f"({wasted / max(len(requested), 1):.0%})"
+            )
+
+    def _is_stop_review(self, review_obj: dict) -> bool:
+        """Checks if scraping has to stop at this review, the review itself is not kept
+
+        Scraping stops at the review matching the stop criteria, or in incremental mode
+        at the first review which was already seen by the previous run.
+        """
+        stop = self.input_params.stop_critera
+        if stop and (
+            stop.username.lower().strip()
+            == (review_obj["username"] or "").lower().strip()
+        ):
+            r_title = (
+                ""
+                if review_obj["review_title"] is None
+                else review_obj["review_title"].lower().strip()
+            )
+
+            if stop.review_text_title.lower().strip() in r_title:
+                self.logger.info("Stop criteria met")
+                return True
+
+        if self._watermark:
+            if review_obj["review_id"] in self._seen_fingerprints:
+                self.logger.info("Reached the reviews seen by the previous run")
+                return True
+
+            review_date = parse_review_date(review_obj["review_post_date"])
+            if self._watermark_date and review_date and review_date < self._watermark_date:
+                self.logger.info("Reached reviews older than the previous run")
+                return True
+
+        return False
+
     def _get_cond_reviews(self, ls_urls: List[dict]) -> List[dict]:
         """Gets reviews based on any filter either n_rows or stoping criteria
 
@@ -692,47 +1191,43 @@ class Scrape:
         ls_reviews = []
         stop_criteria_met = False
 
-        for url_dict in ls_urls:
-            res_dict: dict = self._scrape(
-                url_dict
-            )  # will return --> {"idx": idx, "response": response}
-            ls_res = self._parse_scraped_results(
-                [res_dict]
-            )  # will return --> [{"idx": idx, "reviews": []}]
-            if ls_res:
-                reviews = ls_res[0]["reviews"]
-                count_review += len(reviews)
-
-                if self.input_params.stop_critera:
+        pages = self._iter_pages(ls_urls)
+        try:
+            for res_dict in pages:  # {"idx": idx, "response": response, "error": error}
+                if res_dict["response"] is None:
+                    self._skip_page(res_dict["idx"], res_dict["error"])
+                    continue
+
+                ls_res = self._parse_scraped_results(
+                    [res_dict]
+                )  # will return --> [{"idx": idx, "reviews": []}]
+                if ls_res:
+                    reviews = ls_res[0]["reviews"]
+                    count_review += len(reviews)
+                    n_kept = len(ls_reviews)
+
                     for review_obj in reviews:
-                        if (
-                            self.input_params.stop_critera.username.lower().strip()
-                            == review_obj["username"].lower().strip()
-                        ):
-                            r_title = (
-                                ""
-                                if review_obj["review_title"] is None
-                                else review_obj["review_title"].lower().strip()
-                            )
-
-                            if (
-                                self.input_params.stop_critera.review_text_title.lower().strip()
-                                in r_title
-                            ):
-                                stop_criteria_met = True
-                                break
+                        if self._is_stop_review(review_obj):
+                            stop_criteria_met = True
+                            break
 
                         ls_reviews.append(review_obj)
 
-                else:
-                    ls_reviews.extend(reviews)
+                    n_rows_reached = (
+                        not stop_criteria_met
+                        and -1 < self.input_params.n_rows <= count_review
+                    )
+                    if n_rows_reached:
+                        ls_reviews = ls_reviews[: self.input_params.n_rows]
 
-                if stop_criteria_met:
-                    break
+                    self._add_to_sinks(
+                        ls_res[0]["idx"], ls_reviews[n_kept:], ls_res[0]["photos"]
+                    )
 
-                if -1 < self.input_params.n_rows <= count_review:
-                    ls_reviews = ls_reviews[: self.input_params.n_rows]
-                    break
+                    if stop_criteria_met or n_rows_reached:
+                        break
+        finally:
+            pages.close()  # cancels the prefetched pages which are not needed
 
         self.logger.info(
             f"Finished Conditional Scraping: {len(ls_reviews)} in {time.time() - _start:.1f} seconds"
@@ -750,23 +1245,244 @@ class Scrape:
 
         _start = time.time()
         results = []
-        ls_urls = self._create_urls()
-        prog_thd = threading.Thread(target=self._progress_thread_start, args=(ls_urls,))
+        if self._owns_metrics:
+            self._exporter = open_exporter(self._config, self.metrics)
+        ls_urls = self._resume_urls() if self._resume else self._create_urls()
+        self.n_pages = len(ls_urls)
+        if self._save_data_to_disk:
+            self._sinks = self._open_sinks(ls_urls)
+            if self._is_full_scrape():
+                self._journal = self._open_journal(ls_urls)
+        if self._config.ARCHIVE_PAGES:
+            self._archive = self._open_archive()
+        if self._save_data_to_disk and self.input_params.download_photos:
+            self._photos = self._open_photo_downloader()
+        prog_thd = threading.Thread(
+            target=self._progress_thread_start, args=(ls_urls,), daemon=True
+        )
         prog_thd.start()
 
-        if self.input_params.n_rows == -1 and self.input_params.stop_critera is None:
-            # it means to get all the reviews, based on the provided/default sort_by option
-            results = self._get_all_reviews(ls_urls)
+        try:
+            if (
+                self.input_params.n_rows == -1
+                and self.input_params.stop_critera is None
+                and self._watermark is None
+            ):
+                # it means to get all the reviews, based on the provided/default sort_by option
+                if self._config.PIPELINE:
+                    results = self._get_all_reviews_pipelined(ls_urls)
+                else:
+                    results = self._get_all_reviews(ls_urls)
 
-        else:
-            results = self._get_cond_reviews(ls_urls)
+            else:
+                results = self._get_cond_reviews(ls_urls)
+
+            self._close_outputs(results)
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+            self.logger.info(f"Process complete {time.time() - _start:.1f} seconds")
+            self.logger.info(f"Reviews found: {self.n_reviews}")
+
+            if self.input_params.incremental:
+                self._watermarks.update(
+                    self._watermark_key, results or self._first_page_reviews
+                )
+        finally:
+            self._execution_finished.set()  # to stop the monitoring thread
+            prog_thd.join()
+            self._close()
+        return results
+
+    def _close_outputs(self, results: List[dict]):
+        """Waits for the photos and closes the sinks, sets self.n_reviews"""
+        if self._photos is not None:
+            self._photos.close()  # waits for the queued photos
+            self._photos = None
+
+        self.n_reviews = len(results)
+        for sink in self._sinks:
+            sink.close()
+            self.n_reviews = sink.rows_written + sink.duplicates
+            self.logger.info(
+                f"Saved {sink.rows_written} reviews to {sink.path}, "
+                f"{sink.duplicates} already saved reviews skipped, "
+                f"at most {sink.max_pending_pages} pages held for reordering"
+            )
+        self._sinks = []
+
+    def _finish_metrics(self):
+        """Logs the summary of the metrics, saves it next to the outputs and stops the
+        exporter
+        """
+        self.metrics.log_summary(self.logger)
+        self.metrics_summary = self.metrics.summary()
+        if self._save_data_to_disk:
+            dir_path = self._LOCAL_OUTPUT_PATH.format(
+                output_dir=self._config.OUTPUT_DIR, entity_name=self.input_params.hotel_name
+            )
+            path = f"{dir_path}/metrics_{self.input_params.sort_by}.json"
+            self.metrics.write_summary(path)
+            self.logger.info(f"Metrics summary saved to {path}")
+        if self._exporter is not None:
+            self._exporter.close()
+            self._exporter = None
+
+    def _close(self):
+        """Logs the stats of the run and closes the transport, archive and parse pool
+        owned by this scraper. After a failed run, the outputs still open are closed
+        with the pages saved so far and the journal is left unfinished, for --resume
+        """
+        try:
+            if self._photos is not None or self._sinks:
+                self._close_outputs([])
+        finally:
+            if self._journal is not None:
+                self._journal.close(finished=False)
+                self._journal = None
+        self._update_gauges()
+        if self._owns_metrics:
+            self._finish_metrics()
+        if self._owns_transport:
+            # a shared transport is logged by its owner, once for all the scrapers
+            self._transport.log_stats(self.logger)
+            if self._transport.cache is not None:
+                self._transport.cache.log_stats(self.logger)
+        if self._rate_controller is not None and self._owns_rate_controller:
+            self._rate_controller.log_stats(self.logger)
+        date_stats = counters_to_stats(*self._date_counters)
+        self.logger.info(
+            f"Review dates: {date_stats['dates']} parsed, cache hit rate "
+            f"{date_stats['hit_rate']:.1%}, {date_stats['fallbacks']} dateutil fallbacks"
+        )
+        if self._owns_transport:
+            self._transport.close()
+        if self._archive is not None:
+            self._archive.close()
+            self.logger.info(
+                f"Archived {self._archive.pages} pages, {self._archive.raw_bytes / 2**20:.1f} MB "
+                f"compressed to {self._archive.stored_bytes / 2**20:.1f} MB"
+            )
+            self._archive = None
+        if self._parse_pool is not None and self._owns_parse_pool:
+            self._parse_pool.shutdown()
+            self._parse_pool = None
+
+    ##########################################################
+    # ******** Distributed jobs ********
+    ##########################################################
+
+    def publish(self, queue: WorkQueue) -> int:
+        """Plans the reviews pages of the hotel and publishes them to a work queue, as a
+        distributed job with the id of this job. The pages are then fetched and parsed
+        by QueueWorkers, see core.worker, and written by merge().
+
+        The first page, fetched by the pagination probe, is parsed and completed here.
 
-        self.logger.info(f"Process complete {time.time() - _start:.1f} seconds")
-        self.logger.info(f"Reviews found: {len(results)}")
+        Args:
+            queue: queue shared with the workers, see core.work_queue
+
+        Returns:
+            number of pages published
+        """
+        if (
+            self.input_params.n_rows != -1
+            or self.input_params.stop_critera is not None
+            or self.input_params.incremental
+        ):
+            raise ValueError(
+                "Distributed jobs scrape all the reviews: n_rows, stop criteria and "
+                "incremental mode are not supported"
+            )
 
-        self._execution_finished.set()  # to stop the monitoring thread
+        job_id = os.getenv("job_id")
+        ls_urls = self._create_urls()
+        n_pages = queue.publish(
+            job_id,
+            {
+                "hotel_name": self.input_params.hotel_name,
+                "country": self.input_params.country,
+                "sort_by": self.input_params.sort_by,
+                "page_size": self._page_size,
+            },
+            ls_urls,
+        )
+
+        probe, _ = self._split_probe_page(ls_urls)
+        if probe is not None:
+            queue.complete(
+                job_id,
+                probe["idx"],
+                parse_reviews_page(
+                    probe["response"].content,
+                    probe["idx"],
+                    self.input_params.hotel_name,
+                    self._config.PARSER_BACKEND,
+                ),
+            )
 
+        self.logger.info(f"Published {n_pages}/{len(ls_urls)} pages of job {job_id}")
+        if self._owns_transport:
+            self._transport.close()
+        return n_pages
+
+    def merge(self, queue: WorkQueue) -> List[dict]:
+        """Writes the pages of the distributed job with the id of this job, fetched by
+        the workers, to the outputs of the job.
+
+        The pages are read in page order and the reviews which appear on two pages are
+        only written once, so the outputs do not depend on which worker fetched which
+        page, or when. Pages which failed on every attempt are logged and skipped.
+
+        Args:
+            queue: queue of the job
+
+        Returns:
+            list of all the reviews, empty when keep_results is False
+
+        Raises:
+            ValueError: the job is unknown or some pages are not done yet
+        """
+        _start = time.time()
+        job_id = os.getenv("job_id")
+        if queue.job(job_id) is None:
+            raise ValueError(f"Unknown job: {job_id}")
+
+        progress = queue.progress(job_id)
+        if progress["pending"] or progress["leased"]:
+            raise ValueError(
+                f"Job {job_id} is not finished: {progress['pending']} pages pending, "
+                f"{progress['leased']} pages in progress"
+            )
+
+        ls_urls = queue.tasks(job_id)
+        self.n_pages = len(ls_urls)
         if self._save_data_to_disk:
-            self._save_local_files(results)
+            self._sinks = self._open_sinks(ls_urls)
+        if self._save_data_to_disk and self.input_params.download_photos:
+            self._photos = self._open_photo_downloader()
+
+        for task in ls_urls:
+            if task["status"] == "failed":
+                self.logger.error(
+                    f"Page {task['idx']} failed {task['attempts']} times: {task['error']}"
+                )
+                for sink in self._sinks:
+                    sink.skip(task["idx"])
+
+        for parsed in queue.iter_results(job_id):
+            self._keep_page(self._collect_parsed(parsed))
 
+        results = []
+        for page in self._parsed_pages_reviews:
+            results.extend(page["reviews"])
+        self._close_outputs(results)
+
+        self.logger.info(
+            f"Merged {progress['done']} pages of job {job_id}, {progress['failed']} failed, "
+            f"in {time.time() - _start:.1f} seconds"
+        )
+        self.logger.info(f"Reviews found: {self.n_reviews}")
+        self._close()
         return results
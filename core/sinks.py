@@ -0,0 +1,397 @@
+import csv
+import glob
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Callable, Iterable, List
+from urllib.parse import quote
+
+from core.dates import DATE_FORMAT
+from core.fingerprint import (
+    FINGERPRINT_FIELDS,
+    FingerprintIndex,
+    is_fingerprint,
+    saved_review_fingerprint,
+)
+from core.metrics import Metrics
+from core.store import ReviewStore
+
+# pyarrow is optional, it is only needed by the "parquet" output format
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = ("csv", "parquet", "sqlite")
+
+
+class OrderedSink:
+    """Receives the reviews of every page as soon as the page is parsed, and writes
+    them in page order.
+
+    Pages may be parsed in any order, a reorder buffer holds the pages which arrive
+    before an earlier page. Only those pages are kept in memory, and rows are handed
+    to _write in batches of `batch_rows`. Subclasses implement _write and _close.
+
+    Subclasses which append to existing outputs set self._index to the fingerprints
+    of the reviews already saved, the reviews found in the index are skipped.
+
+    on_saved, when set, is called with the idx of the pages whose reviews are saved
+    for good: after every batch, or only once the output is closed for subclasses
+    which set saved_on_close, e.g. a parquet file is unreadable until it is closed.
+    metrics, when set, counts the reviews written, labelled with the name of the output.
+
+    Args:
+        path: file or directory written by the sink
+        order: idx of the pages in the order they must be written
+        batch_rows: number of rows buffered before they are written
+    """
+
+    name = "sink"  # label of the output in the metrics
+
+    def __init__(self, path: str, order: Iterable[int], batch_rows: int = 500) -> None:
+        self.path = path
+        self.batch_rows = batch_rows
+        self.rows_written = 0
+        self.duplicates = 0
+        self.max_pending_pages = 0
+
+        self._order = deque(order)
+        self._pending = {}  # idx -> reviews of the pages waiting for an earlier page
+        self._rows = []
+        self._index = None  # FingerprintIndex of the saved reviews
+        self._lock = threading.Lock()
+
+        self.on_saved: Callable[[List[int]], None] = None
+        self.metrics: Metrics = None
+        self.saved_on_close = False
+        self._rows_pages = []  # idx of the pages in self._rows
+        self._unsaved_pages = []  # idx of the pages written but not saved yet
+
+    @property
+    def pending_pages(self) -> int:
+        """Number of pages held in the reorder buffer"""
+        return len(self._pending)
+
+    def add(self, idx: int, reviews: List[dict]):
+        """Adds the reviews of a parsed page
+
+        Args:
+            idx: orginal offset_param value / id of the reviews page
+            reviews: reviews of the page
+        """
+        with self._lock:
+            self._pending[idx] = reviews
+            self.max_pending_pages = max(self.max_pending_pages, len(self._pending))
+
+            while self._order and self._order[0] in self._pending:
+                page_idx = self._order.popleft()
+                self._rows.extend(self._pending.pop(page_idx))
+                self._rows_pages.append(page_idx)
+
+            if len(self._rows) >= self.batch_rows:
+                self._flush()
+
+    def skip(self, idx: int):
+        """Marks a page which will never be added, e.g. it failed to parse"""
+        self.add(idx, [])
+
+    def _flush(self):
+        rows, self._rows = self._rows, []
+        pages, self._rows_pages = self._rows_pages, []
+        if self._index is not None:
+            n_rows = len(rows)
+            batch_ids = set()
+            new_rows = []
+            for row in rows:
+                if row["review_id"] in self._index or row["review_id"] in batch_ids:
+                    continue
+                batch_ids.add(row["review_id"])
+                new_rows.append(row)
+            rows = new_rows
+            self.duplicates += n_rows - len(rows)
+
+        if rows:
+            try:
+                self._write(rows)
+            except Exception as ex:
+                logger.error(ex)
+                return
+
+            # only the rows which are written count as saved
+            if self._index is not None:
+                for row in rows:
+                    self._index.add(row["review_id"])
+            self.rows_written += len(rows)
+            if self.metrics is not None:
+                self.metrics.inc("reviews_written_total", len(rows), output=self.name)
+
+        if self.saved_on_close:
+            self._unsaved_pages.extend(pages)
+        elif pages and self.on_saved is not None:
+            self.on_saved(pages)
+
+    def _write(self, rows: List[dict]):
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+    def close(self):
+        """Writes the buffered rows, pages which are still waiting are written in idx order"""
+        with self._lock:
+            for idx in sorted(self._pending):
+                self._rows.extend(self._pending[idx])
+                self._rows_pages.append(idx)
+            self._pending.clear()
+            self._order.clear()
+
+            self._flush()
+            self._close()
+
+            if self._unsaved_pages and self.on_saved is not None:
+                self.on_saved(self._unsaved_pages)
+            self._unsaved_pages = []
+
+
+class OrderedCsvSink(OrderedSink):
+    """Appends the reviews to a csv file.
+
+    The file is the same as the one written at the end of the run: the header is only
+    written when the file does not exist yet, and nothing is created when there are
+    no reviews. The reviews which are already in the file are not written again.
+    """
+
+    name = "csv"
+
+    def __init__(self, path: str, order: Iterable[int], batch_rows: int = 500) -> None:
+        super().__init__(path, order, batch_rows)
+        self._file = None
+        self._writer = None
+        self._index = FingerprintIndex()
+
+        if os.path.exists(path):
+            with open(path, "r", newline="", encoding="utf-8") as file:
+                for row in csv.DictReader(file):
+                    self._index.add(saved_review_fingerprint(row))
+            logger.info(f"{len(self._index)} reviews already saved in {path}")
+
+    def _write(self, rows: List[dict]):
+        if self._file is None:
+            dir_path = os.path.dirname(self.path)
+            if dir_path and not os.path.exists(dir_path):
+                os.makedirs(dir_path)
+
+            write_header = not os.path.exists(self.path)
+            self._file = open(self.path, "a", newline="", encoding="utf-8")
+            self._writer = csv.writer(self._file)
+            if write_header:
+                self._writer.writerow(rows[0].keys())
+
+        for row in rows:
+            self._writer.writerow(row.values())
+        self._file.flush()
+        # the rows are on disk before on_saved records their pages in the journal
+        os.fsync(self._file.fileno())
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# column types of the parquet output, in the order of core.parse.REVIEW_FIELDS.
+# hotel_name and review_month are the partition columns, they are encoded in the
+# directory names and not stored in the files
+if pa is not None:
+    _labels = pa.dictionary(pa.int32(), pa.string())
+    REVIEW_SCHEMA = pa.schema(
+        [
+            ("review_id", pa.string()),
+            ("username", pa.string()),
+            ("user_country", _labels),
+            ("room_view", _labels),
+            ("stay_duration", pa.string()),
+            ("stay_type", _labels),
+            ("review_post_date", pa.timestamp("s")),
+            ("review_title", pa.string()),
+            ("rating", pa.float64()),
+            ("original_lang", _labels),
+            ("review_text_liked", pa.string()),
+            ("review_text_disliked", pa.string()),
+            ("full_review", pa.string()),
+            ("en_full_review", pa.string()),
+            ("found_helpful", pa.int32()),
+            ("found_unhelpful", pa.int32()),
+            ("owner_resp_text", pa.string()),
+            ("review_photos", pa.list_(pa.string())),
+            ("local_photo_paths", pa.list_(pa.string())),
+        ]
+    )
+else:
+    REVIEW_SCHEMA = None
+
+# partition value of the reviews without a date, read back as null by pyarrow/pandas
+_NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+class ParquetSink(OrderedSink):
+    """Writes the reviews to a parquet dataset partitioned by hotel and review month:
+
+        <path>/hotel_name=<hotel>/review_month=<YYYY-MM>/<file_name>.parquet
+
+    Every job writes its own file in each partition, a batch of rows is written as a
+    row group. The dataset can be read with `pandas.read_parquet(path, filters=...)`,
+    filters on hotel_name and review_month skip the other partitions.
+
+    Args:
+        path: root directory of the dataset, shared by all the jobs
+        hotel_name: name of the hotel on booking.com
+        file_name: name of the files written by this sink, e.g. the job id
+        order: idx of the pages in the order they must be written
+        batch_rows: number of rows buffered before a row group is written
+        stale_prefix: unreadable files whose name starts with this prefix were left by
+            an interrupted run of the same job, they are deleted
+    """
+
+    name = "parquet"
+
+    def __init__(
+        self,
+        path: str,
+        hotel_name: str,
+        file_name: str,
+        order: Iterable[int],
+        batch_rows: int = 10000,
+        stale_prefix: str = None,
+    ) -> None:
+        self.check_installed()
+        super().__init__(path, order, batch_rows)
+        self.hotel_name = hotel_name
+        self.file_name = file_name
+        self._hotel_dir = os.path.join(path, f"hotel_name={quote(hotel_name, safe='')}")
+        self._writers = {}  # review month -> pq.ParquetWriter
+        self._dates = {}  # review_post_date string -> datetime
+        self._index = self._load_index(stale_prefix)
+        self.saved_on_close = True  # the footer of the files is written by close()
+
+    def _load_index(self, stale_prefix: str = None) -> FingerprintIndex:
+        """Fingerprints of the reviews saved in the partitions of the hotel. Only the
+        review_id column is read, the other columns are only read from the files
+        written before review ids were fingerprints.
+        """
+        index = FingerprintIndex()
+
+        for path in glob.glob(os.path.join(self._hotel_dir, "*", "*.parquet")):
+            try:
+                review_ids = pq.read_table(path, columns=["review_id"]).column(0).to_pylist()
+                if not all(is_fingerprint(review_id) for review_id in review_ids):
+                    review_ids = self._legacy_fingerprints(path)
+            except (OSError, pa.ArrowInvalid) as ex:
+                # left without footer by an interrupted job, its pages were not saved
+                if stale_prefix and os.path.basename(path).startswith(stale_prefix):
+                    logger.warning(f"Removing unreadable parquet file {path}: {ex}")
+                    os.remove(path)
+                else:
+                    logger.warning(f"Skipping unreadable parquet file {path}: {ex}")
+                continue
+            for review_id in review_ids:
+                index.add(review_id)
+
+        if len(index):
+            logger.info(f"{len(index)} reviews already saved in {self._hotel_dir}")
+        return index
+
+    def _legacy_fingerprints(self, path: str) -> List[str]:
+        """Fingerprints of the reviews of a file whose review ids are not all
+        fingerprints, recomputed from the content of the reviews
+
+        Args:
+            path: parquet file of the hotel
+
+        Returns:
+            fingerprint of every review of the file
+        """
+        fields = set(FINGERPRINT_FIELDS)
+        fields.update(("review_id", "review_text_liked", "review_text_disliked"))
+        columns = [name for name in pq.read_schema(path).names if name in fields]
+
+        fingerprints = []
+        for row in pq.read_table(path, columns=columns).to_pylist():
+            if row.get("review_post_date") is not None:
+                row["review_post_date"] = row["review_post_date"].strftime(DATE_FORMAT)
+            row["hotel_name"] = self.hotel_name
+            fingerprints.append(saved_review_fingerprint(row))
+        return fingerprints
+
+    @staticmethod
+    def check_installed():
+        if pa is None:
+            raise ImportError("The parquet output format requires: pip install pyarrow")
+
+    def _to_date(self, text: str):
+        if text is None:
+            return None
+        if text not in self._dates:
+            self._dates[text] = datetime.strptime(text, DATE_FORMAT)
+        return self._dates[text]
+
+    def _write(self, rows: List[dict]):
+        months = {}
+        for row in rows:
+            date = self._to_date(row["review_post_date"])
+            month = date.strftime("%Y-%m") if date else _NULL_PARTITION
+            months.setdefault(month, []).append(row)
+
+        for month, month_rows in months.items():
+            columns = {name: [row[name] for row in month_rows] for name in REVIEW_SCHEMA.names}
+            columns["review_post_date"] = [
+                self._to_date(date) for date in columns["review_post_date"]
+            ]
+            table = pa.Table.from_pydict(columns, schema=REVIEW_SCHEMA)
+
+            if month not in self._writers:
+                dir_path = os.path.join(self._hotel_dir, f"review_month={month}")
+                os.makedirs(dir_path, exist_ok=True)
+                self._writers[month] = pq.ParquetWriter(
+                    os.path.join(dir_path, f"{self.file_name}.parquet"), REVIEW_SCHEMA
+                )
+            self._writers[month].write_table(table)
+
+    def _close(self):
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+
+
+class SqliteSink(OrderedSink):
+    """Upserts the reviews into a ReviewStore, one transaction per batch of rows.
+    Reviews which are already stored are updated, the review key deduplicates them.
+
+    Args:
+        path: sqlite database file, shared by all the jobs
+        job_id: id of the job, stored with the reviews
+        order: idx of the pages in the order they must be written
+        batch_rows: number of rows buffered before they are written
+    """
+
+    name = "sqlite"
+
+    def __init__(
+        self, path: str, job_id: str, order: Iterable[int], batch_rows: int = 1000
+    ) -> None:
+        super().__init__(path, order, batch_rows)
+        self.job_id = job_id
+        self._store = ReviewStore(path)
+
+    def _write(self, rows: List[dict]):
+        self._store.upsert(rows, self.job_id)
+
+    def _close(self):
+        self._store.close()
@@ -0,0 +1,191 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import List, Optional
+from urllib.request import pathname2url
+
+from core.dates import DATE_FORMAT
+from core.fingerprint import review_fingerprint
+from core.parse import REVIEW_FIELDS
+
+# dates are stored as "YYYY-MM-DD HH:MM:SS" so that they sort and compare as text
+STORE_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# columns stored as json text
+_LIST_FIELDS = ("review_photos", "local_photo_paths")
+
+_COLUMNS = ("review_key",) + REVIEW_FIELDS + ("first_job", "last_job", "updated")
+
+_TYPES = {"rating": "REAL", "found_helpful": "INTEGER", "found_unhelpful": "INTEGER"}
+_COLUMN_DEFS = ",\n    ".join(
+    f"{field} {_TYPES.get(field, 'TEXT')}" for field in REVIEW_FIELDS
+)
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS reviews (
+    review_key TEXT PRIMARY KEY,
+    {_COLUMN_DEFS},
+    first_job TEXT,
+    last_job TEXT,
+    updated TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_reviews_hotel_date ON reviews (hotel_name, review_post_date);
+CREATE INDEX IF NOT EXISTS idx_reviews_hotel_rating ON reviews (hotel_name, rating);
+CREATE INDEX IF NOT EXISTS idx_reviews_username ON reviews (username);
+"""
+
+# the first job which stored a review is kept, everything else is replaced
+_UPDATES = ", ".join(
+    f"{column} = excluded.{column}"
+    for column in _COLUMNS
+    if column not in ("review_key", "first_job")
+)
+_UPSERT = (
+    f"INSERT INTO reviews ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))}) "
+    f"ON CONFLICT (review_key) DO UPDATE SET {_UPDATES}"
+)
+
+
+class ReviewStore:
+    """SQLite database of the reviews of all the jobs.
+
+    Reviews are keyed on their fingerprint (see core.fingerprint), so the same review
+    scraped by several jobs or sort orders is stored once. Every batch is inserted in
+    a single transaction.
+
+    Args:
+        path: sqlite database file, created if it does not exist
+        read_only: opens an existing database for queries only, without creating
+            the file or the schema
+
+    Raises:
+        FileNotFoundError: read_only and there is no database at path
+    """
+
+    def __init__(self, path: str, read_only: bool = False) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        if read_only:
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"No review store at {path}")
+            uri = f"file:{pathname2url(os.path.abspath(path))}?mode=ro"
+            self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            return
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # written by the thread which collects the parsed pages, closed by the main thread
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # FULL syncs every commit, the reviews are on disk before the journal of the
+        # job records their pages as saved
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def _to_row(review: dict, job_id: str, updated: str) -> tuple:
+        values = dict(review)
+        for field in _LIST_FIELDS:
+            values[field] = json.dumps(values[field] or [])
+        if values["review_post_date"]:
+            values["review_post_date"] = datetime.strptime(
+                values["review_post_date"], DATE_FORMAT
+            ).strftime(STORE_DATE_FORMAT)
+
+        return (
+            (review_fingerprint(review),)
+            + tuple(values[field] for field in REVIEW_FIELDS)
+            + (job_id, job_id, updated)
+        )
+
+    def upsert(self, reviews: List[dict], job_id: str = None) -> int:
+        """Inserts the reviews, or updates the ones which are already stored
+
+        Args:
+            reviews: review dicts as produced by core.parse
+            job_id: id of the job, stored in first_job/last_job
+
+        Returns:
+            number of reviews written
+        """
+        updated = datetime.now().isoformat(timespec="seconds")
+        rows = [self._to_row(review, job_id, updated) for review in reviews]
+        with self._lock, self._conn:
+            self._conn.executemany(_UPSERT, rows)
+        return len(rows)
+
+    def query(
+        self,
+        hotel_name: Optional[str] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        username: Optional[str] = None,
+        min_rating: Optional[float] = None,
+        max_rating: Optional[float] = None,
+    ) -> List[dict]:
+        """Returns the stored reviews matching all the given filters, newest first.
+        The filters on the hotel, dates, rating and username use the indexes.
+
+        Args:
+            hotel_name: name of the hotel on booking.com
+            start_date: first review date, "YYYY-MM-DD"
+            end_date: last review date (included), "YYYY-MM-DD"
+            username: username of the reviewer
+            min_rating: lowest rating (included)
+            max_rating: highest rating (included)
+
+        Returns:
+            review dicts, with review_post_date as "YYYY-MM-DD HH:MM:SS" and the
+            photo columns as lists
+        """
+        where, params = [], []
+        if hotel_name is not None:
+            where.append("hotel_name = ?")
+            params.append(hotel_name)
+        if start_date:
+            where.append("review_post_date >= ?")
+            params.append(start_date)
+        if end_date:
+            # the end date is a day, all the reviews of that day are included
+            where.append("review_post_date < date(?, '+1 day')")
+            params.append(end_date)
+        if username is not None:
+            where.append("username = ?")
+            params.append(username)
+        if min_rating is not None:
+            where.append("rating >= ?")
+            params.append(min_rating)
+        if max_rating is not None:
+            where.append("rating <= ?")
+            params.append(max_rating)
+
+        sql = f"SELECT {', '.join(REVIEW_FIELDS)} FROM reviews"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY review_post_date DESC"
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+
+        reviews = []
+        for row in rows:
+            review = dict(zip(REVIEW_FIELDS, row))
+            for field in _LIST_FIELDS:
+                review[field] = json.loads(review[field]) if review[field] else []
+            reviews.append(review)
+        return reviews
+
+    def hotels(self) -> List[str]:
+        """Names of the hotels in the store"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT hotel_name FROM reviews ORDER BY hotel_name"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
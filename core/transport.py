@@ -0,0 +1,205 @@
+import os
+import threading
+from collections import Counter
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from core.cache import ResponseCache
+
+# httpx is only needed for HTTP/2
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class HttpTransport:
+    """Pooled keep-alive HTTP client shared by all the request sites of Scrape.
+
+    Connections are kept open and reused between requests, with one connection pool
+    per host. With `http2=True` (requires `httpx[http2]`) requests to the same host are
+    multiplexed on a single HTTP/2 connection instead.
+
+    The underlying clients are created lazily and re-created in child processes, so
+    sockets are never shared between a parent and a forked worker.
+
+    Args:
+        pool_connections: number of per-host connection pools to keep
+        pool_maxsize: maximum number of kept-alive connections per host
+        http2: use HTTP/2 through httpx
+        headers: headers sent with every request
+        cache: on-disk response cache, consulted by every GET that is not streamed
+        timeout: (connect, read) timeouts in seconds of every request, None waits
+            forever. The read timeout is the longest wait for the next bytes of the
+            response, not for the whole response
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        http2: bool = False,
+        headers: Optional[Dict[str, str]] = None,
+        cache: Optional[ResponseCache] = None,
+        timeout: Optional[Tuple[float, float]] = None,
+    ) -> None:
+        if http2 and httpx is None:
+            raise ImportError("HTTP2 requires httpx: pip install 'httpx[http2]'")
+
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.http2 = http2
+        self.headers = headers or {}
+        self.cache = cache
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._reset()
+
+    def __getstate__(self):
+        return {
+            "pool_connections": self.pool_connections,
+            "pool_maxsize": self.pool_maxsize,
+            "http2": self.http2,
+            "headers": self.headers,
+            "cache": self.cache,
+            "timeout": self.timeout,
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._session = None
+        self._requests_per_host = Counter()
+        self._http_versions = Counter()
+
+    def _client(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # forked: the inherited connections belong to the parent
+                self._reset()
+
+            if self._session is None:
+                if self.http2:
+                    self._session = httpx.Client(
+                        http2=True,
+                        headers=self.headers,
+                        follow_redirects=True,
+                        timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0])
+                        if self.timeout
+                        else None,
+                        limits=httpx.Limits(
+                            max_connections=self.pool_connections * self.pool_maxsize,
+                            max_keepalive_connections=self.pool_maxsize,
+                        ),
+                    )
+                else:
+                    self._session = requests.Session()
+                    self._session.headers.update(self.headers)
+                    adapter = HTTPAdapter(
+                        pool_connections=self.pool_connections,
+                        pool_maxsize=self.pool_maxsize,
+                    )
+                    self._session.mount("http://", adapter)
+                    self._session.mount("https://", adapter)
+
+            return self._session
+
+    def get(self, url: str, params: dict = None, **kwargs):
+        """Sends a GET request over a pooled connection
+
+        Args:
+            url: url to request
+            params: query parameters
+            kwargs: passed on to requests/httpx
+
+        Returns:
+            response object, requests.Response or httpx.Response when HTTP2 is on.
+            Responses served from the cache are requests.Response with from_cache=True
+        """
+        if self.cache is None or kwargs.get("stream"):
+            return self._send(url, params, **kwargs)
+
+        if params:
+            url = requests.Request("GET", url, params=params).prepare().url
+
+        entry = self.cache.lookup(url)
+        if entry is not None and entry["fresh"]:
+            return self.cache.serve(entry)
+
+        if entry is not None:
+            extra_headers = self.cache.conditional_headers(entry)
+            if extra_headers:
+                kwargs["headers"] = {**kwargs.get("headers", {}), **extra_headers}
+
+        response = self._send(url, None, **kwargs)
+        if entry is not None and response.status_code == 304:
+            return self.cache.serve(entry, revalidated=True)
+
+        self.cache.store(url, response)
+        return response
+
+    def _send(self, url: str, params: dict = None, **kwargs):
+        if self.timeout and not self.http2:
+            kwargs.setdefault("timeout", self.timeout)
+        response = self._client().get(url, params=params, **kwargs)
+
+        if self.http2:
+            with self._lock:
+                self._requests_per_host[urlparse(url).netloc] += 1
+                self._http_versions[response.http_version] += 1
+
+        return response
+
+    def connection_stats(self) -> Dict[str, dict]:
+        """Returns the number of requests sent and connections opened per host.
+        httpx does not expose its connections, with HTTP2 only the requests are counted.
+        """
+        if self.http2 or self._session is None:
+            return {
+                host: {"requests": n, "connections": None}
+                for host, n in self._requests_per_host.items()
+            }
+
+        stats = {}
+        for adapter in set(self._session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                entry = stats.setdefault(
+                    f"{pool.host}:{pool.port}", {"requests": 0, "connections": 0}
+                )
+                entry["requests"] += pool.num_requests
+                entry["connections"] += pool.num_connections
+
+        return stats
+
+    def log_stats(self, logger):
+        """Logs the connection reuse counters"""
+        for host, entry in self.connection_stats().items():
+            if entry["connections"] is None:
+                logger.info(f"Connections {host}: {entry['requests']} requests")
+            else:
+                reused = entry["requests"] - entry["connections"]
+                logger.info(
+                    f"Connections {host}: {entry['requests']} requests, "
+                    f"{entry['connections']} connections opened, {reused} reused"
+                )
+
+        if self._http_versions:
+            logger.info(f"HTTP versions: {dict(self._http_versions)}")
+
+    def close(self):
+        with self._lock:
+            if self._session is not None and self._pid == os.getpid():
+                self._session.close()
+            self._session = None
@@ -0,0 +1,94 @@
+import json
+import os
+import threading
+from datetime import datetime
+from typing import List, Optional
+
+from core.fingerprint import review_fingerprint
+
+REVIEW_DATE_FORMAT = "%m-%d-%Y %H:%M:%S"
+
+
+def parse_review_date(date: Optional[str]) -> Optional[datetime]:
+    """Parses the review_post_date of a review, None when it is missing/invalid"""
+    if not date:
+        return None
+    try:
+        return datetime.strptime(date, REVIEW_DATE_FORMAT)
+    except ValueError:
+        return None
+
+
+class WatermarkStore:
+    """Remembers the newest reviews seen per hotel and sort order, in a json file.
+
+    Incremental runs scrape "newest_first" and stop at the first review which was
+    already seen by a previous run.
+
+    Args:
+        path: json file where the watermarks are stored
+        max_fingerprints: number of review fingerprints kept per hotel
+    """
+
+    # shared by all the stores, the scrapers of a batch update the same file
+    _lock = threading.Lock()
+
+    def __init__(self, path: str, max_fingerprints: int = 50) -> None:
+        self.path = path
+        self.max_fingerprints = max_fingerprints
+
+    @staticmethod
+    def key(country: str, hotel_name: str, sort_by: str) -> str:
+        return f"{country}/{hotel_name}/{sort_by}"
+
+    def _load(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r", encoding="utf-8") as file:
+            return json.load(file)
+
+    def get(self, key: str) -> Optional[dict]:
+        """Returns {"fingerprints": [...], "newest_date": str, "updated": str} or None"""
+        with self._lock:
+            return self._load().get(key)
+
+    def update(self, key: str, reviews: List[dict]):
+        """Stores the newest reviews of a run as the new watermark
+
+        Args:
+            key: see WatermarkStore.key
+            reviews: reviews of the run, newest first
+        """
+        if not reviews:
+            return
+
+        with self._lock:
+            watermarks = self._load()
+            previous = watermarks.get(key) or {"fingerprints": [], "newest_date": None}
+
+            fingerprints = [review_fingerprint(review) for review in reviews]
+            fingerprints += [f for f in previous["fingerprints"] if f not in fingerprints]
+
+            dates = [parse_review_date(review["review_post_date"]) for review in reviews]
+            dates = [d for d in dates if d is not None]
+            if previous["newest_date"]:
+                dates.append(parse_review_date(previous["newest_date"]))
+            newest_date = max(dates, default=None)
+
+            watermarks[key] = {
+                "fingerprints": fingerprints[: self.max_fingerprints],
+                "newest_date": newest_date.strftime(REVIEW_DATE_FORMAT)
+                if newest_date
+                else None,
+                "updated": datetime.now().isoformat(timespec="seconds"),
+            }
+
+            dir_path = os.path.dirname(self.path)
+            if dir_path and not os.path.exists(dir_path):
+                os.makedirs(dir_path, exist_ok=True)
+
+            # write to a temporary file first, so a crash never leaves a corrupt store
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump(watermarks, file, indent=2)
+            os.replace(tmp_path, self.path)
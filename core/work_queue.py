@@ -0,0 +1,530 @@
+import hmac
+import http.server
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Iterator, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from core.data_models import Config
+from core.parse import ParsedPage
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    metadata TEXT,
+    created REAL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    job_id TEXT,
+    idx INTEGER,
+    url TEXT,
+    status TEXT,
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER DEFAULT 0,
+    error TEXT,
+    result BLOB,
+    PRIMARY KEY (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status, lease_until);
+"""
+
+# task states: pending -> leased -> done, or back to pending until max_attempts -> failed
+TASK_STATES = ("pending", "leased", "done", "failed")
+
+
+def encode_page(parsed: ParsedPage) -> bytes:
+    """Serializes the result of a page for the queue, json compressed with zlib"""
+    return zlib.compress(json.dumps(list(parsed)).encode("utf-8"))
+
+
+def decode_page(data: bytes) -> ParsedPage:
+    idx, rows, parse_time, date_counters = json.loads(zlib.decompress(data))
+    return ParsedPage(idx, [tuple(row) for row in rows], parse_time, tuple(date_counters))
+
+
+class WorkQueue:
+    """Queue of the reviews pages of distributed jobs.
+
+    A coordinator publishes the pages of a job, workers which can reach the queue
+    claim them with a lease, fetch and parse them, and complete them with the parsed page. A page
+    whose lease expires, e.g. because its worker died, is delivered again. Once all
+    the pages are done the results are read back in page order and merged.
+
+    Implementations must make claim() atomic between all the workers.
+    """
+
+    def publish(self, job_id: str, metadata: dict, ls_urls: List[dict]) -> int:
+        """Adds the pages of a job. Pages which are already in the queue are kept
+
+        Args:
+            job_id: id of the job
+            metadata: job details returned with every task e.g. hotel_name
+            ls_urls: list containing url and idx/offset_param of each reviews page
+
+        Returns:
+            number of pages added
+        """
+        raise NotImplementedError
+
+    def claim(self, worker_id: str, max_tasks: int = 1) -> List[dict]:
+        """Leases pending pages, or pages whose lease expired, to a worker
+
+        Returns:
+            list of {"job_id", "idx", "url", "attempts", "metadata"} dicts, empty when
+            there is nothing to do right now
+        """
+        raise NotImplementedError
+
+    def complete(self, job_id: str, idx: int, parsed: ParsedPage) -> bool:
+        """Stores the result of a page. The first result of a page is kept
+
+        Returns:
+            False when the page was already completed by another worker
+        """
+        raise NotImplementedError
+
+    def fail(self, job_id: str, idx: int, worker_id: str, error: str):
+        """Gives a page back, it is delivered again until max_attempts is reached"""
+        raise NotImplementedError
+
+    def job(self, job_id: str) -> Optional[dict]:
+        """Returns the metadata of a job, None when the job is unknown"""
+        raise NotImplementedError
+
+    def progress(self, job_id: str = None) -> dict:
+        """Number of pages per state, of one job or of all the jobs"""
+        raise NotImplementedError
+
+    def tasks(self, job_id: str) -> List[dict]:
+        """Returns the {"idx", "url", "status", "attempts", "error"} of the pages of a
+        job, ordered by idx
+        """
+        raise NotImplementedError
+
+    def iter_results(self, job_id: str) -> Iterator[ParsedPage]:
+        """Yields the parsed pages of a job, ordered by idx"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SqliteWorkQueue(WorkQueue):
+    """WorkQueue in a SQLite database, for the coordinator and workers of one machine.
+    Other machines reach it through a WorkQueueServer, see HttpWorkQueue.
+
+    Claims run in an immediate transaction, so two workers never lease the same page.
+    The database is in WAL mode, which relies on memory shared by the processes of one
+    host: it must be on a local disk, not on a network filesystem (NFS/SMB) shared by
+    several machines, where leases and claims can be corrupted or deadlock.
+
+    Args:
+        path: sqlite database file, created if it does not exist
+        lease_seconds: seconds a worker has to complete a page before it is delivered
+            to another worker
+        max_attempts: deliveries of a page before it is marked failed
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 300, max_attempts: int = 3) -> None:
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self._lock = threading.Lock()
+        # transactions are opened explicitly, see _transaction
+        self._conn = sqlite3.connect(
+            path, timeout=60, isolation_level=None, check_same_thread=False
+        )
+        # local disk only, see the class docstring
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _transaction(self, sql_fn):
+        """Runs sql_fn(connection) in an immediate transaction, holding the write lock
+        of the database between the reads and the writes
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = sql_fn(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def publish(self, job_id: str, metadata: dict, ls_urls: List[dict]) -> int:
+        def insert(conn):
+            conn.execute(
+                "INSERT OR IGNORE INTO jobs (job_id, metadata, created) VALUES (?, ?, ?)",
+                (job_id, json.dumps(metadata), time.time()),
+            )
+            cursor = conn.executemany(
+                "INSERT OR IGNORE INTO tasks (job_id, idx, url, status) VALUES (?, ?, ?, 'pending')",
+                [(job_id, url_dict["idx"], url_dict["url"]) for url_dict in ls_urls],
+            )
+            return cursor.rowcount
+
+        return self._transaction(insert)
+
+    def claim(self, worker_id: str, max_tasks: int = 1) -> List[dict]:
+        def lease(conn):
+            now = time.time()
+            # pages leased by dead workers run out of attempts at some point
+            conn.execute(
+                "UPDATE tasks SET status = 'failed', error = 'lease expired' "
+                "WHERE status = 'leased' AND lease_until < ? AND attempts >= ?",
+                (now, self.max_attempts),
+            )
+            rows = conn.execute(
+                "SELECT job_id, idx, url, attempts FROM tasks "
+                "WHERE status = 'pending' OR (status = 'leased' AND lease_until < ?) "
+                "ORDER BY job_id, idx LIMIT ?",
+                (now, max_tasks),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE tasks SET status = 'leased', worker = ?, lease_until = ?, "
+                "attempts = attempts + 1 WHERE job_id = ? AND idx = ?",
+                [(worker_id, now + self.lease_seconds, job_id, idx) for job_id, idx, _, _ in rows],
+            )
+            return rows
+
+        tasks = []
+        metadata = {}
+        for job_id, idx, url, attempts in self._transaction(lease):
+            if job_id not in metadata:
+                metadata[job_id] = self.job(job_id)
+            tasks.append(
+                {
+                    "job_id": job_id,
+                    "idx": idx,
+                    "url": url,
+                    "attempts": attempts + 1,
+                    "metadata": metadata[job_id],
+                }
+            )
+        return tasks
+
+    def complete(self, job_id: str, idx: int, parsed: ParsedPage) -> bool:
+        data = encode_page(parsed)
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE tasks SET status = 'done', result = ?, lease_until = NULL, error = NULL "
+                "WHERE job_id = ? AND idx = ? AND status != 'done'",
+                (data, job_id, idx),
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: str, idx: int, worker_id: str, error: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "lease_until = NULL, error = ? "
+                "WHERE job_id = ? AND idx = ? AND worker = ? AND status = 'leased'",
+                (self.max_attempts, error, job_id, idx, worker_id),
+            )
+
+    def job(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT metadata FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def progress(self, job_id: str = None) -> dict:
+        sql = "SELECT status, COUNT(*) FROM tasks"
+        params = ()
+        if job_id is not None:
+            sql += " WHERE job_id = ?"
+            params = (job_id,)
+
+        with self._lock:
+            rows = self._conn.execute(sql + " GROUP BY status", params).fetchall()
+
+        counts = dict.fromkeys(TASK_STATES, 0)
+        counts.update(rows)
+        return counts
+
+    def tasks(self, job_id: str) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT idx, url, status, attempts, error FROM tasks "
+                "WHERE job_id = ? ORDER BY idx",
+                (job_id,),
+            ).fetchall()
+        return [dict(zip(("idx", "url", "status", "attempts", "error"), row)) for row in rows]
+
+    def iter_results(self, job_id: str) -> Iterator[ParsedPage]:
+        with self._lock:
+            idxs = [
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT idx FROM tasks WHERE job_id = ? AND status = 'done' ORDER BY idx",
+                    (job_id,),
+                )
+            ]
+
+        # one page at a time, the results of a big job are not loaded at once
+        for idx in idxs:
+            yield decode_page(self.result_data(job_id, idx))
+
+    def result_data(self, job_id: str, idx: int) -> Optional[bytes]:
+        """Returns the encoded result of a done page, None when the page is not done"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM tasks WHERE job_id = ? AND idx = ? AND status = 'done'",
+                (job_id, idx),
+            ).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class HttpWorkQueue(WorkQueue):
+    """WorkQueue served by a WorkQueueServer, for coordinators and workers spread over
+    several machines. The leases, attempts and results are kept by the SqliteWorkQueue
+    of the server, so claims stay atomic between all the workers.
+
+    Args:
+        url: url of the server, e.g. "http://10.0.0.5:8770"
+        token: shared secret of the server, QUEUE_TOKEN
+        timeout: (connect, read) timeout of the requests to the server, in seconds
+    """
+
+    def __init__(self, url: str, token: str = None, timeout: tuple = (10, 60)) -> None:
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self._session = requests.Session()
+        if token:
+            self._session.headers["Authorization"] = f"Bearer {token}"
+
+    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        response = self._session.request(
+            method, f"{self.url}{path}", timeout=self.timeout, **kwargs
+        )
+        response.raise_for_status()
+        return response
+
+    def publish(self, job_id: str, metadata: dict, ls_urls: List[dict]) -> int:
+        return self._request(
+            "POST",
+            "/publish",
+            json={"job_id": job_id, "metadata": metadata, "ls_urls": ls_urls},
+        ).json()["added"]
+
+    def claim(self, worker_id: str, max_tasks: int = 1) -> List[dict]:
+        return self._request(
+            "POST", "/claim", json={"worker_id": worker_id, "max_tasks": max_tasks}
+        ).json()["tasks"]
+
+    def complete(self, job_id: str, idx: int, parsed: ParsedPage) -> bool:
+        return self._request(
+            "POST",
+            "/complete",
+            params={"job_id": job_id, "idx": idx},
+            data=encode_page(parsed),
+            headers={"Content-Type": "application/octet-stream"},
+        ).json()["completed"]
+
+    def fail(self, job_id: str, idx: int, worker_id: str, error: str):
+        self._request(
+            "POST",
+            "/fail",
+            json={"job_id": job_id, "idx": idx, "worker_id": worker_id, "error": error},
+        )
+
+    def job(self, job_id: str) -> Optional[dict]:
+        return self._request("GET", "/job", params={"job_id": job_id}).json()["job"]
+
+    def progress(self, job_id: str = None) -> dict:
+        params = {} if job_id is None else {"job_id": job_id}
+        return self._request("GET", "/progress", params=params).json()["progress"]
+
+    def tasks(self, job_id: str) -> List[dict]:
+        return self._request("GET", "/tasks", params={"job_id": job_id}).json()["tasks"]
+
+    def iter_results(self, job_id: str) -> Iterator[ParsedPage]:
+        for task in self.tasks(job_id):
+            if task["status"] == "done":
+                response = self._request(
+                    "GET", "/result", params={"job_id": job_id, "idx": task["idx"]}
+                )
+                yield decode_page(response.content)
+
+    def close(self):
+        self._session.close()
+
+
+class WorkQueueServer:
+    """Serves a SqliteWorkQueue over HTTP, so the coordinators and workers of other
+    machines use it through HttpWorkQueue. The database stays on a local disk of the
+    machine of the server.
+
+    Every request must carry the token, when there is one, in an
+    "Authorization: Bearer <token>" header.
+
+    Args:
+        queue: queue to serve
+        host: address the server listens on, local clients only by default
+        port: port of the server, 0 picks a free port (see self.port)
+        token: shared secret of the coordinators and workers, QUEUE_TOKEN
+        logger: logger to use instead of the default one
+    """
+
+    def __init__(
+        self,
+        queue: SqliteWorkQueue,
+        host: str = "127.0.0.1",
+        port: int = 8770,
+        token: str = None,
+        logger: logging.Logger = None,
+    ) -> None:
+        self.queue = queue
+        self.token = token
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._server = http.server.ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+        self.host, self.port = self._server.server_address[:2]
+        if not token and host not in ("127.0.0.1", "localhost", "::1"):
+            self.logger.warning(
+                f"Work queue server listening on {host} without QUEUE_TOKEN, any client "
+                "which can reach it can claim and complete pages"
+            )
+
+    def _handler(self):
+        queue = self.queue
+        token = self.token
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def _authorized(self) -> bool:
+                if not token:
+                    return True
+                return hmac.compare_digest(
+                    self.headers.get("Authorization", ""), f"Bearer {token}"
+                )
+
+            def _send(self, body: bytes, content_type: str = "application/json"):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_json(self, data: dict):
+                self._send(json.dumps(data).encode("utf-8"))
+
+            def _body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def do_GET(self):
+                self._dispatch(self._get)
+
+            def do_POST(self):
+                self._dispatch(self._post)
+
+            def _dispatch(self, method):
+                if not self._authorized():
+                    self.send_error(401)
+                    return
+                try:
+                    method()
+                except (KeyError, ValueError, zlib.error) as ex:
+                    self.send_error(400, f"Bad request: {ex!r}")
+
+            def _get(self):
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+                if url.path == "/job":
+                    self._send_json({"job": queue.job(query["job_id"])})
+                elif url.path == "/progress":
+                    self._send_json({"progress": queue.progress(query.get("job_id"))})
+                elif url.path == "/tasks":
+                    self._send_json({"tasks": queue.tasks(query["job_id"])})
+                elif url.path == "/result":
+                    data = queue.result_data(query["job_id"], int(query["idx"]))
+                    if data is None:
+                        self.send_error(404)
+                        return
+                    self._send(data, "application/octet-stream")
+                else:
+                    self.send_error(404)
+
+            def _post(self):
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+                if url.path == "/complete":
+                    parsed = decode_page(self._body())
+                    completed = queue.complete(query["job_id"], int(query["idx"]), parsed)
+                    self._send_json({"completed": completed})
+                    return
+
+                body = json.loads(self._body())
+                if url.path == "/publish":
+                    added = queue.publish(body["job_id"], body["metadata"], body["ls_urls"])
+                    self._send_json({"added": added})
+                elif url.path == "/claim":
+                    self._send_json(
+                        {"tasks": queue.claim(body["worker_id"], body["max_tasks"])}
+                    )
+                elif url.path == "/fail":
+                    queue.fail(body["job_id"], body["idx"], body["worker_id"], body["error"])
+                    self._send_json({})
+                else:
+                    self.send_error(404)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """Serves the queue in a background thread"""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def serve_forever(self):
+        """Serves the queue until close() is called from another thread"""
+        self._server.serve_forever()
+
+    def close(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+        self._server.server_close()
+
+
+def open_work_queue(config: Config, path: str = None) -> WorkQueue:
+    """Opens the work queue at path, WORK_QUEUE_PATH of config.yml by default
+
+    Args:
+        config: loaded config.yml
+        path: sqlite database of the queue, or url of a WorkQueueServer
+    """
+    path = path or config.WORK_QUEUE_PATH
+    if path and path.startswith(("http://", "https://")):
+        return HttpWorkQueue(
+            path,
+            token=config.QUEUE_TOKEN,
+            timeout=(config.CONNECT_TIMEOUT, config.READ_TIMEOUT),
+        )
+    return SqliteWorkQueue(
+        path or f"{config.OUTPUT_DIR}/work_queue.sqlite",
+        lease_seconds=config.QUEUE_LEASE_SECONDS,
+        max_attempts=config.QUEUE_MAX_ATTEMPTS,
+    )
@@ -0,0 +1,184 @@
+import concurrent.futures
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+from core.metrics import PARSE_BUCKETS, Metrics, open_exporter
+from core.parse import parse_reviews_page
+from core.rate_limiter import TokenBucket
+from core.retry import fetch_with_retry
+from core.scrape import (
+    PROCESS_POOL_SIZE,
+    build_rate_controller,
+    build_retry_policy,
+    build_transport,
+    load_config,
+    setup_logger,
+)
+from core.work_queue import WorkQueue
+
+
+class QueueWorker:
+    """Fetches and parses the reviews pages of a WorkQueue. Several workers can run
+    against the same queue, for a SqliteWorkQueue they must run on its machine, the
+    workers of other machines reach it through a WorkQueueServer (HttpWorkQueue).
+
+    MAX_CONCURRENCY threads claim one page at a time, fetch it within the
+    REQUESTS_PER_SECOND rate of this worker, adapted to the throttling of the server
+    with ADAPTIVE_RATE, and parse it in a pool of processes. The
+    parsed page is stored in the queue, a page which fails is given back to the queue
+    and delivered again, possibly to another worker.
+
+    The requests and parse times are recorded in self.metrics, exported with
+    METRICS_FILE and METRICS_PORT while the worker runs.
+
+    Args:
+        queue: queue of the pages, see core.work_queue
+        worker_id: name of the worker in the queue, "<host>-<pid>" by default
+        wait: keep polling for new jobs when the queue is empty, instead of returning
+        poll_seconds: seconds between two claims when there is nothing to do
+        logger: logger to use instead of the default one
+    """
+
+    def __init__(
+        self,
+        queue: WorkQueue,
+        worker_id: str = None,
+        wait: bool = False,
+        poll_seconds: float = 2,
+        logger: logging.Logger = None,
+    ) -> None:
+        if "job_id" not in os.environ:
+            os.environ["job_id"] = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.wait = wait
+        self.poll_seconds = poll_seconds
+        self.logger = logger or setup_logger()
+
+        self.pages_done = 0
+        self.pages_failed = 0
+
+        self._config = load_config()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._transport = None
+        self._parse_pool = None
+        self._rate_limiter = None
+        self._rate_controller = None
+        self._retry_policy = build_retry_policy(self._config)
+        self.metrics = Metrics()
+
+    def stop(self):
+        """Stops claiming new pages, the pages being processed are finished"""
+        self._stop.set()
+
+    def _work_loop(self):
+        while not self._stop.is_set():
+            try:
+                tasks = self.queue.claim(self.worker_id)
+                if tasks:
+                    self._process(tasks[0])
+                    continue
+                progress = self.queue.progress()
+            except requests.RequestException as ex:
+                # the queue server is unreachable, the leased pages are delivered again
+                self.logger.warning(f"Work queue unreachable: {ex}")
+                self._stop.wait(self.poll_seconds)
+                continue
+
+            # leased pages may still be delivered again if their worker dies
+            if not self.wait and progress["pending"] + progress["leased"] == 0:
+                return
+            self._stop.wait(self.poll_seconds)
+
+    def _process(self, task: dict):
+        try:
+            self._rate_limiter.acquire()
+            response, error = fetch_with_retry(
+                self._transport,
+                task["url"],
+                self._retry_policy,
+                self._rate_limiter,
+                self._rate_controller,
+                self.metrics,
+            )
+            if response is None:
+                raise ValueError(error)
+
+            parsed = self._parse_pool.submit(
+                parse_reviews_page,
+                response.content,
+                task["idx"],
+                task["metadata"]["hotel_name"],
+                self._config.PARSER_BACKEND,
+            ).result()
+            self.queue.complete(task["job_id"], task["idx"], parsed)
+            self.metrics.inc("pages_parsed_total")
+            self.metrics.inc("reviews_parsed_total", len(parsed.rows))
+            self.metrics.observe("parse_seconds", parsed.parse_time, PARSE_BUCKETS)
+            with self._lock:
+                self.pages_done += 1
+
+        except Exception as ex:
+            self.metrics.inc("task_failures_total")
+            self.logger.warning(
+                f"Page {task['idx']} of job {task['job_id']} failed "
+                f"(attempt {task['attempts']}): {ex}"
+            )
+            self.queue.fail(task["job_id"], task["idx"], self.worker_id, str(ex))
+            with self._lock:
+                self.pages_failed += 1
+
+    def run(self) -> int:
+        """Processes pages until the queue has no page left, or until stop() is called
+
+        Returns:
+            number of pages completed by this worker
+        """
+        _start = time.time()
+        self.logger.info(
+            f"Worker {self.worker_id}: {self._config.MAX_CONCURRENCY} fetchers, "
+            f"{self._config.REQUESTS_PER_SECOND} req/s"
+        )
+        self._rate_limiter = TokenBucket(
+            self._config.REQUESTS_PER_SECOND, self._config.RATE_LIMIT_BURST
+        )
+        self._transport = build_transport(self._config, self._rate_limiter)
+        self._rate_controller = build_rate_controller(self._config, self._rate_limiter)
+        self._parse_pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=PROCESS_POOL_SIZE
+        )
+        exporter = open_exporter(self._config, self.metrics)
+
+        try:
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self._config.MAX_CONCURRENCY
+            ) as executor:
+                futures = [
+                    executor.submit(self._work_loop)
+                    for _ in range(self._config.MAX_CONCURRENCY)
+                ]
+                for future in futures:
+                    future.result()
+        finally:
+            self._transport.log_stats(self.logger)
+            if self._rate_controller is not None:
+                self._rate_controller.log_stats(self.logger)
+            self._transport.close()
+            self._parse_pool.shutdown()
+            self.metrics.log_summary(self.logger)
+            if exporter is not None:
+                exporter.close()
+
+        self.logger.info(
+            f"Worker {self.worker_id}: {self.pages_done} pages done, "
+            f"{self.pages_failed} failed in {time.time() - _start:.1f} seconds"
+        )
+        return self.pages_done
@@ -1,11 +1,39 @@
+import csv
+import logging
+import os
+import time
+from datetime import datetime
 from logging import Logger
 from typing import List
 
 import typer
-from core.scrape import Scrape
+from typer.core import TyperGroup
+from core.archive import read_metadata, reparse_archive
+from core.batch import BatchScraper, read_urls_file
+from core.parse import REVIEW_FIELDS
+from core.scrape import Scrape, load_config
+from core.url_parser import parse_booking_url
+from core.work_queue import SqliteWorkQueue, WorkQueueServer, open_work_queue
+from core.worker import QueueWorker
 from typing_extensions import Annotated
 
-app = typer.Typer()
+
+
+class DefaultCommandGroup(TyperGroup):
+    """Runs the `execute` command when the first argument is not the name of a
+    command, so `python run.py <hotel_name> <country>` keeps working. A hotel named
+    like a command is scraped with `python run.py execute <hotel_name> <country>`
+    """
+
+    default_command = "execute"
+
+    def resolve_command(self, ctx, args: List[str]):
+        if args and not args[0].startswith("-") and args[0] not in self.commands:
+            return self.default_command, self.commands[self.default_command], args
+        return super().resolve_command(ctx, args)
+
+
+app = typer.Typer(cls=DefaultCommandGroup)
 
 
 @app.command()
@@ -63,13 +91,30 @@ def execute(
             rich_help_panel="Secondary Arguments",
         ),
     ] = False,
+    incremental: Annotated[
+        bool,
+        typer.Option(
+            "--incremental",
+            help="Only scrape the reviews posted since the last incremental run of this hotel. Reviews are sorted by 'newest_first'",
+            rich_help_panel="Secondary Arguments",
+        ),
+    ] = False,
+    resume: Annotated[
+        str,
+        typer.Option(
+            help="Id of an interrupted job to resume: only the pages it did not save are scraped, and the reviews are appended to its output",
+            rich_help_panel="Secondary Arguments",
+        ),
+    ] = None,
 ):
+    """Scrapes the reviews of a hotel, the default command"""
     input_params = {
         "hotel_name": hotel_name,
         "country": country,
         "sort_by": sort_by,
         "n_rows": n_reviews,
         "download_photos": not no_download_photos,
+        "incremental": incremental,
     }
 
     if stop_criteria_username:
@@ -80,9 +125,362 @@ def execute(
 
         input_params["stop_critera"] = stop
 
-    s = Scrape(input_params, save_data_to_disk=save_review_to_disk)
-    ls_reviews = s.run()
-    print(f"Scrapping Complete: Total Reviews  {len(ls_reviews)}")
+    if resume:
+        os.environ["job_id"] = resume
+
+    # the reviews are streamed to the csv file, they are not kept in memory
+    s = Scrape(
+        input_params,
+        save_data_to_disk=save_review_to_disk,
+        keep_results=False,
+        resume=bool(resume),
+    )
+    s.run()
+    print(f"Scrapping Complete: Total Reviews  {s.n_reviews}")
+
+
+@app.command()
+def reparse(
+    archive: Annotated[
+        str,
+        typer.Argument(
+            default=..., help="Page archive of a job, see ARCHIVE_PAGES in config.yml"
+        ),
+    ],
+    backend: Annotated[
+        str,
+        typer.Option(
+            help="Parser backend: 'html.parser', 'lxml' or 'selectolax'",
+            rich_help_panel="Secondary Arguments",
+        ),
+    ] = "html.parser",
+    workers: Annotated[
+        int,
+        typer.Option(
+            help="Number of parse processes. 0 means all the cores",
+            rich_help_panel="Secondary Arguments",
+        ),
+    ] = 0,
+    output: Annotated[
+        str,
+        typer.Option(
+            help="Output csv file. Defaults to reviews_<sort_by>_reparsed.csv next to the archive",
+            rich_help_panel="Secondary Arguments",
+        ),
+    ] = None,
+):
+    """Parses the pages of an archive again, without sending any request"""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if output is None:
+        sort_by = read_metadata(archive).get("sort_by", "")
+        output = os.path.join(
+            os.path.dirname(archive), f"reviews_{sort_by}_reparsed.csv"
+        )
+
+    ls_reviews = reparse_archive(archive, backend, workers or None)
+    with open(output, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(REVIEW_FIELDS)
+        for row in ls_reviews:
+            writer.writerow(row.values())
+
+    print(f"Reparsing Complete: Total Reviews  {len(ls_reviews)} saved to {output}")
+
+
+@app.command()
+def batch(
+    urls_file: Annotated[
+        str,
+        typer.Argument(
+            default=..., help="Text file with one booking.com hotel url per line"
+        ),
+    ],
+    sort_by: Annotated[
+        str,
+        typer.Option(
+            help="Sort reviews by 'most_relevant', 'newest_first', 'oldest_first', 'highest_scores' or 'lowest_scores'",
+            rich_help_panel="Secondary Arguments",
+        ),
+    ] = "most_relevant",
+    n_reviews: Annotated[
+        int,
+        typer.Option(
+            help="Number of reviews to scrape from the top of every hotel. -1 means scrape all",
+            rich_help_panel="Secondary Arguments",
+        ),
+    ] = -1,
+    save_review_to_disk: Annotated[
+        bool,
+        typer.Option(
+            help="Whether to save reviews on the local disk or not",
+            rich_help_panel="Secondary Arguments",
+        ),
+    ] = True,
+    no_download_photos: Annotated[
+        bool,
+        typer.Option(
+            "--no-download-photos",
+            help="Skip downloading review photos",
+            rich_help_panel="Secondary Arguments",
+        ),
+    ] = False,
+    incremental: Annotated[
+        bool,
+        typer.Option(
+            "--incremental",
+            help="Only scrape the reviews posted since the last incremental run of every hotel",
+            rich_help_panel="Secondary Arguments",
+        ),
+    ] = False,
+):
+    """Scrapes all the hotels of a file of booking.com urls with one shared pipeline"""
+    input_params = {
+        "sort_by": sort_by,
+        "n_rows": n_reviews,
+        "download_photos": not no_download_photos,
+        "incremental": incremental,
+    }
+
+    hotels = BatchScraper(
+        read_urls_file(urls_file), input_params, save_data_to_disk=save_review_to_disk
+    ).run()
+    failed = [hotel for hotel in hotels if hotel["status"] == "failed"]
+    print(
+        f"Batch Complete: {len(hotels) - len(failed)}/{len(hotels)} hotels, "
+        f"Total Reviews  {sum(hotel['reviews'] for hotel in hotels)}"
+    )
+    for hotel in failed:
+        print(f"Failed: {hotel['url']} {hotel['error']}")
+
+
+@app.command()
+def coordinator(
+    hotel_name: Annotated[
+        str, typer.Argument(help="Hotel name from booking.com url")
+    ] = None,
+    country: Annotated[
+        str,
+        typer.Argument(
+            help="Two character country code (ALPHA-2 code) e.g. 'us'",
+        ),
+    ] = None,
+    urls_file: Annotated[
+        str,
+        typer.Option(
+            help="Text file with one booking.com hotel url per line, to publish the pages of all its hotels instead of one hotel",
+        ),
+    ] = None,
+    sort_by: Annotated[
+        str,
+        typer.Option(
+            help="Sort reviews by 'most_relevant', 'newest_first', 'oldest_first', 'highest_scores' or 'lowest_scores'",
+            rich_help_panel="Secondary Arguments",
+        ),
+    ] = "most_relevant",
+    queue: Annotated[
+        str,
+        typer.Option(
+            help="SQLite database of the work queue, or url of the queue server shared with the workers of other machines (see queue-server). Defaults to WORK_QUEUE_PATH",
+            rich_help_panel="Secondary Arguments",
+        ),
+    ] = None,
+    work: Annotated[
+        bool,
+        typer.Option(
+            "--work",
+            help="Also fetch and parse pages in this process while waiting for the workers",
+            rich_help_panel="Secondary Arguments",
+        ),
+    ] = False,
+    no_wait: Annotated[
+        bool,
+        typer.Option(
+            "--no-wait",
+            help="Only publish the pages, run 'merge <job_id>' once the workers are done",
+            rich_help_panel="Secondary Arguments",
+        ),
+    ] = False,
+    no_download_photos: Annotated[
+        bool,
+        typer.Option(
+            "--no-download-photos",
+            help="Skip downloading review photos",
+            rich_help_panel="Secondary Arguments",
+        ),
+    ] = False,
+):
+    """Publishes the reviews pages of a hotel, or of all the hotels of a file of urls,
+    to the work queue, waits for the workers and merges their results into the
+    outputs of the jobs
+    """
+    if urls_file:
+        hotels = []
+        for url in read_urls_file(urls_file):
+            try:
+                hotels.append(parse_booking_url(url))
+            except ValueError as ex:
+                print(f"Skipping url {url}: {ex}")
+    elif hotel_name and country:
+        hotels = [(hotel_name, country)]
+    else:
+        raise typer.BadParameter("Give a hotel name and a country, or --urls-file")
+
+    if "job_id" not in os.environ:
+        os.environ["job_id"] = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+    base_job_id = os.environ["job_id"]
+    work_queue = open_work_queue(load_config(), queue)
+
+    # every hotel is a job of the queue, the hotels of a file get their own job ids
+    jobs = {}  # job_id -> input parameters of the hotel
+    logger = None
+    for name, code in hotels:
+        job_id = f"{base_job_id}_{name}" if urls_file else base_job_id
+        os.environ["job_id"] = job_id
+        input_params = {
+            "hotel_name": name,
+            "country": code,
+            "sort_by": sort_by,
+            "download_photos": not no_download_photos,
+        }
+        s = Scrape(input_params, logger=logger, keep_results=False)
+        logger = s.logger
+        try:
+            s.publish(work_queue)
+        except Exception as ex:
+            logger.error(f"Could not publish the pages of {name}: {ex}")
+            continue
+        jobs[job_id] = input_params
+        print(f"Published job {job_id}")
+
+    if no_wait or not jobs:
+        return
+
+    if work:
+        QueueWorker(work_queue, logger=logger).run()
+
+    while True:
+        progress = {job_id: work_queue.progress(job_id) for job_id in jobs}
+        if not any(p["pending"] or p["leased"] for p in progress.values()):
+            break
+        for job_id, p in progress.items():
+            logger.info(
+                f"Job {job_id}: {p['done']} pages done, {p['leased']} in progress, "
+                f"{p['pending']} pending, {p['failed']} failed"
+            )
+        time.sleep(5)
+
+    for job_id, input_params in jobs.items():
+        os.environ["job_id"] = job_id
+        merged = Scrape(input_params, logger=logger, keep_results=False)
+        merged.merge(work_queue)
+        print(f"Scrapping Complete: {job_id} Total Reviews  {merged.n_reviews}")
+
+
+@app.command()
+def queue_server(
+    queue: Annotated[
+        str,
+        typer.Option(
+            help="SQLite database of the work queue, on a local disk of this machine. Defaults to WORK_QUEUE_PATH",
+        ),
+    ] = None,
+    host: Annotated[
+        str,
+        typer.Option(
+            help="Address to listen on, the address of this machine which the workers reach. Defaults to QUEUE_SERVER_HOST"
+        ),
+    ] = None,
+    port: Annotated[
+        int, typer.Option(help="Port to listen on. Defaults to QUEUE_SERVER_PORT")
+    ] = None,
+):
+    """Serves the SQLite work queue of this machine to the coordinators and workers of
+    other machines, which use http://<host>:<port> as their --queue
+    """
+    config = load_config()
+    work_queue = open_work_queue(config, queue)
+    if not isinstance(work_queue, SqliteWorkQueue):
+        raise typer.BadParameter("The queue served must be a SQLite database")
+
+    server = WorkQueueServer(
+        work_queue,
+        host=host or config.QUEUE_SERVER_HOST,
+        port=port or config.QUEUE_SERVER_PORT,
+        token=config.QUEUE_TOKEN,
+    )
+    print(f"Serving {work_queue.path} on http://{server.host}:{server.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        work_queue.close()
+
+
+@app.command()
+def worker(
+    queue: Annotated[
+        str,
+        typer.Option(
+            help="SQLite database of the work queue, or url of the queue server of the coordinator (see queue-server). Defaults to WORK_QUEUE_PATH",
+        ),
+    ] = None,
+    worker_id: Annotated[
+        str,
+        typer.Option(help="Name of the worker in the queue. Defaults to <host>-<pid>"),
+    ] = None,
+    wait: Annotated[
+        bool,
+        typer.Option(
+            "--wait", help="Keep waiting for new jobs when the queue is empty"
+        ),
+    ] = False,
+):
+    """Fetches and parses the pages of the work queue until it is empty"""
+    w = QueueWorker(open_work_queue(load_config(), queue), worker_id, wait=wait)
+    print(f"Worker Complete: {w.run()} pages")
+
+
+@app.command()
+def merge(
+    job_id: Annotated[
+        str, typer.Argument(default=..., help="Id of the job printed by the coordinator")
+    ],
+    queue: Annotated[
+        str,
+        typer.Option(
+            help="SQLite database of the work queue, or url of the queue server. Defaults to WORK_QUEUE_PATH",
+            rich_help_panel="Secondary Arguments",
+        ),
+    ] = None,
+    no_download_photos: Annotated[
+        bool,
+        typer.Option(
+            "--no-download-photos",
+            help="Skip downloading review photos",
+            rich_help_panel="Secondary Arguments",
+        ),
+    ] = False,
+):
+    """Merges the pages of a finished distributed job into the outputs of the job"""
+    os.environ["job_id"] = job_id
+    work_queue = open_work_queue(load_config(), queue)
+    job = work_queue.job(job_id)
+    if job is None:
+        raise typer.BadParameter(f"Unknown job: {job_id}")
+
+    s = Scrape(
+        {
+            "hotel_name": job["hotel_name"],
+            "country": job["country"],
+            "sort_by": job["sort_by"],
+            "download_photos": not no_download_photos,
+        },
+        keep_results=False,
+    )
+    s.merge(work_queue)
+    print(f"Scrapping Complete: Total Reviews  {s.n_reviews}")
 
 
 def run_as_module(
@@ -96,6 +494,8 @@ def run_as_module(
     download_photos: bool = True,
     logger: Logger | None = None,
     is_gui: bool = False,  # New parameter to indicate if called from GUI
+    incremental: bool = False,
+    resume: str | None = None,
 ) -> List[dict]:
     """To run the scrapper as module by third party code
 
@@ -110,6 +510,9 @@ def run_as_module(
         download_photos: Whether to download review photos along with reviews
         logger: Optional logger instance to use for logging
         is_gui: Whether the function is being called from GUI
+        incremental: Only scrape the reviews posted since the last incremental run of this hotel
+        resume: Id of an interrupted job to resume. Only the pages it did not save are scraped,
+            the reviews of these pages are returned and appended to the output of the job
     """
     input_params = {
         "hotel_name": hotel_name,
@@ -117,6 +520,7 @@ def run_as_module(
         "sort_by": sort_by,
         "n_rows": n_reviews,
         "download_photos": download_photos,
+        "incremental": incremental,
     }
 
     if stop_cri_user:
@@ -127,12 +531,21 @@ def run_as_module(
 
         input_params["stop_critera"] = stop
 
-    s = Scrape(input_params, save_data_to_disk=save_to_disk, logger=logger, is_gui=is_gui)  # Pass is_gui to Scrape
+    if resume:
+        os.environ["job_id"] = resume
+
+    s = Scrape(
+        input_params,
+        save_data_to_disk=save_to_disk,
+        logger=logger,
+        is_gui=is_gui,  # Pass is_gui to Scrape
+        resume=bool(resume),
+    )
     ls_reviews = s.run()
     print(f"Scrapping Complete: Total Reviews  {len(ls_reviews)}")
     return ls_reviews
 
 
 if __name__ == "__main__":
-    typer.run(execute)
+    app()
     # run_as_module('myhotel', 'es', 'newest_first', 20)
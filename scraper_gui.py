@@ -1,7 +1,6 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
-from run import run_as_module
-from core.url_parser import parse_booking_url
+from core.batch import BatchScraper
 import threading
 import logging
 import sys
@@ -131,36 +130,44 @@ def start_scraping():
         # Create a custom logger for this scraping session
         logger = setup_logger()
         
-        # Process each URL
-        for i, url in enumerate(urls, 1):
-            try:
-                # Update status
-                status_var.set(f"Processing property {i}/{len(urls)}...")
-                
-                # Parse URL to get hotel name and country
-                hotel_name, country = parse_booking_url(url)
-                
-                # Set the job_id environment variable for this run
-                os.environ["job_id"] = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
-                
-                reviews = run_as_module(
-                    hotel_name=hotel_name,
-                    country=country,
-                    sort_by=sort,
-                    n_reviews=n_reviews,
-                    save_to_disk=save,
-                    stop_cri_user=stop_user,
-                    stop_cri_title=stop_title,
-                    download_photos=download_photos,
-                    logger=logger,
-                    is_gui=True
-                )
-                total_reviews += len(reviews)
-                
-            except Exception as e:
-                failed_urls.append((url, str(e)))
-                logger.error(f"Failed to process URL: {url}\nError: {str(e)}")
-                continue
+        # One job id for the whole batch, every property gets its own output directory
+        os.environ["job_id"] = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+
+        input_params = {
+            "sort_by": sort,
+            "n_rows": n_reviews,
+            "download_photos": download_photos,
+        }
+        if stop_user:
+            input_params["stop_critera"] = {"username": stop_user}
+            if stop_title:
+                input_params["stop_critera"]["review_text_title"] = stop_title
+
+        n_finished = [0]
+
+        def on_hotel_done(hotel):
+            n_finished[0] += 1
+            status_var.set(f"Finished property {n_finished[0]}/{len(urls)}...")
+
+        # All the properties share one fetch/parse pipeline, several at a time
+        status_var.set(f"Processing {len(urls)} properties...")
+        try:
+            hotels = BatchScraper(
+                urls,
+                input_params,
+                save_data_to_disk=save,
+                logger=logger,
+                is_gui=True,
+                on_hotel_done=on_hotel_done,
+            ).run()
+        except Exception as e:
+            logger.error(f"Batch failed: {str(e)}")
+            hotels = [{"url": url, "status": "failed", "reviews": 0, "error": str(e)} for url in urls]
+
+        for hotel in hotels:
+            total_reviews += hotel["reviews"]
+            if hotel["status"] == "failed":
+                failed_urls.append((hotel["url"], hotel["error"]))
         
         # Show final results
         status_message = f"Scraping complete!\nTotal reviews scraped: {total_reviews}"
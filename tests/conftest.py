@@ -0,0 +1,89 @@
+import http.server
+import os
+import shutil
+import threading
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import yaml
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE_PAGE = os.path.join(os.path.dirname(__file__), "fixtures", "reviews_page.html")
+
+# hotels of the fake server whose first review has a date which cannot be parsed
+BAD_DATE_HOTEL = "bad-date"
+# hotels of the fake server with MANY_PAGES pages of 10 reviews, the guests of the page
+# at offset 20 are named "User 20-0" to "User 20-9"
+MANY_PAGES_HOTEL = "many-pages"
+MANY_PAGES = 5
+
+_PAGINATION = (
+    b'<div class="bui-pagination__item"><a href="/reviewlist.en-gb.html?pagename=x&offset=0;rows=10">'
+    b"<span>Page 1</span></a></div>"
+)
+
+
+def many_pages_body(body: bytes, offset: int) -> bytes:
+    """The fixture page at `offset` of a MANY_PAGES_HOTEL"""
+    pagination = b"".join(
+        _PAGINATION.replace(b"offset=0", f"offset={i * 10}".encode()).replace(
+            b"Page 1", f"Page {i + 1}".encode()
+        )
+        for i in range(MANY_PAGES)
+    )
+    return body.replace(b"User ", f"User {offset}-".encode()).replace(
+        _PAGINATION, pagination
+    )
+
+
+class _ReviewsHandler(http.server.BaseHTTPRequestHandler):
+    """Serves the fixture reviews page for every hotel"""
+
+    def do_GET(self):
+        with open(FIXTURE_PAGE, "rb") as file:
+            body = file.read()
+        query = parse_qs(urlparse(self.path).query)
+        if BAD_DATE_HOTEL in query.get("pagename", [""])[0]:
+            body = body.replace(b"Reviewed: 28 January 2024", b"Reviewed: sometime", 1)
+        if MANY_PAGES_HOTEL in query.get("pagename", [""])[0]:
+            body = many_pages_body(body, int(query.get("offset", ["0"])[0]))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def booking_server():
+    """Fake booking.com serving the fixture reviews page, yields its reviews page url"""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _ReviewsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/reviewlist.en-gb.html"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch, booking_server):
+    """Runs the test in a temporary directory, with the config.yml of the repo pointed
+    at the fake server
+    """
+    with open(os.path.join(ROOT_DIR, "config.yml"), "r") as file:
+        config = yaml.safe_load(file)
+    config["HOTEL_REVIEWS_PAGE"] = booking_server
+    config["REQUESTS_PER_SECOND"] = 100
+    config["RETRY_BASE_DELAY"] = 0.01
+
+    with open(tmp_path / "config.yml", "w") as file:
+        yaml.safe_dump(config, file)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("job_id", "test_job")
+    yield tmp_path
+    shutil.rmtree(tmp_path / "logs", ignore_errors=True)
@@ -0,0 +1,39 @@
+import zlib
+
+from core.archive import MAGIC, PageArchive, iter_pages, read_metadata
+
+
+def _write(path, pages, metadata=None):
+    archive = PageArchive(str(path), metadata or {"hotel_name": "testhotel"})
+    for idx, content in pages:
+        archive.append(idx, content)
+    archive.close()
+
+
+def test_append_after_torn_frame(tmp_path):
+    path = tmp_path / "pages.archive"
+    _write(path, [(0, b"page 0"), (25, b"page 25")])
+    # a run interrupted while writing a frame
+    data = zlib.compress(b"page 50")
+    with open(path, "ab") as file:
+        file.write((50).to_bytes(8, "big") + len(data).to_bytes(4, "big") + data[:3])
+
+    _write(path, [(50, b"page 50"), (75, b"page 75")])
+
+    assert list(iter_pages(str(path))) == [
+        (0, b"page 0"),
+        (25, b"page 25"),
+        (50, b"page 50"),
+        (75, b"page 75"),
+    ]
+    assert read_metadata(str(path)) == {"hotel_name": "testhotel"}
+
+
+def test_append_after_torn_header(tmp_path):
+    path = tmp_path / "pages.archive"
+    path.write_bytes(MAGIC[:3])
+
+    _write(path, [(0, b"page 0")], {"hotel_name": "other"})
+
+    assert list(iter_pages(str(path))) == [(0, b"page 0")]
+    assert read_metadata(str(path)) == {"hotel_name": "other"}
@@ -0,0 +1,33 @@
+import threading
+
+import pytest
+
+from core.batch import BatchScraper
+
+
+@pytest.mark.parametrize("n_rows", [-1, 40])
+def test_failed_hotel_does_not_stop_the_batch(workdir, n_rows):
+    batch = BatchScraper(
+        [
+            "https://www.booking.com/hotel/us/good-hotel.html",
+            "https://www.booking.com/hotel/us/bad-date.html",
+        ],
+        {"n_rows": n_rows, "download_photos": False},
+    )
+    hotels = batch.run()
+
+    good, bad = hotels
+    assert good["status"] == "done"
+    assert good["reviews"] == 10
+    assert (workdir / "output" / "good-hotel_test_job" / "reviews_most_relevant.csv").exists()
+    if n_rows != -1:
+        # the date is parsed by the scraper process in the conditional modes
+        assert bad["status"] == "failed"
+
+    # the progress threads of the hotels, failed or not, are stopped
+    lingering = [
+        thread
+        for thread in threading.enumerate()
+        if thread.is_alive() and thread.name != "MainThread" and not thread.daemon
+    ]
+    assert lingering == []
@@ -0,0 +1,129 @@
+import http.server
+import threading
+import time
+
+import pytest
+
+from core.cache import ResponseCache
+from core.transport import HttpTransport
+
+BODY = b"<html>reviews</html>"
+
+
+class _Response:
+    def __init__(self, content: bytes, status_code: int = 200) -> None:
+        self.status_code = status_code
+        self.content = content
+        self.headers = {}
+
+
+class _ValidatingHandler(http.server.BaseHTTPRequestHandler):
+    """Sends the validators of the server's `validator` header, and answers 304 to a
+    request which revalidates them
+    """
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        name, value = server.validator or (None, None)
+        conditional = {"ETag": "If-None-Match", "Last-Modified": "If-Modified-Since"}
+        if name and self.headers.get(conditional[name]) == value:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        if name:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _ValidatingHandler)
+    server.requests = []
+    server.validator = None
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/reviews"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _transport(tmp_path, ttl: int) -> HttpTransport:
+    return HttpTransport(cache=ResponseCache(str(tmp_path / "cache"), ttl=ttl))
+
+
+def test_fresh_entries_are_served_without_a_request(tmp_path, server):
+    transport = _transport(tmp_path, ttl=3600)
+
+    assert transport.get(server.url).content == BODY
+    response = transport.get(server.url)
+
+    assert response.content == BODY and response.from_cache
+    assert len(server.requests) == 1
+    assert transport.cache.stats()["hits"] == 1
+    transport.close()
+
+
+@pytest.mark.parametrize(
+    "validator",
+    [("ETag", '"v1"'), ("Last-Modified", "Sun, 28 Jan 2024 10:00:00 GMT")],
+    ids=["etag", "last_modified"],
+)
+def test_stale_entries_are_revalidated(tmp_path, server, validator):
+    server.validator = validator
+    transport = _transport(tmp_path, ttl=0)
+
+    transport.get(server.url)
+    response = transport.get(server.url)
+
+    assert response.content == BODY and response.from_cache
+    assert len(server.requests) == 2
+    conditional = {"ETag": "If-None-Match", "Last-Modified": "If-Modified-Since"}
+    assert server.requests[1].get(conditional[validator[0]]) == validator[1]
+    assert transport.cache.stats()["revalidated"] == 1
+    transport.close()
+
+
+def test_stale_entries_without_validators_are_fetched_again(tmp_path, server):
+    transport = _transport(tmp_path, ttl=0)
+
+    transport.get(server.url)
+    response = transport.get(server.url)
+
+    assert not getattr(response, "from_cache", False)
+    assert "If-None-Match" not in server.requests[1]
+    assert transport.cache.stats()["misses"] == 2
+    transport.close()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache"), max_bytes=250)
+    for url in ("a", "b"):
+        cache.store(url, _Response(b"x" * 100))
+        time.sleep(0.01)
+    # "a" is used again, "b" is now the least recently used
+    cache.serve(cache.lookup("a"))
+    time.sleep(0.01)
+    cache.store("c", _Response(b"x" * 100))
+
+    assert cache.lookup("a") is not None and cache.lookup("c") is not None
+    assert cache.lookup("b") is None
+    assert cache.stats()["size_bytes"] == 200
+
+    # a smaller cache opened on the same directory evicts down to its size
+    cache = ResponseCache(str(tmp_path / "cache"), max_bytes=100)
+    assert cache.lookup("a") is None and cache.lookup("c") is not None
+
+
+def test_error_responses_are_not_cached(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache"))
+    cache.store("a", _Response(b"busy", status_code=503))
+    assert cache.lookup("a") is None
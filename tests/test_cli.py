@@ -0,0 +1,47 @@
+import pytest
+from typer.testing import CliRunner
+
+import run
+
+
+class _FakeScrape:
+    """Records the input of the execute command instead of scraping"""
+
+    inputs = []
+
+    def __init__(self, input_params: dict, **kwargs) -> None:
+        self.inputs.append(input_params)
+        self.n_reviews = 0
+
+    def run(self):
+        return []
+
+
+@pytest.fixture
+def scrapes(monkeypatch):
+    _FakeScrape.inputs = []
+    monkeypatch.setattr(run, "Scrape", _FakeScrape)
+    return _FakeScrape.inputs
+
+
+def test_hotel_is_the_default_command(scrapes):
+    result = CliRunner().invoke(run.app, ["my-hotel", "us", "--n-reviews", "5"])
+
+    assert result.exit_code == 0, result.output
+    assert scrapes[0]["hotel_name"] == "my-hotel"
+    assert scrapes[0]["country"] == "us"
+    assert scrapes[0]["n_rows"] == 5
+
+
+def test_hotel_named_like_a_command(scrapes):
+    result = CliRunner().invoke(run.app, ["execute", "batch", "us"])
+
+    assert result.exit_code == 0, result.output
+    assert scrapes[0]["hotel_name"] == "batch"
+
+
+def test_subcommand(tmp_path, scrapes):
+    result = CliRunner().invoke(run.app, ["reparse", str(tmp_path / "missing.archive")])
+
+    assert result.exit_code != 0
+    assert scrapes == []
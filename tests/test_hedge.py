@@ -0,0 +1,103 @@
+import threading
+import time
+
+from core.hedge import HedgedTransport
+from core.rate_limiter import TokenBucket
+
+
+class _Response:
+    def __init__(self, url: str) -> None:
+        self.url = url
+
+    def close(self):
+        pass
+
+
+class _SlowTransport:
+    """Answers in 10 ms, the first request of `slow_url` takes 0.5 seconds"""
+
+    cache = None
+
+    def __init__(self, slow_url: str) -> None:
+        self.slow_url = slow_url
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def get(self, url: str, params: dict = None, **kwargs):
+        with self._lock:
+            self.requests += 1
+            first = self.requests == 1
+        time.sleep(0.5 if url == self.slow_url and first else 0.01)
+        return _Response(url)
+
+    def close(self):
+        pass
+
+
+def _hedger(rate_limiter: TokenBucket) -> HedgedTransport:
+    transport = _SlowTransport("https://example.com/slow")
+    hedger = HedgedTransport(transport, budget=1, rate_limiter=rate_limiter)
+    for _ in range(20):
+        hedger.latencies.add(0.01)
+    return hedger
+
+
+def test_hedge_takes_a_token():
+    bucket = TokenBucket(1000, capacity=5)
+    hedger = _hedger(bucket)
+    hedger.requests = 10
+
+    _start = time.time()
+    response = hedger.get("https://example.com/slow")
+
+    assert response.url == "https://example.com/slow"
+    assert hedger.hedges == 1 and hedger.hedge_wins == 1
+    assert time.time() - _start < 0.4
+    hedger.close()
+
+
+def test_no_hedge_without_a_token():
+    bucket = TokenBucket(0.01)
+    bucket.acquire()  # the page requests use all the tokens
+    hedger = _hedger(bucket)
+    hedger.requests = 10
+
+    hedger.get("https://example.com/slow")
+
+    assert hedger.hedges == 0
+    assert hedger.rate_limited == 1
+    assert hedger.transport.requests == 1
+    hedger.close()
+
+
+class _SteadyTransport:
+    """Answers every request in 0.1 seconds"""
+
+    cache = None
+
+    def get(self, url: str, params: dict = None, **kwargs):
+        time.sleep(0.1)
+        return _Response(url)
+
+    def close(self):
+        pass
+
+
+def test_requests_waiting_for_a_thread_are_not_hedged():
+    hedger = HedgedTransport(_SteadyTransport(), budget=1, max_workers=1)
+    for _ in range(20):
+        hedger.latencies.add(0.3)
+    hedger.requests = 10
+
+    # the pool runs one request at a time, the last ones wait longer than the p95
+    threads = [
+        threading.Thread(target=hedger.get, args=(f"https://example.com/{i}",))
+        for i in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert hedger.hedges == 0
+    hedger.close()
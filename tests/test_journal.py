@@ -0,0 +1,91 @@
+import csv
+
+import pytest
+import yaml
+
+from core.journal import JobJournal
+from core.scrape import Scrape
+
+from .conftest import MANY_PAGES, MANY_PAGES_HOTEL
+
+INPUT = {"hotel_name": MANY_PAGES_HOTEL, "country": "us", "download_photos": False}
+
+
+@pytest.fixture
+def job_dir(workdir):
+    """Output directory of the job, every page is saved as soon as it is parsed"""
+    with open(workdir / "config.yml", "r") as file:
+        config = yaml.safe_load(file)
+    config["CSV_BATCH_ROWS"] = 10
+    with open(workdir / "config.yml", "w") as file:
+        yaml.safe_dump(config, file)
+    return workdir / "output" / f"{MANY_PAGES_HOTEL}_test_job"
+
+
+def _interrupted_run(monkeypatch, n_pages: int):
+    """Runs the job, it is interrupted by Ctrl-C once n_pages pages are saved"""
+    keep_page = Scrape._keep_page
+    kept = []
+
+    def interrupted_keep_page(self, page: dict):
+        if len(kept) == n_pages:
+            raise KeyboardInterrupt
+        kept.append(page["idx"])
+        keep_page(self, page)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(Scrape, "_keep_page", interrupted_keep_page)
+        with pytest.raises(KeyboardInterrupt):
+            Scrape(INPUT, keep_results=False).run()
+    return set(kept)
+
+
+def _saved_usernames(job_dir) -> list:
+    with open(job_dir / "reviews_most_relevant.csv", newline="", encoding="utf-8") as file:
+        return [row["username"] for row in csv.DictReader(file)]
+
+
+def _expected_usernames() -> set:
+    return {f"User {page * 10}-{i}" for page in range(MANY_PAGES) for i in range(10)}
+
+
+def test_resume_after_interruption(job_dir, monkeypatch):
+    saved = _interrupted_run(monkeypatch, n_pages=2)
+
+    state = JobJournal.load(job_dir / "journal_most_relevant.jsonl")
+    assert not state["finished"]
+    assert state["done"] == saved
+    assert len(_saved_usernames(job_dir)) == 20
+
+    Scrape(INPUT, keep_results=False, resume=True).run()
+
+    usernames = _saved_usernames(job_dir)
+    assert len(usernames) == len(set(usernames))
+    assert set(usernames) == _expected_usernames()
+    state = JobJournal.load(job_dir / "journal_most_relevant.jsonl")
+    assert state["finished"] and state["runs"] == 2
+    assert state["done"] == {page * 10 for page in range(MANY_PAGES)}
+
+
+def test_resume_after_a_torn_journal_line(job_dir, monkeypatch):
+    _interrupted_run(monkeypatch, n_pages=3)
+
+    # the process died while it appended the record of the last page it saved
+    path = job_dir / "journal_most_relevant.jsonl"
+    lines = path.read_text(encoding="utf-8").splitlines(keepends=True)
+    done_lines = [i for i, line in enumerate(lines) if '"done"' in line]
+    lines = lines[: done_lines[-1] + 1]
+    lines[-1] = lines[-1][: len(lines[-1]) // 2]
+    path.write_text("".join(lines), encoding="utf-8")
+    assert len(JobJournal.load(path)["done"]) < 3
+
+    Scrape(INPUT, keep_results=False, resume=True).run()
+
+    # the page of the torn record is scraped again, its reviews are not saved twice
+    usernames = _saved_usernames(job_dir)
+    assert len(usernames) == len(set(usernames))
+    assert set(usernames) == _expected_usernames()
+    # the records of the resumed run are not lost after the torn line
+    state = JobJournal.load(path)
+    assert state["finished"] and state["runs"] == 2
+    assert state["done"] == {page * 10 for page in range(MANY_PAGES)}
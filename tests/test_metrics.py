@@ -0,0 +1,17 @@
+import urllib.request
+
+from core.metrics import Metrics, MetricsExporter
+
+
+def test_exporter_listens_on_localhost_by_default():
+    metrics = Metrics()
+    metrics.inc("requests_total", status=200)
+    exporter = MetricsExporter(metrics, port=0)
+    try:
+        host, port = exporter._server.server_address
+        assert host == "127.0.0.1"
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            body = response.read().decode("utf-8")
+        assert 'booking_scraper_requests_total{status="200"} 1' in body
+    finally:
+        exporter.close()
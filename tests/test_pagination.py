@@ -0,0 +1,81 @@
+import pytest
+
+from core.scrape import Scrape
+
+# MAX_PAGE_SIZE of the config.yml of the tests
+REQUESTED_SIZE = 25
+
+
+class _Response:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, content: bytes) -> None:
+        self.content = content
+
+    def close(self):
+        pass
+
+
+class _CannedTransport:
+    """Answers the pagination probe with a canned reviews page"""
+
+    cache = None
+
+    def __init__(self, n_reviews: int, page_offsets: list) -> None:
+        self.content = _reviews_page(n_reviews, page_offsets)
+
+    def get(self, url: str, params: dict = None, **kwargs):
+        return _Response(self.content)
+
+    def close(self):
+        pass
+
+
+def _reviews_page(n_reviews: int, page_offsets: list) -> bytes:
+    """A reviews page with n_reviews reviews and links to the pages at page_offsets"""
+    reviews = "".join(
+        f'<li class="review_list_new_item_block"><span>User {i}</span></li>'
+        for i in range(n_reviews)
+    )
+    links = "".join(
+        f'<div class="bui-pagination__item"><a href="/reviewlist.en-gb.html?pagename=x&amp;'
+        f'offset={offset};rows={REQUESTED_SIZE}"><span>Page {i + 1}</span></a></div>'
+        for i, offset in enumerate(page_offsets)
+    )
+    return (
+        f'<html><body><ul class="review_list">{reviews}</ul><div class="bui-pagination__pages">'
+        f'<div class="bui-pagination__list">{links}</div></div></body></html>'
+    ).encode()
+
+
+@pytest.mark.parametrize(
+    "n_reviews, page_offsets, page_size, max_offset",
+    [
+        # the server honors rows
+        (25, [0, 25, 50, 75], 25, 75),
+        # the server ignores rows and sends its default 10 reviews per page
+        (10, [0, 10, 20, 30, 40], 10, 40),
+        # the server caps rows below MAX_PAGE_SIZE
+        (20, [0, 20, 40, 60], 20, 60),
+        # the probe page is truncated, its 25 reviews per page are not trusted and the
+        # last page (reviews 75 to 99) is realigned on pages of 10
+        (7, [0, 25, 50, 75], 10, 90),
+        # a single page, without any offset
+        (3, [], REQUESTED_SIZE, 0),
+    ],
+    ids=["honored", "ignored", "capped", "truncated", "single_page"],
+)
+def test_page_size_adapts_to_the_server(workdir, n_reviews, page_offsets, page_size, max_offset):
+    scraper = Scrape(
+        {"hotel_name": "good-hotel", "country": "us"},
+        save_data_to_disk=False,
+        transport=_CannedTransport(n_reviews, page_offsets),
+    )
+
+    assert scraper._get_max_offset_parameter() == max_offset
+    assert scraper._page_size == page_size
+    # the pages cover the reviews of the last page of the server
+    ls_urls = scraper._create_urls()
+    assert ls_urls[-1]["idx"] == max_offset
+    assert all(b["idx"] - a["idx"] == page_size for a, b in zip(ls_urls, ls_urls[1:]))
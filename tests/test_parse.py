@@ -0,0 +1,203 @@
+import logging
+import os
+
+import pytest
+from bs4 import BeautifulSoup
+
+from core.parse import (
+    REVIEW_FIELDS,
+    benchmark_backends,
+    compare_backends,
+    parse_reviews_page,
+    rows_to_reviews,
+)
+from core.parser_backends import SoupBackend, available_backends
+from core.sinks import OrderedCsvSink
+
+from .conftest import many_pages_body
+
+FIXTURE_PAGE = os.path.join(os.path.dirname(__file__), "fixtures", "reviews_page.html")
+
+
+# two guests with the same first name, who only left a score, on the same day
+_NAMESAKE_REVIEW = (
+    '<li class="review_list_new_item_block"><div class="c-review-block">'
+    '<div class="c-review-block__guest"><div class="bui-avatar-block">'
+    '<span class="bui-avatar-block__title">Anna</span>'
+    '<span class="bui-avatar-block__subtitle">{country}</span></div></div>'
+    '<div class="c-review-block__room-info-row"><div class="bui-list__body">{room}</div></div>'
+    '<span class="c-review-block__date">Reviewed: 3 March 2024</span>'
+    '<div class="bui-review-score__badge">{score}</div>'
+    '<div class="c-review"></div></div></li>'
+)
+NAMESAKES_PAGE = (
+    '<html><body><ul class="review_list">'
+    + _NAMESAKE_REVIEW.format(country="Italy", room="Double Room", score="9")
+    + _NAMESAKE_REVIEW.format(country="Germany", room="Twin Room", score="7")
+    + "</ul></body></html>"
+).encode()
+
+# the cases where the single pass walk and the per field css queries could differ:
+# nested spans around the date, fields outside of their container, repeated fields,
+# two owner responses and two photo lists
+EDGE_CASES_PAGE = (
+    '<html><body><ul class="review_list"><li><div class="c-review-block">'
+    '<span class="bui-avatar-block__title">Not the guest</span>'
+    '<div class="c-review-block__guest"><span class="bui-avatar-block__title">Anna</span>'
+    '<span class="bui-avatar-block__title">Second title</span></div>'
+    '<span class="outer"><span class="inner">Reviewed: 3 March 2024</span> (edited)</span>'
+    '<h3 class="c-review-block__title">First</h3><h3 class="c-review-block__title">Second</h3>'
+    '<div class="c-review"><span class="c-review__body" lang="en">Liked '
+    '<span class="c-review__body">nested</span></span></div>'
+    '<p class="--unhelpful">outside of the votes</p>'
+    '<div class="c-review-block__row--helpful-vote"><p class="--unhelpful">2 unhelpful</p></div>'
+    '<div class="c-review-block__response"><span class="c-review-block__response__body">'
+    "Thanks</span><span class=\"c-review-block__response__body\">Thanks again</span></div>"
+    '<ul class="c-review-block__photos"><li><button class="c-review-block__photos__button" '
+    'data-photos-src="https://example.com/1.jpg"></button></li></ul>'
+    '<ul class="c-review-block__photos"><li><button class="c-review-block__photos__button" '
+    'data-photos-src="https://example.com/2.jpg"></button></li></ul>'
+    "</div></li></ul></body></html>"
+).encode()
+
+
+@pytest.fixture(scope="module")
+def content() -> bytes:
+    with open(FIXTURE_PAGE, "rb") as file:
+        return file.read()
+
+
+def test_parse_fixture_page(content):
+    reviews = rows_to_reviews(parse_reviews_page(content, 0, "testhotel").rows)
+
+    assert len(reviews) == 10
+    assert reviews[0]["username"] == "User 0"
+    assert reviews[0]["hotel_name"] == "testhotel"
+    assert reviews[0]["review_post_date"] == "01-28-2024 00:00:00"
+    assert reviews[0]["review_photos"] and reviews[1]["review_photos"] == []
+    assert len({review["review_id"] for review in reviews}) == 10
+
+
+def test_review_without_body_or_lang(content):
+    reviews = rows_to_reviews(parse_reviews_page(content, 0, "testhotel").rows)
+
+    no_body, no_lang = reviews[8], reviews[9]
+    assert no_body["original_lang"] is None
+    assert no_body["review_text_liked"] is None
+    assert no_body["en_full_review"] is None
+    assert no_body["full_review"] == "title: Great stay 8."
+
+    assert no_lang["original_lang"] is None
+    assert no_lang["review_text_liked"] == "Liked it a lot 9"
+    assert no_lang["en_full_review"] is None
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_backends_give_identical_rows(content, backend):
+    expected = parse_reviews_page(content, 0, "testhotel", "html.parser").rows
+    rows = parse_reviews_page(content, 0, "testhotel", backend).rows
+
+    assert len(rows) == len(expected)
+    for exp, got in zip(expected, rows):
+        assert dict(zip(REVIEW_FIELDS, got)) == dict(zip(REVIEW_FIELDS, exp))
+
+
+def _per_field_reviews(html: str, features: str):
+    """The raw reviews of SoupBackend before the single pass walk: one css query per
+    field, and a get_text() of every span to find the review date
+    """
+
+    def text(element):
+        return element.text if element is not None else None
+
+    soup = BeautifulSoup(html, features)
+    for review in soup.select("ul.review_list > li"):
+        photos = []
+        photos_ul = review.find("ul", class_="c-review-block__photos")
+        if photos_ul:
+            photos = [
+                button.get("data-photos-src", "")
+                for button in photos_ul.find_all(
+                    "button", class_="c-review-block__photos__button"
+                )
+            ]
+        responses = review.select(
+            "div.c-review-block__response span.c-review-block__response__body"
+        )
+
+        yield dict(
+            username=text(
+                review.select_one("div.c-review-block__guest span.bui-avatar-block__title")
+            ),
+            user_country=text(
+                review.select_one("div.c-review-block__guest span.bui-avatar-block__subtitle")
+            ),
+            room_view=text(
+                review.select_one("div.c-review-block__room-info-row div.bui-list__body")
+            ),
+            stay_duration=text(
+                review.select_one("ul.c-review-block__stay-date div.bui-list__body")
+            ),
+            stay_type=text(
+                review.select_one("ul.review-panel-wide__traveller_type div.bui-list__body")
+            ),
+            review_title=text(review.select_one("h3.c-review-block__title")),
+            date=text(
+                review.find(lambda tag: tag.name == "span" and "Reviewed:" in tag.get_text())
+            ),
+            rating=text(review.select_one("div.bui-review-score__badge")),
+            bodies=[
+                (body.text, body.get("lang", default=None))
+                for body in review.select("div.c-review span.c-review__body")
+            ],
+            found_helpful=text(
+                review.select_one(
+                    "div.c-review-block__row--helpful-vote "
+                    "p.review-helpful__vote-others-helpful"
+                )
+            ),
+            found_unhelpful=text(
+                review.select_one("div.c-review-block__row--helpful-vote p.--unhelpful")
+            ),
+            owner_response=responses[-1].text if responses else None,
+            photos=photos,
+        )
+
+
+@pytest.mark.parametrize(
+    "features", [name for name in ("html.parser", "lxml") if name in available_backends()]
+)
+@pytest.mark.parametrize("page", ["fixture", "many_pages", "namesakes", "edge_cases"])
+def test_single_pass_walk_gives_the_per_field_reviews(content, features, page):
+    html = {
+        "fixture": content,
+        "many_pages": many_pages_body(content, 40),
+        "namesakes": NAMESAKES_PAGE,
+        "edge_cases": EDGE_CASES_PAGE,
+    }[page].decode()
+
+    raw_reviews = list(SoupBackend(features).iter_reviews(html))
+
+    assert raw_reviews
+    assert raw_reviews == list(_per_field_reviews(html, features))
+
+
+def test_compare_and_benchmark_return_their_results(caplog):
+    backends = available_backends()
+    with caplog.at_level(logging.INFO, logger="core.parse"):
+        mismatches = compare_backends([FIXTURE_PAGE], backends)
+        results = benchmark_backends([FIXTURE_PAGE], backends, repeat=1)
+
+    assert mismatches == {name: [] for name in backends}
+    assert set(results) == set(backends) and all(ms > 0 for ms in results.values())
+    assert "0 mismatches" in caplog.text and "ms/review" in caplog.text
+
+
+def test_score_only_reviews_of_namesakes_are_kept(tmp_path):
+    reviews = rows_to_reviews(parse_reviews_page(NAMESAKES_PAGE, 0, "testhotel").rows)
+    assert reviews[0]["review_id"] != reviews[1]["review_id"]
+
+    sink = OrderedCsvSink(str(tmp_path / "reviews.csv"), [0])
+    sink.add(0, reviews)
+    sink.close()
+    assert sink.rows_written == 2 and sink.duplicates == 0
@@ -0,0 +1,176 @@
+import ast
+import csv
+import os
+import time
+
+from core.photo_store import PhotoStore
+from core.photos import PhotoDownloader
+from core.scrape import Scrape
+
+PHOTO = b"x" * 1000
+
+
+class _Response:
+    def __init__(self, status_code: int, body: bytes, headers: dict = None) -> None:
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+    def iter_content(self, chunk_size: int):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start : start + chunk_size]
+
+    def close(self):
+        pass
+
+
+class _Transport:
+    """Answers every photo request with `status_code`, without Content-Length"""
+
+    cache = None
+
+    def __init__(self, status_code: int = 200, failing_urls=(), delay: float = 0) -> None:
+        self.status_code = status_code
+        self.failing_urls = set(failing_urls)
+        self.delay = delay
+        self.requests = 0
+        self.streamed = 0
+
+    def get(self, url: str, **kwargs):
+        self.requests += 1
+        time.sleep(self.delay)
+        self.streamed += bool(kwargs.get("stream"))
+        if url in self.failing_urls:
+            return _Response(404, b"")
+        if self.status_code == 206:
+            return _Response(206, PHOTO[500:], {"Content-Range": "bytes 500-999/1000"})
+        return _Response(self.status_code, PHOTO)
+
+    def log_stats(self, logger):
+        pass
+
+    def close(self):
+        pass
+
+
+def _photo_urls(n: int):
+    return [f"https://cf.bstatic.com/images/{i}/max1280x900/img.jpg" for i in range(n)]
+
+
+def test_download_photos(tmp_path):
+    transport = _Transport()
+    downloader = PhotoDownloader(str(tmp_path), transport, requests_per_second=1000)
+    saved = downloader.submit("review 1", _photo_urls(3))
+    downloader.close()
+
+    paths = saved.result()
+    assert downloader.downloaded == 3 and len(paths) == 3
+    assert all(os.path.getsize(path) == len(PHOTO) for path in paths)
+    # photos are always streamed, so they never go through the response cache
+    assert transport.streamed == 3
+    # the locks of the photos are dropped once they are downloaded
+    assert downloader._url_locks == {}
+
+
+def test_unexpected_partial_response_without_part_file(tmp_path, caplog):
+    downloader = PhotoDownloader(str(tmp_path), _Transport(206), requests_per_second=1000)
+    (path,) = downloader.photo_paths("review 1", _photo_urls(1))
+    saved = downloader.submit("review 1", _photo_urls(1))
+    downloader.close()
+
+    assert saved.result() == []
+
+    assert downloader.failed == 1
+    assert "Status 206" in caplog.text and "Error downloading photo" not in caplog.text
+    assert not os.path.exists(path) and not os.path.exists(f"{path}.part")
+
+
+def test_byte_budget_without_content_length(tmp_path):
+    downloader = PhotoDownloader(
+        str(tmp_path),
+        _Transport(),
+        requests_per_second=1000,
+        byte_budget=2500,
+        chunk_size=100,
+    )
+    paths = downloader.photo_paths("review 1", _photo_urls(4))
+    saved = downloader.submit("review 1", _photo_urls(4))
+    downloader.close()
+
+    assert len(saved.result()) == downloader.downloaded
+
+    assert downloader.bytes_downloaded <= 2500
+    assert downloader.downloaded <= 2
+    assert downloader.downloaded + downloader.skipped == 4
+    # the photos cut by the budget keep their partial file, to be resumed
+    assert any(os.path.exists(f"{path}.part") for path in paths)
+
+
+def test_failed_photos_are_not_listed(tmp_path):
+    urls = _photo_urls(3)
+    downloader = PhotoDownloader(
+        str(tmp_path), _Transport(failing_urls=[urls[1]]), requests_per_second=1000
+    )
+    paths = downloader.photo_paths("review 1", urls)
+    saved = downloader.submit("review 1", urls)
+    downloader.close()
+
+    assert downloader.failed == 1
+    assert saved.result() == [paths[0], paths[2]]
+    assert not os.path.exists(paths[1])
+
+
+def test_csv_lists_the_saved_photos_only(workdir, monkeypatch):
+    failing_url = "https://cf.bstatic.com/xdata/images/0_1/max1280x900/img.jpg"
+
+    def open_photo_downloader(scraper):
+        return PhotoDownloader(
+            str(workdir / "output" / "photos"),
+            _Transport(failing_urls=[failing_url]),
+            requests_per_second=1000,
+        )
+
+    monkeypatch.setattr(Scrape, "_open_photo_downloader", open_photo_downloader)
+    Scrape(
+        {"hotel_name": "good-hotel", "country": "us", "download_photos": True},
+        keep_results=False,
+    ).run()
+
+    path = workdir / "output" / "good-hotel_test_job" / "reviews_most_relevant.csv"
+    with open(path, newline="", encoding="utf-8") as file:
+        rows = {row["username"]: row for row in csv.DictReader(file)}
+    local_paths = ast.literal_eval(rows["User 0"]["local_photo_paths"])
+    assert len(local_paths) == 1 and all(os.path.exists(p) for p in local_paths)
+    assert len(ast.literal_eval(rows["User 7"]["local_photo_paths"])) == 2
+
+
+def test_photos_are_not_cached(workdir):
+    with open(workdir / "config.yml", "a") as file:
+        file.write(f"CACHE_DIR: {workdir / 'cache'}\n")
+    scraper = Scrape({"hotel_name": "good-hotel", "country": "us"})
+    downloader = scraper._open_photo_downloader()
+    downloader.close()
+
+    assert scraper._transport.cache is not None
+    assert downloader._transport.cache is None
+
+
+def test_downloaders_sharing_a_store_fetch_a_photo_once(tmp_path):
+    transport = _Transport(delay=0.2)
+    store_dir = str(tmp_path / "store")
+    downloaders = [
+        PhotoDownloader(
+            str(tmp_path / f"job {i}"),
+            transport,
+            store=PhotoStore(store_dir),
+            requests_per_second=1000,
+        )
+        for i in range(2)
+    ]
+    saved = [downloader.submit("review 1", _photo_urls(1)) for downloader in downloaders]
+    for downloader in downloaders:
+        downloader.close()
+
+    assert transport.requests == 1
+    assert sum(downloader.reused for downloader in downloaders) == 1
+    assert all(os.path.getsize(future.result()[0]) == len(PHOTO) for future in saved)
@@ -0,0 +1,65 @@
+import threading
+import time
+
+import pytest
+import yaml
+
+from core.scrape import Scrape
+
+from .conftest import MANY_PAGES_HOTEL
+
+
+def _set_prefetch_window(workdir, window: int):
+    with open(workdir / "config.yml", "r") as file:
+        config = yaml.safe_load(file)
+    config["PREFETCH_WINDOW"] = window
+    with open(workdir / "config.yml", "w") as file:
+        yaml.safe_dump(config, file)
+
+
+def _scrape(workdir, window: int, **input) -> list:
+    _set_prefetch_window(workdir, window)
+    scraper = Scrape(
+        {"hotel_name": MANY_PAGES_HOTEL, "country": "us", "download_photos": False, **input},
+        save_data_to_disk=False,
+    )
+    return [review["username"] for review in scraper.run()], scraper
+
+
+@pytest.mark.parametrize(
+    "input",
+    [{"n_rows": 25}, {"stop_critera": {"username": "User 20-3", "review_text_title": "Great stay 3"}}],
+    ids=["n_rows", "stop_review"],
+)
+def test_prefetch_gives_the_sequential_reviews(workdir, input):
+    sequential, _ = _scrape(workdir, 0, **input)
+    prefetched, scraper = _scrape(workdir, 3, **input)
+
+    assert prefetched == sequential
+    if "n_rows" in input:
+        assert len(prefetched) == 25
+    else:
+        # the reviews up to the stop review, without it
+        assert len(prefetched) == 23 and prefetched[-1] == "User 20-2"
+    assert scraper._prefetch_stats["used"] == 3
+
+
+def test_stopping_leaves_no_request_running(workdir, monkeypatch):
+    scrape = Scrape._scrape
+
+    def slow_scrape(self, url_dict: dict):
+        time.sleep(0.3)
+        return scrape(self, url_dict)
+
+    monkeypatch.setattr(Scrape, "_scrape", slow_scrape)
+    _, scraper = _scrape(workdir, 4, n_rows=5)
+
+    # the first page is enough, the next ones were in flight
+    assert scraper._prefetch_stats["used"] == 1
+    assert scraper._prefetch_stats["requested"] > 0
+    lingering = [
+        thread
+        for thread in threading.enumerate()
+        if thread.is_alive() and thread.name.startswith("ThreadPoolExecutor")
+    ]
+    assert lingering == []
@@ -0,0 +1,42 @@
+import threading
+import time
+
+from core.fetch_engine import fetch_async
+from core.rate_limiter import TokenBucket
+
+
+def test_token_bucket_keeps_the_rate():
+    bucket = TokenBucket(50)
+
+    _start = time.monotonic()
+    for _ in range(26):
+        bucket.acquire()
+    elapsed = time.monotonic() - _start
+
+    # the first token is available right away, the next 25 are 20 ms apart
+    assert 0.45 <= elapsed < 0.7
+
+
+def test_fetch_async_keeps_the_rate_and_the_concurrency():
+    bucket = TokenBucket(50, capacity=5)
+    starts = []
+    in_flight = [0, 0]  # current, max
+    lock = threading.Lock()
+
+    def fetch(url_dict: dict) -> int:
+        with lock:
+            starts.append(time.monotonic())
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+        time.sleep(0.05)
+        with lock:
+            in_flight[0] -= 1
+        return url_dict["idx"]
+
+    ls_urls = [{"idx": i, "url": f"https://example.com/{i}"} for i in range(30)]
+    results = fetch_async(fetch, ls_urls, bucket, max_concurrency=4)
+
+    assert results == list(range(30))
+    assert in_flight[1] <= 4
+    # a burst of 5 tokens, then 25 requests 20 ms apart
+    assert 0.45 <= max(starts) - min(starts) < 0.8
@@ -0,0 +1,152 @@
+import pytest
+
+from core import retry
+from core.rate_limiter import TokenBucket
+from core.retry import (
+    BLOCKED,
+    OK,
+    AimdController,
+    RetryPolicy,
+    classify_response,
+    fetch_with_retry,
+)
+
+REVIEWS_PAGE = b'<html><ul class="review_list"><li>Great captcha-free stay</li></ul></html>'
+BLOCK_PAGE = b"<html><script src='/challenge-platform/x.js'></script>Are you a robot?</html>"
+
+
+class _Clock:
+    """Fake time of core.retry, sleep() moves the clock forward"""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class _Response:
+    def __init__(self, status_code: int, content: bytes = REVIEWS_PAGE, headers: dict = None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def close(self):
+        pass
+
+
+class _Cache:
+    def __init__(self) -> None:
+        self.discarded = []
+
+    def discard(self, url: str):
+        self.discarded.append(url)
+
+
+class _Transport:
+    """Answers with the given responses, one per request"""
+
+    def __init__(self, *responses: _Response) -> None:
+        self.responses = list(responses)
+        self.requests = 0
+        self.cache = _Cache()
+
+    def get(self, url: str, **kwargs):
+        self.requests += 1
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(retry, "time", clock)
+    return clock
+
+
+def test_block_pages_are_detected():
+    assert classify_response(_Response(200, BLOCK_PAGE)) == BLOCKED
+    assert classify_response(_Response(403)) == BLOCKED
+    # a reviews page which happens to contain a marker is not a block page
+    assert classify_response(_Response(200, REVIEWS_PAGE)) == OK
+
+
+def test_block_page_is_retried_and_not_cached(clock):
+    transport = _Transport(_Response(200, BLOCK_PAGE), _Response(200))
+    bucket = TokenBucket(10)
+    controller = AimdController(bucket, min_rate=1, max_rate=10)
+
+    response, error = fetch_with_retry(transport, "url", RetryPolicy(3), controller=controller)
+
+    assert response.content == REVIEWS_PAGE and error is None
+    assert transport.requests == 2
+    assert transport.cache.discarded == ["url"]
+    assert controller.decreases == 1 and bucket.rate == 5
+
+
+def test_retry_after_is_honored(clock):
+    transport = _Transport(_Response(429, headers={"Retry-After": "7"}), _Response(200))
+
+    response, error = fetch_with_retry(
+        transport, "url", RetryPolicy(3, base_delay=1, max_delay=60)
+    )
+
+    assert error is None and transport.requests == 2
+    # the jittered backoff is at most 1 second, the server asked for 7
+    assert clock.sleeps == [7]
+
+
+def test_retry_after_longer_than_max_delay_gives_up(clock):
+    transport = _Transport(_Response(503, headers={"Retry-After": "120"}), _Response(200))
+
+    response, error = fetch_with_retry(
+        transport, "url", RetryPolicy(3, base_delay=1, max_delay=60)
+    )
+
+    assert response is None
+    assert error == "throttled (status 503), Retry-After of 120 seconds"
+    assert transport.requests == 1 and clock.sleeps == []
+
+
+def test_fatal_status_is_not_retried(clock):
+    transport = _Transport(_Response(404), _Response(200))
+
+    response, error = fetch_with_retry(transport, "url", RetryPolicy(3))
+
+    assert response is None and error == "fatal (status 404)"
+    assert transport.requests == 1
+
+
+def test_aimd_decrease_and_increase(clock):
+    bucket = TokenBucket(10)
+    controller = AimdController(bucket, min_rate=2, max_rate=10, window=10)
+
+    controller.on_throttle()
+    assert bucket.rate == 5
+    # a burst of throttled responses lowers the rate once per window
+    controller.on_throttle()
+    assert bucket.rate == 5
+
+    clock.sleep(10)
+    controller.on_throttle()
+    clock.sleep(10)
+    controller.on_throttle()
+    # never below min_rate
+    assert bucket.rate == 2 and controller.lowest_rate == 2
+
+    # healthy responses raise the rate by one step per window
+    controller.on_success()
+    assert bucket.rate == 2
+    for _ in range(20):
+        clock.sleep(10)
+        controller.on_success()
+    # never above max_rate
+    assert bucket.rate == 10
+    assert controller.decreases == 3 and controller.increases == 8
@@ -0,0 +1,137 @@
+import csv
+
+import pytest
+
+from core.parse import parse_reviews_page, rows_to_reviews
+from core.sinks import OrderedCsvSink, ParquetSink
+
+from .conftest import FIXTURE_PAGE, many_pages_body
+
+
+class _FailingCsvSink(OrderedCsvSink):
+    """Fails its first write, e.g. a full disk"""
+
+    failed = False
+
+    def _write(self, rows):
+        if not self.failed:
+            self.failed = True
+            raise OSError("No space left on device")
+        super()._write(rows)
+
+
+def _review(review_id: str) -> dict:
+    return {"review_id": review_id, "username": f"user {review_id}"}
+
+
+def test_rows_of_a_failed_write_are_not_marked_saved(tmp_path):
+    path = tmp_path / "reviews.csv"
+    sink = _FailingCsvSink(str(path), [0, 25], batch_rows=1)
+
+    sink.add(0, [_review("a"), _review("b")])
+    # the reviews of the failed page are added again, e.g. by a resumed run
+    sink.add(25, [_review("a"), _review("b"), _review("c")])
+    sink.close()
+
+    with open(path, newline="", encoding="utf-8") as file:
+        saved = [row["review_id"] for row in csv.DictReader(file)]
+    assert saved == ["a", "b", "c"]
+    assert sink.rows_written == 3
+
+
+def test_duplicates_are_skipped(tmp_path):
+    path = tmp_path / "reviews.csv"
+    sink = OrderedCsvSink(str(path), [0, 25], batch_rows=10)
+
+    sink.add(25, [_review("b"), _review("c")])
+    sink.add(0, [_review("a"), _review("b")])
+    sink.close()
+
+    with open(path, newline="", encoding="utf-8") as file:
+        saved = [row["review_id"] for row in csv.DictReader(file)]
+    assert saved == ["a", "b", "c"]
+    assert sink.duplicates == 1
+
+
+def test_rows_are_synced_before_their_pages_are_saved(tmp_path, monkeypatch):
+    events = []
+    monkeypatch.setattr("core.sinks.os.fsync", lambda fd: events.append("fsync"))
+    sink = OrderedCsvSink(str(tmp_path / "reviews.csv"), [0, 25], batch_rows=1)
+    sink.on_saved = lambda pages: events.append(("saved", pages))
+
+    sink.add(0, [_review("a")])
+    sink.add(25, [_review("b")])
+    sink.close()
+
+    assert events == ["fsync", ("saved", [0]), "fsync", ("saved", [25])]
+
+
+def _fixture_reviews() -> list:
+    with open(FIXTURE_PAGE, "rb") as file:
+        return rows_to_reviews(parse_reviews_page(file.read(), 0, "hotel", "html.parser").rows)
+
+
+@pytest.mark.parametrize("legacy_ids", [False, True], ids=["fingerprints", "legacy_ids"])
+def test_parquet_index_of_the_saved_reviews(tmp_path, monkeypatch, legacy_ids):
+    pq = pytest.importorskip("pyarrow.parquet")
+    reviews = _fixture_reviews()
+    sink = ParquetSink(str(tmp_path / "parquet"), "hotel", "job 1", [0])
+    sink.add(0, reviews)
+    sink.close()
+    if legacy_ids:
+        # written before review ids were fingerprints
+        (path,) = (tmp_path / "parquet").glob("*/*/*.parquet")
+        table = pq.read_table(path)
+        legacy = [f"review_0_{position}" for position in range(table.num_rows)]
+        column = table.schema.get_field_index("review_id")
+        pq.write_table(table.set_column(column, "review_id", [legacy]), path)
+
+    read_columns = []
+    read_table = pq.read_table
+
+    def spy(path, columns=None, **kwargs):
+        read_columns.append(columns)
+        return read_table(path, columns=columns, **kwargs)
+
+    monkeypatch.setattr(pq, "read_table", spy)
+    sink = ParquetSink(str(tmp_path / "parquet"), "hotel", "job 2", [0])
+    sink.add(0, reviews)
+    sink.close()
+
+    assert sink.duplicates == len(reviews) and sink.rows_written == 0
+    # the text columns are only read from the files with legacy ids
+    assert read_columns[0] == ["review_id"]
+    assert len(read_columns) == (2 if legacy_ids else 1)
+
+
+def _baseline_csv(path, ls_reviews):
+    """The csv file written at the end of a run before the sinks, by
+    Scrape._save_local_files
+    """
+    with open(path, "a", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(ls_reviews[0].keys())
+        for row in ls_reviews:
+            writer.writerow(row.values())
+
+
+@pytest.mark.parametrize("batch_rows", [1, 7, 500])
+def test_out_of_order_pages_give_the_baseline_file(tmp_path, batch_rows):
+    with open(FIXTURE_PAGE, "rb") as file:
+        body = file.read()
+    pages = {
+        idx: rows_to_reviews(
+            parse_reviews_page(many_pages_body(body, idx), idx, "hotel", "html.parser").rows
+        )
+        for idx in (0, 10, 20, 30)
+    }
+    _baseline_csv(
+        tmp_path / "baseline.csv", [review for idx in sorted(pages) for review in pages[idx]]
+    )
+
+    sink = OrderedCsvSink(str(tmp_path / "reviews.csv"), sorted(pages), batch_rows)
+    for idx in (20, 0, 30, 10):
+        sink.add(idx, pages[idx])
+    sink.close()
+
+    assert (tmp_path / "reviews.csv").read_bytes() == (tmp_path / "baseline.csv").read_bytes()
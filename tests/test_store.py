@@ -0,0 +1,102 @@
+import sqlite3
+
+import pytest
+
+from core.parse import REVIEW_FIELDS
+from core.store import ReviewStore
+
+
+def _review(hotel_name: str, username: str, date: str, rating: float) -> dict:
+    review = dict.fromkeys(REVIEW_FIELDS)
+    review.update(
+        hotel_name=hotel_name,
+        username=username,
+        review_post_date=date,
+        rating=rating,
+        review_photos=[],
+        local_photo_paths=[],
+    )
+    return review
+
+
+REVIEWS = [
+    _review("hotel", "Anna", "01-10-2024 09:00:00", 9.0),
+    _review("hotel", "Ben", "01-20-2024 23:30:00", 5.0),
+    _review("hotel", "Carl", "02-01-2024 00:00:00", 7.0),
+    _review("other-hotel", "Anna", "01-15-2024 12:00:00", 8.0),
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ReviewStore(str(tmp_path / "reviews.sqlite"))
+    store.upsert(REVIEWS, job_id="job 1")
+    yield store
+    store.close()
+
+
+def _stored(store) -> list:
+    return store._conn.execute(
+        "SELECT username, rating, first_job, last_job FROM reviews ORDER BY review_key"
+    ).fetchall()
+
+
+def test_upsert_is_idempotent(store):
+    rows = _stored(store)
+    assert len(rows) == 4
+
+    store.upsert(REVIEWS, job_id="job 2")
+    # the same reviews are updated in place, the first job which stored them is kept
+    assert [row[:3] for row in _stored(store)] == [row[:3] for row in rows]
+    assert {row[3] for row in _stored(store)} == {"job 2"}
+
+
+@pytest.mark.parametrize(
+    "filters, usernames",
+    [
+        ({"hotel_name": "hotel"}, ["Carl", "Ben", "Anna"]),
+        # the end date includes the whole day
+        (
+            {"hotel_name": "hotel", "start_date": "2024-01-10", "end_date": "2024-01-20"},
+            ["Ben", "Anna"],
+        ),
+        ({"hotel_name": "hotel", "min_rating": 6, "max_rating": 8}, ["Carl"]),
+        ({"username": "Anna"}, ["Anna", "Anna"]),
+        ({"hotel_name": "unknown"}, []),
+    ],
+    ids=["hotel", "dates", "rating", "username", "unknown_hotel"],
+)
+def test_query_filters(store, filters, usernames):
+    reviews = store.query(**filters)
+    assert [review["username"] for review in reviews] == usernames
+    assert all(review["review_photos"] == [] for review in reviews)
+
+
+@pytest.mark.parametrize(
+    "where, index",
+    [
+        ("hotel_name = 'hotel' AND review_post_date >= '2024-01-01'", "idx_reviews_hotel_date"),
+        ("hotel_name = 'hotel' AND rating >= 7", "idx_reviews_hotel_"),
+        ("username = 'Anna'", "idx_reviews_username"),
+    ],
+)
+def test_queries_use_the_indexes(store, where, index):
+    plan = store._conn.execute(
+        f"EXPLAIN QUERY PLAN SELECT * FROM reviews WHERE {where}"
+    ).fetchall()
+    assert index in " ".join(row[-1] for row in plan)
+
+
+def test_read_only_store(store, tmp_path):
+    missing = tmp_path / "missing" / "reviews.sqlite"
+    with pytest.raises(FileNotFoundError, match="No review store"):
+        ReviewStore(str(missing), read_only=True)
+    assert not missing.parent.exists()
+
+    read_only = ReviewStore(store.path, read_only=True)
+    try:
+        assert read_only.hotels() == ["hotel", "other-hotel"]
+        with pytest.raises(sqlite3.OperationalError, match="readonly"):
+            read_only.upsert(REVIEWS[:1], job_id="job 2")
+    finally:
+        read_only.close()
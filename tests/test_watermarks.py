@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from core.fingerprint import review_fingerprint
+from core.scrape import Scrape
+from core.watermarks import WatermarkStore
+
+INPUT = {
+    "hotel_name": "good-hotel",
+    "country": "us",
+    "download_photos": False,
+    "incremental": True,
+}
+
+
+def _review(username: str, date: str) -> dict:
+    return {"hotel_name": "hotel", "username": username, "review_post_date": date}
+
+
+def _watermarks(workdir) -> dict:
+    with open(workdir / "state" / "watermarks.json", "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def test_update_keeps_the_newest_reviews(tmp_path):
+    store = WatermarkStore(str(tmp_path / "watermarks.json"), max_fingerprints=3)
+    key = WatermarkStore.key("us", "hotel", "newest_first")
+    assert store.get(key) is None
+
+    older = [_review("b", "01-02-2024 00:00:00"), _review("a", "01-01-2024 00:00:00")]
+    newer = [_review("d", "01-04-2024 00:00:00"), _review("c", "01-03-2024 00:00:00")]
+    store.update(key, older)
+    store.update(key, newer)
+    # a run without reviews keeps the watermark
+    store.update(key, [])
+
+    watermark = store.get(key)
+    assert watermark["newest_date"] == "01-04-2024 00:00:00"
+    # the reviews of the latest run come first, the oldest ones are dropped
+    assert watermark["fingerprints"] == [
+        review_fingerprint(review) for review in newer + older[:1]
+    ]
+
+
+def test_incremental_run_stops_at_the_reviews_already_seen(workdir):
+    first = Scrape(INPUT, save_data_to_disk=False).run()
+    assert len(first) == 10
+    key = WatermarkStore.key("us", "good-hotel", "newest_first")
+    watermark = _watermarks(workdir)[key]
+    assert watermark["fingerprints"][0] == first[0]["review_id"]
+
+    # nothing new was posted, the second run stops at the first review
+    assert Scrape(INPUT, save_data_to_disk=False).run() == []
+    assert _watermarks(workdir)[key]["fingerprints"] == watermark["fingerprints"]
+
+
+def test_failed_run_does_not_update_the_watermark(workdir, monkeypatch):
+    def failed_scrape(self, ls_urls):
+        raise RuntimeError("connection lost")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(Scrape, "_get_all_reviews", failed_scrape)
+        with pytest.raises(RuntimeError):
+            Scrape(INPUT, save_data_to_disk=False).run()
+    assert not (workdir / "state" / "watermarks.json").exists()
+
+    Scrape(INPUT, save_data_to_disk=False).run()
+    watermark = _watermarks(workdir)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(Scrape, "_get_cond_reviews", failed_scrape)
+        with pytest.raises(RuntimeError):
+            Scrape(INPUT, save_data_to_disk=False).run()
+    assert _watermarks(workdir) == watermark
@@ -0,0 +1,152 @@
+import os
+import time
+
+import pytest
+from typer.testing import CliRunner
+
+import run
+from core.parse import ParsedPage
+from core.work_queue import HttpWorkQueue, SqliteWorkQueue, WorkQueueServer
+
+LEASE_SECONDS = 0.3
+URLS = [{"idx": 0, "url": "https://example.com/0"}, {"idx": 10, "url": "https://example.com/10"}]
+
+
+def _page(idx: int, username: str) -> ParsedPage:
+    return ParsedPage(idx, [(username,)], 0.01, (1, 0))
+
+
+@pytest.fixture(params=["sqlite", "http"])
+def work_queue(request, tmp_path):
+    """The queue of the coordinator, and a function opening the queue of a worker"""
+    sqlite_queue = SqliteWorkQueue(
+        str(tmp_path / "queue.sqlite"), lease_seconds=LEASE_SECONDS, max_attempts=2
+    )
+    if request.param == "sqlite":
+        yield sqlite_queue, lambda: sqlite_queue
+        sqlite_queue.close()
+        return
+
+    server = WorkQueueServer(sqlite_queue, port=0, token="secret")
+    server.start()
+    url = f"http://127.0.0.1:{server.port}"
+    clients = []
+
+    def open_client():
+        clients.append(HttpWorkQueue(url, token="secret"))
+        return clients[-1]
+
+    yield open_client(), open_client
+    for client in clients:
+        client.close()
+    server.close()
+    sqlite_queue.close()
+
+
+def test_expired_lease_is_delivered_again(work_queue):
+    queue, open_worker_queue = work_queue
+    queue.publish("job", {"hotel_name": "hotel"}, URLS[:1])
+
+    (task,) = open_worker_queue().claim("worker 1")
+    assert task["attempts"] == 1 and task["metadata"] == {"hotel_name": "hotel"}
+    # leased pages are not delivered to the other workers
+    assert open_worker_queue().claim("worker 2") == []
+
+    # worker 1 dies, its page goes to worker 2 once the lease expires
+    time.sleep(LEASE_SECONDS + 0.1)
+    (task,) = open_worker_queue().claim("worker 2")
+    assert task["idx"] == 0 and task["attempts"] == 2
+
+
+def test_pages_fail_after_max_attempts(work_queue):
+    queue, open_worker_queue = work_queue
+    queue.publish("job", {}, URLS)
+    worker_queue = open_worker_queue()
+
+    # page 0 is given back by its worker, page 10 is leased by workers which die
+    for attempt in range(2):
+        tasks = worker_queue.claim("worker", max_tasks=2)
+        assert [task["idx"] for task in tasks] == [0, 10]
+        worker_queue.fail("job", 0, "worker", f"error {attempt}")
+        time.sleep(LEASE_SECONDS + 0.1)
+
+    assert worker_queue.claim("worker") == []
+    assert queue.progress("job")["failed"] == 2
+    assert [(task["status"], task["error"]) for task in queue.tasks("job")] == [
+        ("failed", "error 1"),
+        ("failed", "lease expired"),
+    ]
+
+
+def test_first_complete_wins(work_queue):
+    queue, open_worker_queue = work_queue
+    queue.publish("job", {}, URLS[:1])
+    slow_worker, fast_worker = open_worker_queue(), open_worker_queue()
+
+    slow_worker.claim("slow worker")
+    time.sleep(LEASE_SECONDS + 0.1)
+    fast_worker.claim("fast worker")
+
+    assert fast_worker.complete("job", 0, _page(0, "fast"))
+    # the slow worker finishes after the page was delivered again
+    assert not slow_worker.complete("job", 0, _page(0, "slow"))
+    # and its late failure does not reopen the page
+    slow_worker.fail("job", 0, "slow worker", "timeout")
+
+    assert queue.progress("job")["done"] == 1
+    assert [page.rows for page in queue.iter_results("job")] == [[("fast",)]]
+
+
+def test_publish_keeps_the_pages_already_queued(work_queue):
+    queue, _ = work_queue
+    assert queue.publish("job", {}, URLS[:1]) == 1
+    assert queue.publish("job", {}, URLS) == 1
+    assert queue.job("unknown") is None
+    assert [task["idx"] for task in queue.tasks("job")] == [0, 10]
+
+
+def test_server_rejects_clients_without_the_token(tmp_path):
+    sqlite_queue = SqliteWorkQueue(str(tmp_path / "queue.sqlite"))
+    server = WorkQueueServer(sqlite_queue, port=0, token="secret")
+    server.start()
+    client = HttpWorkQueue(f"http://127.0.0.1:{server.port}", token="wrong")
+    try:
+        with pytest.raises(Exception, match="401"):
+            client.claim("worker")
+    finally:
+        client.close()
+        server.close()
+        sqlite_queue.close()
+
+
+def test_coordinator_publishes_every_hotel_of_a_file(workdir):
+    urls_file = workdir / "hotels.txt"
+    urls_file.write_text(
+        "https://www.booking.com/hotel/us/good-hotel.html\n"
+        "https://www.booking.com/hotel/gb/other-hotel.html\n"
+    )
+    queue_path = str(workdir / "queue.sqlite")
+
+    result = CliRunner().invoke(
+        run.app,
+        [
+            "coordinator",
+            "--urls-file",
+            str(urls_file),
+            "--queue",
+            queue_path,
+            "--work",
+            "--no-download-photos",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    queue = SqliteWorkQueue(queue_path)
+    for hotel_name in ("good-hotel", "other-hotel"):
+        job_id = f"test_job_{hotel_name}"
+        assert queue.job(job_id)["hotel_name"] == hotel_name
+        assert queue.progress(job_id)["done"] == 1
+        assert os.path.exists(
+            workdir / "output" / f"{hotel_name}_{job_id}" / "reviews_most_relevant.csv"
+        )
+    queue.close()